@@ -70,6 +70,106 @@ class Settings(BaseSettings):
     PINECONE_INDEX: str
     PINECONE_HOST: str
     
+    # RAG Retrieval
+    # How query_multi_class fans out per-class textbook queries:
+    # "parallel" (concurrent per-class queries), "single" (one $in query) or "serial"
+    RAG_CLASS_QUERY_STRATEGY: str = "parallel"
+    RAG_CLASS_QUERY_WORKERS: int = 8
+    # Threads for concurrent textbook / LLM-cache / web lookups per question
+    RAG_RETRIEVAL_WORKERS: int = 12
+    # Async execution layer for chat/annotation endpoints (see rag_executor.py)
+    RAG_EXECUTOR_WORKERS: int = 16
+    RAG_MAX_CONCURRENCY: int = 16
+    # Prompt context assembly (see context_budgeter.py): token budget per answer mode,
+    # MinHash similarity above which chunks count as duplicates, and the score
+    # bonus per class below the student's class for foundational textbook chunks
+    RAG_CONTEXT_TOKENS_BASIC: int = 2500
+    RAG_CONTEXT_TOKENS_DEEPDIVE: int = 5000
+    RAG_CONTEXT_DEDUP_THRESHOLD: float = 0.8
+    RAG_CONTEXT_FOUNDATION_BONUS: float = 0.02
+    # Rerank stage after multi-class textbook retrieval (see reranker.py):
+    # "none", "mmr", "cross_encoder" or "cross_encoder_mmr"; chunks kept per mode
+    RAG_RERANK_STRATEGY: str = "mmr"
+    RAG_RERANK_TOP_K_BASIC: int = 8
+    RAG_RERANK_TOP_K_DEEPDIVE: int = 10
+    RAG_RERANK_MMR_LAMBDA: float = 0.7
+    RAG_RERANK_CROSS_ENCODER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    
+    # Exact-match answer cache (normalized question + subject + class + chapter + mode)
+    ANSWER_CACHE_MAX_ENTRIES: int = 2000
+    ANSWER_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    ANSWER_CACHE_USE_MONGO: bool = True
+    
+    # Stored LLM answer usage counters are buffered and flushed to Mongo this often
+    LLM_USAGE_FLUSH_SECONDS: float = 30.0
+    
+    # Embedding model per Pinecone index (names from embedding_registry.EMBEDDING_MODELS).
+    # Readers and writers of an index must use the same model. The web and llm indexes
+    # hold all-mpnet-base-v2 vectors; switch them only after scripts/reembed_vectors.py.
+    EMBEDDING_MODEL_TEXTBOOK: str = "gemini-text-embedding-004"
+    EMBEDDING_MODEL_WEB: str = "all-mpnet-base-v2"
+    EMBEDDING_MODEL_LLM: str = "all-mpnet-base-v2"
+    EMBEDDING_CHECK_ON_STARTUP: bool = True
+    # Local (sentence-transformers) embedder: concurrent query embeddings arriving
+    # within this window are encoded together in one batch (0 disables batching)
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+    EMBEDDING_MAX_BATCH_SIZE: int = 64
+    # Load local models bound to an index in a background thread at startup
+    # (otherwise they load lazily on first use; see model_registry.py)
+    MODEL_WARMUP_ON_STARTUP: bool = True
+    
+    # Query embedding cache: in-memory LRU + SQLite disk tier ("" disables disk)
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 5000
+    EMBEDDING_CACHE_DISK_PATH: str = "cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_DISK_MAX_ENTRIES: int = 200_000
+    
+    # Gemini quota ledger: local key usage is flushed to / reconciled with Mongo this often
+    GEMINI_QUOTA_SYNC_SECONDS: float = 5.0
+    
+    # Gemini scheduler: per-key per-minute limits and bounded wait queue (see gemini_scheduler.py)
+    GEMINI_RPM_PER_KEY: int = 10
+    GEMINI_TPM_PER_KEY: int = 250_000
+    GEMINI_EMBED_RPM_PER_KEY: int = 1500
+    GEMINI_EMBED_TPM_PER_KEY: int = 1_000_000
+    GEMINI_SCHEDULER_MAX_QUEUE: int = 64
+    GEMINI_SCHEDULER_WAIT_SECONDS: float = 30.0
+    GEMINI_SCHEDULER_MAX_ATTEMPTS: int = 4
+    
+    # Test answer evaluation (rag_evaluation_service): "batched" grades all answers in
+    # one Gemini call, "concurrent" makes one call per answer (also the batch fallback)
+    TEST_EVALUATION_MODE: str = "batched"
+    TEST_EVALUATION_CONCURRENCY: int = 4
+    # Score clear-cut answers locally (non-answers, near-verbatim, off-topic) before
+    # Gemini; the local embedding model adds a semantic similarity signal ("" disables it)
+    TEST_PREGRADER_ENABLED: bool = True
+    TEST_PREGRADER_EMBEDDING_MODEL: str = "all-mpnet-base-v2"
+
+    # Book Embedding Jobs (uploads are queued and processed by local worker processes)
+    BOOK_JOB_WORKERS: int = 2
+    BOOK_JOB_MAX_ATTEMPTS: int = 3
+    BOOK_JOB_POLL_SECONDS: float = 2.0
+    # Running jobs without a heartbeat for this long are reclaimed (server died mid-book)
+    BOOK_JOB_STALE_SECONDS: int = 900
+    # Pages rasterized per pdf2image call; peak worker memory scales with this, not book length
+    PDF_PAGE_WINDOW: int = 4
+    # Worker processes per book for page extraction/OCR (0 = CPU cores / BOOK_JOB_WORKERS)
+    PDF_PAGE_WORKERS: int = 0
+    # Skip full-page Tesseract OCR on pages whose PDF text layer is clean (OCR figures only)
+    PDF_SMART_OCR: bool = True
+    # Content-addressed ingestion cache (page extractions, chunk embeddings, upserted
+    # vector IDs) so re-runs only redo what changed ("" disables; see ingestion_cache.py)
+    INGESTION_CACHE_PATH: str = "cache/ingestion.sqlite3"
+    # Chunk embedding during upload: texts per embedding request and requests in flight
+    # (throttled by the embedding scheduler's per-key limits, not fixed sleeps)
+    INGEST_EMBED_BATCH_SIZE: int = 100
+    INGEST_EMBED_WORKERS: int = 4
+    # Pinecone upserts (see upsert_engine.py): requests in flight, per-request vector and
+    # estimated payload limits (Pinecone rejects requests over 2 MB) and attempts per batch
+    PINECONE_UPSERT_CONCURRENCY: int = 4
+    PINECONE_UPSERT_MAX_VECTORS: int = 100
+    PINECONE_UPSERT_MAX_BYTES: int = 1_800_000
+    PINECONE_UPSERT_MAX_ATTEMPTS: int = 5
+
     # CORS Settings
     FRONTEND_URL: str = "http://localhost:5173"
     
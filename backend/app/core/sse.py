@@ -0,0 +1,40 @@
+"""
+Server-Sent Events helpers for streaming endpoints.
+"""
+
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Tuple
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Encode one SSE message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events: AsyncIterator[Tuple[str, Dict]]) -> StreamingResponse:
+    """
+    Wrap an async iterator of (event, data) pairs in a text/event-stream response.
+
+    Errors after the stream has started cannot change the HTTP status, so they
+    are sent as a final `error` event.
+    """
+    async def body():
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"❌ Stream error: {e}")
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Don't let nginx buffer the stream
+        }
+    )
@@ -376,7 +376,8 @@ class PineconeLLMDB:
         topic: str,
         class_level: int,
         embedding: list[float],
-        quality_score: float = 0.9
+        quality_score: float = 0.9,
+        embedding_model: str = None
     ):
         """
         Store LLM-generated answer with metadata.
@@ -390,6 +391,7 @@ class PineconeLLMDB:
             class_level: Student's class (6, 7, 8, etc.)
             embedding: Question embedding vector (768 dimensions)
             quality_score: Answer quality score (0-1)
+            embedding_model: Registry name of the model that produced `embedding`
         """
         try:
             if not self.index:
@@ -405,9 +407,11 @@ class PineconeLLMDB:
                 "topic": topic.lower(),
                 "class": str(class_level),
                 "quality_score": quality_score,
-                "created_date": datetime.now().isoformat(),
-                "usage_count": 0
+                "created_date": datetime.now().isoformat()
+                # Usage counts live in MongoDB (llm_usage_tracker)
             }
+            if embedding_model:
+                metadata["embedding_model"] = embedding_model
             
             # Upsert to Pinecone (namespace = subject)
             self.index.upsert(
@@ -452,32 +456,6 @@ class PineconeLLMDB:
         except Exception as e:
             logger.error(f"Pinecone LLM query failed: {e}")
             return {"matches": []}
-    
-    def increment_usage(self, vector_id: str, subject: str):
-        """Increment usage counter for a stored answer."""
-        try:
-            if not self.index:
-                return
-            
-            # Fetch current metadata
-            fetch_result = self.index.fetch(ids=[vector_id], namespace=subject.lower())
-            if vector_id in fetch_result.get('vectors', {}):
-                vector_data = fetch_result['vectors'][vector_id]
-                metadata = vector_data.get('metadata', {})
-                
-                # Increment usage count
-                metadata['usage_count'] = metadata.get('usage_count', 0) + 1
-                
-                # Update vector
-                self.index.upsert(
-                    vectors=[(vector_id, vector_data['values'], metadata)],
-                    namespace=subject.lower()
-                )
-                
-                logger.debug(f"Incremented usage count for {vector_id}")
-                
-        except Exception as e:
-            logger.error(f"Failed to increment usage count: {e}")
 
 
 # Global Pinecone LLM Content instance
@@ -13,6 +13,11 @@ import logging
 
 from app.core.config import settings
 from app.db.mongo import init_databases, close_databases
+from app.services.llm_usage_tracker import llm_usage_tracker
+from app.services.gemini_key_manager import gemini_key_manager
+from app.services.embedding_registry import embedding_registry
+from app.services.model_registry import model_registry
+from app.services.book_job_queue import book_job_queue
 from app.routers import chat, mcq, evaluate, notes, assessment, annotation
 
 # Configure logging
@@ -37,6 +42,17 @@ async def lifespan(app: FastAPI):
     
     try:
         await init_databases()
+        if settings.EMBEDDING_CHECK_ON_STARTUP:
+            # Warn if any index holds vectors from a different embedding model
+            embedding_registry.check_consistency()
+        llm_usage_tracker.start()
+        book_job_queue.start()  # Resumes queued / interrupted embedding jobs
+        if settings.MODEL_WARMUP_ON_STARTUP:
+            # Load local embedding models off the startup path
+            model_registry.warm_up(
+                lambda embedder=embedder: embedder.model
+                for embedder in embedding_registry.local_embedders()
+            )
         logger.info("✅ All systems initialized successfully")
     except Exception as e:
         logger.error(f"❌ Startup failed: {e}")
@@ -46,6 +62,9 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🛑 Shutting down NCERT AI Learning Backend...")
+    book_job_queue.stop()  # Unfinished jobs are reclaimed on next start
+    llm_usage_tracker.stop()  # Flush buffered usage counts
+    gemini_key_manager.stop()  # Flush pending quota increments
     await close_databases()
     logger.info("✅ Shutdown complete")
 
@@ -6,6 +6,14 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import Dict, List
 from app.services.gemini_key_manager import gemini_key_manager
+from app.services.enhanced_rag_service import enhanced_rag_service
+from app.services.rag_executor import rag_executor
+from app.services.llm_usage_tracker import llm_usage_tracker
+from app.services.embedding_registry import embedding_registry
+from app.services.model_registry import model_registry
+from app.services.embedding_cache import embedding_cache
+from app.services.gemini_scheduler import gemini_scheduler, gemini_embedding_scheduler
+from app.services.rag_evaluation_service import rag_evaluation_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -49,6 +57,27 @@ async def get_quota_status():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/gemini-scheduler")
+async def get_gemini_scheduler_stats():
+    """
+    🚦 Gemini scheduler load.
+    
+    Shows, for generation and embedding calls:
+    - Wait-queue depth, rejections and timeouts
+    - Per-key in-flight calls, RPM / TPM utilisation over the last minute
+    - 429 cooldowns and remaining daily quota
+    """
+    try:
+        return {
+            "generation": gemini_scheduler.get_stats(),
+            "embedding": gemini_embedding_scheduler.get_stats()
+        }
+    
+    except Exception as e:
+        logger.error(f"❌ Failed to get Gemini scheduler stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/quota-reset")
 async def force_reset_quota():
     """
@@ -70,6 +99,126 @@ async def force_reset_quota():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/rag-stats")
+async def get_rag_stats():
+    """
+    📈 RAG pipeline counters.
+    
+    Shows:
+    - Embedding calls per answered question (expected: exactly 1)
+    - Query embedding cache hit rate (memory / disk tiers)
+    - Local embedder micro-batching (average batch size, pending queries)
+    - Per-branch retrieval latency (textbook / llm / web) and cache short-circuits
+    - Async executor concurrency and queue depth
+    - Streaming time-to-first-token (p50 / p95)
+    - Textbook rerank stage (strategy, candidates in / chunks kept, latency)
+    - Prompt context tokens saved by deduplication and per-mode budgets
+    - Buffered / flushed usage counters for stored LLM answers
+    """
+    try:
+        return {
+            "embeddings": enhanced_rag_service.get_embedding_stats(),
+            "embedding_cache": embedding_cache.get_stats(),
+            "local_embedders": embedding_registry.get_stats(),
+            "retrieval": enhanced_rag_service.retrieval.get_stats(),
+            "executor": rag_executor.get_stats(),
+            "streaming": enhanced_rag_service.get_stream_stats(),
+            "rerank": enhanced_rag_service.reranker.get_stats(),
+            "context": enhanced_rag_service.context_budgeter.get_stats(),
+            "llm_usage": llm_usage_tracker.get_stats()
+        }
+    
+    except Exception as e:
+        logger.error(f"❌ Failed to get RAG stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/answer-cache")
+async def get_answer_cache_stats():
+    """
+    ⚡ Exact-match answer cache statistics.
+    
+    Shows memory/Mongo hits, misses, LRU evictions, TTL expirations and hit rate.
+    """
+    try:
+        return enhanced_rag_service.answer_cache.get_stats()
+    
+    except Exception as e:
+        logger.error(f"❌ Failed to get answer cache stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/answer-cache")
+async def clear_answer_cache():
+    """
+    🧹 Clear the exact-match answer cache (memory and MongoDB tiers).
+    
+    Use after re-uploading textbook content so stale answers are not served.
+    """
+    try:
+        removed = enhanced_rag_service.answer_cache.clear()
+        return {
+            "success": True,
+            "message": f"Answer cache cleared ({removed} stored answers removed)"
+        }
+    
+    except Exception as e:
+        logger.error(f"❌ Failed to clear answer cache: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/embedding-models")
+async def check_embedding_models():
+    """
+    🧬 Embedding model registry and per-index consistency check.
+    
+    Shows which embedding model each Pinecone index is bound to, and samples
+    stored vectors to detect ones written by a different model.
+    """
+    try:
+        return {
+            "bindings": embedding_registry.describe(),
+            # Several Pinecone queries: keep them off the event loop
+            "consistency": await rag_executor.run(embedding_registry.check_consistency)
+        }
+    
+    except Exception as e:
+        logger.error(f"❌ Embedding model check failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/models")
+async def get_model_stats():
+    """
+    📦 Loaded ML models.
+    
+    Shows load time and resident memory added per model, plus current
+    process RSS - use it to size worker memory.
+    """
+    try:
+        return model_registry.get_stats()
+    
+    except Exception as e:
+        logger.error(f"❌ Failed to get model stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/test-evaluation")
+async def get_test_evaluation_stats():
+    """
+    📝 Test answer evaluation counters.
+    
+    Shows Gemini calls per completed test (batched vs per-answer fallback) and
+    how many answers the local pre-grader scored without an LLM call.
+    """
+    try:
+        return rag_evaluation_service.get_stats()
+    
+    except Exception as e:
+        logger.error(f"❌ Failed to get test evaluation stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/health")
 async def health_check():
     """
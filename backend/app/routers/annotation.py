@@ -4,9 +4,12 @@ Annotation Router - Text annotation with AI assistance (Define, Elaborate, Flow)
 
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Dict, List, Literal, Optional, Tuple
 from app.services.enhanced_rag_service import enhanced_rag_service
 from app.services.gemini_service import gemini_service
+from app.services.rag_executor import rag_executor
+from app.services.context_budgeter import context_budgeter
+from app.core.sse import sse_response
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,53 +36,28 @@ class AnnotationResponse(BaseModel):
     source_count: int = Field(..., description="Number of sources used")
 
 
-@router.post("/", response_model=AnnotationResponse)
-async def process_annotation(request: AnnotationRequest):
-    """
-    🎯 Process annotation request with AI assistance.
-    
-    **Actions:**
-    - `define`: Quick, accurate definition from textbook
-    - `elaborate`: Detailed explanation with examples  
-    - `stick_flow`: Text-based flow diagram showing concept breakdown
-    
-    **Cost-Efficient Design:**
-    - Uses RAG for context (reduces Gemini tokens)
-    - Targeted prompts for specific actions
-    - No image generation (text-based flows)
+def _annotation_query(request: AnnotationRequest) -> Tuple[str, str]:
+    """RAG mode and question wording for an annotation action."""
+    if request.action == "define":
+        # Quick mode: Current + 2 previous classes WITH lower LLM reuse threshold
+        return "annotation", f"Define: {request.selected_text}"
+    if request.action == "elaborate":
+        # Deep dive mode: Comprehensive explanation
+        return "deepdive", f"Explain in detail: {request.selected_text}"
+    # stick_flow: text-based flow diagram WITH lower LLM reuse threshold
+    return "annotation", f"Explain the flow/process of: {request.selected_text}"
+
+
+def _build_annotation_prompt(request: AnnotationRequest, source_chunks: List[Dict]) -> str:
+    """Action-specific prompt over the retrieved source chunks."""
+    # Overlapping neighbour chunks would otherwise fill the first few context slots
+    source_chunks = context_budgeter.deduplicate(source_chunks)
     
-    **Edge Case Handling:**
-    - Class 11-12: Limited content available (graceful fallback)
-    - Missing content: Searches earlier classes for foundation
-    - No matches: Uses Gemini general knowledge with disclaimer
-    """
-    try:
-        logger.info(f"📝 Annotation request: {request.action.upper()} for '{request.selected_text[:50]}...'")
-        logger.info(f"   Class {request.class_level}, {request.subject}")
-        
-        # EDGE CASE: Check class availability
-        # Currently we have comprehensive data for Classes 5-10
-        # Classes 11-12 have limited content
-        if request.class_level > 10:
-            logger.warning(f"⚠️ Class {request.class_level} requested (limited content available)")
-            # Don't block the request - let the RAG system try to find content
-            # If not found, it will fall back to general knowledge
+    if request.action == "define":
+        # Extract concise definition
+        context = "\n\n".join([chunk.get('text', '')[:500] for chunk in source_chunks[:3]])
         
-        # Get relevant context from textbook using RAG
-        if request.action == "define":
-            # Quick mode: Current + 2 previous classes WITH lower LLM reuse threshold
-            answer, source_chunks = enhanced_rag_service.answer_annotation_basic(
-                question=f"Define: {request.selected_text}",
-                subject=request.subject,
-                student_class=request.class_level,
-                chapter=request.chapter
-            )
-            
-            # Extract concise definition
-            if source_chunks:
-                context = "\n\n".join([chunk.get('text', '')[:500] for chunk in source_chunks[:3]])
-                
-                prompt = f"""Based on the textbook content below, provide a clear, concise definition of "{request.selected_text}" for a Class {request.class_level} student.
+        return f"""Based on the textbook content below, provide a clear, concise definition of "{request.selected_text}" for a Class {request.class_level} student.
 
 **Textbook Content:**
 {context}
@@ -98,24 +76,12 @@ async def process_annotation(request: AnnotationRequest):
 • [Point 1]
 • [Point 2]  
 • [Point 3]"""
-                
-                answer = gemini_service.generate_response(prompt)
-            # Note: If no sources, answer_annotation_basic already provided fallback answer
+    
+    if request.action == "elaborate":
+        # Generate detailed explanation
+        context = "\n\n".join([chunk.get('text', '')[:800] for chunk in source_chunks[:5]])
         
-        elif request.action == "elaborate":
-            # Deep dive mode: Comprehensive explanation
-            answer, source_chunks = enhanced_rag_service.answer_question_deepdive(
-                question=f"Explain in detail: {request.selected_text}",
-                subject=request.subject,
-                student_class=request.class_level,
-                chapter=request.chapter
-            )
-            
-            # Generate detailed explanation
-            if source_chunks:
-                context = "\n\n".join([chunk.get('text', '')[:800] for chunk in source_chunks[:5]])
-                
-                prompt = f"""Based on the textbook content below, provide a detailed explanation of "{request.selected_text}" for a Class {request.class_level} student.
+        return f"""Based on the textbook content below, provide a detailed explanation of "{request.selected_text}" for a Class {request.class_level} student.
 
 **Textbook Content:**
 {context}
@@ -139,24 +105,10 @@ async def process_annotation(request: AnnotationRequest):
 2. [Example 2]
 
 **Application:** [Why it matters]"""
-                
-                answer = gemini_service.generate_response(prompt)
-            else:
-                answer = f"No detailed information found in the book. '{request.selected_text}' might require additional resources beyond your Class {request.class_level} {request.subject} textbook."
-        
-        elif request.action == "stick_flow":
-            # Generate text-based flow diagram WITH lower LLM reuse threshold
-            answer, source_chunks = enhanced_rag_service.answer_annotation_basic(
-                question=f"Explain the flow/process of: {request.selected_text}",
-                subject=request.subject,
-                student_class=request.class_level,
-                chapter=request.chapter
-            )
-            
-            if source_chunks:
-                context = "\n\n".join([chunk.get('text', '')[:600] for chunk in source_chunks[:4]])
-                
-                prompt = f"""Based on the textbook content below, create a clear TEXT-BASED flow diagram for "{request.selected_text}" suitable for a Class {request.class_level} student.
+    
+    context = "\n\n".join([chunk.get('text', '')[:600] for chunk in source_chunks[:4]])
+    
+    return f"""Based on the textbook content below, create a clear TEXT-BASED flow diagram for "{request.selected_text}" suitable for a Class {request.class_level} student.
 
 **Textbook Content:**
 {context}
@@ -189,10 +141,14 @@ async def process_annotation(request: AnnotationRequest):
 ```
 
 Generate a similar flow diagram for "{request.selected_text}":"""
-                
-                answer = gemini_service.generate_response(prompt)
-            else:
-                answer = f"""No flow information found in the book.
+
+
+def _no_sources_answer(request: AnnotationRequest) -> Optional[str]:
+    """Answer when nothing was found (None = use the general-knowledge fallback)."""
+    if request.action == "elaborate":
+        return f"No detailed information found in the book. '{request.selected_text}' might require additional resources beyond your Class {request.class_level} {request.subject} textbook."
+    if request.action == "stick_flow":
+        return f"""No flow information found in the book.
 
 Try asking about:
 • Specific processes or procedures
@@ -200,6 +156,62 @@ Try asking about:
 • Sequential topics
 
 Current search: "{request.selected_text}" in Class {request.class_level} {request.subject}"""
+    return None
+
+
+@router.post("/", response_model=AnnotationResponse)
+async def process_annotation(request: AnnotationRequest):
+    """
+    🎯 Process annotation request with AI assistance.
+    
+    **Actions:**
+    - `define`: Quick, accurate definition from textbook
+    - `elaborate`: Detailed explanation with examples  
+    - `stick_flow`: Text-based flow diagram showing concept breakdown
+    
+    **Cost-Efficient Design:**
+    - Uses RAG for context (reduces Gemini tokens)
+    - Targeted prompts for specific actions
+    - No image generation (text-based flows)
+    
+    **Edge Case Handling:**
+    - Class 11-12: Limited content available (graceful fallback)
+    - Missing content: Searches earlier classes for foundation
+    - No matches: Uses Gemini general knowledge with disclaimer
+    """
+    try:
+        logger.info(f"📝 Annotation request: {request.action.upper()} for '{request.selected_text[:50]}...'")
+        logger.info(f"   Class {request.class_level}, {request.subject}")
+        
+        # EDGE CASE: Check class availability
+        # Currently we have comprehensive data for Classes 5-10
+        # Classes 11-12 have limited content
+        if request.class_level > 10:
+            logger.warning(f"⚠️ Class {request.class_level} requested (limited content available)")
+            # Don't block the request - let the RAG system try to find content
+            # If not found, it will fall back to general knowledge
+        
+        # Get relevant context from textbook using RAG
+        rag_mode, question = _annotation_query(request)
+        answer_fn = (
+            enhanced_rag_service.answer_question_deepdive if rag_mode == "deepdive"
+            else enhanced_rag_service.answer_annotation_basic
+        )
+        answer, source_chunks = await rag_executor.run(
+            answer_fn,
+            question=question,
+            subject=request.subject,
+            student_class=request.class_level,
+            chapter=request.chapter
+        )
+        
+        if source_chunks:
+            # Action-specific answer from the retrieved textbook content
+            prompt = _build_annotation_prompt(request, source_chunks)
+            answer = await rag_executor.run(gemini_service.generate_response, prompt)
+        else:
+            # Note: for define, answer_annotation_basic already provided fallback answer
+            answer = _no_sources_answer(request) or answer
         
         logger.info(f"✅ Annotation processed: {len(answer)} chars, {len(source_chunks)} sources")
         
@@ -216,6 +228,42 @@ Current search: "{request.selected_text}" in Class {request.class_level} {reques
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/stream")
+async def process_annotation_stream(request: AnnotationRequest):
+    """
+    ⚡ Streaming annotation (Server-Sent Events).
+    
+    Same actions and sources as `/annotation/`, but the answer is streamed:
+    - `sources`: number of sources used (sent before generation starts)
+    - `token`: answer text deltas
+    - `done`: timings (time-to-first-token, total)
+    - `error`: sent if generation fails mid-stream
+    
+    Retrieval feeds the action prompt directly, so only one Gemini call is made.
+    """
+    logger.info(f"📝 Annotation stream: {request.action.upper()} for '{request.selected_text[:50]}...'")
+    
+    rag_mode, question = _annotation_query(request)
+    
+    async def events():
+        async for event, data in rag_executor.stream(
+            enhanced_rag_service.stream_answer,
+            question=question,
+            subject=request.subject,
+            student_class=request.class_level,
+            chapter=request.chapter,
+            mode=rag_mode,
+            prompt_builder=lambda source_chunks: _build_annotation_prompt(request, source_chunks),
+            no_sources_message=_no_sources_answer(request),
+            cache_mode=f"annotation-{request.action}"
+        ):
+            if event == "sources":
+                data = {"action_type": request.action, "source_count": len(data["source_chunks"])}
+            yield event, data
+    
+    return sse_response(events())
+
+
 @router.post("/quick-define")
 async def quick_define(
     text: str = Query(..., description="Text to define"),
@@ -230,7 +278,8 @@ async def quick_define(
     """
     try:
         # Use basic RAG with minimal chunks
-        answer, source_chunks = enhanced_rag_service.answer_question_basic(
+        answer, source_chunks = await rag_executor.run(
+            enhanced_rag_service.answer_question_basic,
             question=f"What is {text}?",
             subject=subject,
             student_class=class_level,
@@ -247,7 +296,7 @@ async def quick_define(
 
 Definition:"""
             
-            definition = gemini_service.generate_response(prompt)
+            definition = await rag_executor.run(gemini_service.generate_response, prompt)
             
             return {"definition": definition.strip()}
         else:
@@ -15,7 +15,7 @@ Student endpoints:
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional
 from datetime import datetime
 import os
 import uuid
@@ -26,6 +26,8 @@ from bson import ObjectId
 
 from app.db.mongo import db
 from app.core.config import settings
+from app.services.book_job_queue import book_job_queue
+from app.services.ingestion_cache import ingestion_cache
 
 logger = logging.getLogger(__name__)
 
@@ -37,96 +39,6 @@ BOOKS_UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "upl
 os.makedirs(BOOKS_UPLOAD_DIR, exist_ok=True)
 
 
-# ==================== HELPER FUNCTIONS ====================
-
-async def process_book_embeddings(
-    book_id: str,
-    pdf_path: str,
-    book_metadata: Dict,
-    namespace: str
-) -> Dict:
-    """
-    Process a PDF and generate embeddings for Pinecone.
-    
-    This function:
-    1. Extracts text from PDF using PyPDF2 and OCR
-    2. Handles images, formulas, and diagrams
-    3. Chunks the content appropriately
-    4. Generates embeddings using Gemini
-    5. Uploads to Pinecone
-    
-    Returns statistics about the processing.
-    """
-    try:
-        from app.services.pdf_processor import AdvancedPDFProcessor, PineconeEmbeddingUploader
-        
-        logger.info(f"🔄 Starting embedding generation for book: {book_id}")
-        
-        # Initialize processors
-        pdf_processor = AdvancedPDFProcessor(
-            chunk_size=800,
-            chunk_overlap=150,
-            dpi=200,  # Balance between quality and speed
-            use_gemini_vision=True
-        )
-        
-        uploader = PineconeEmbeddingUploader()
-        
-        # Process PDF
-        logger.info("📄 Processing PDF...")
-        result = pdf_processor.process_pdf(
-            pdf_path=pdf_path,
-            book_metadata=book_metadata
-        )
-        
-        if not result.success:
-            return {
-                "success": False,
-                "error": "PDF processing failed",
-                "errors": result.errors,
-                "total_pages": result.total_pages,
-                "processed_pages": result.processed_pages
-            }
-        
-        # Create chunks
-        logger.info("📦 Creating chunks...")
-        chunks = pdf_processor.create_chunks(result.pages, book_metadata)
-        
-        if not chunks:
-            return {
-                "success": False,
-                "error": "No content extracted from PDF",
-                "total_pages": result.total_pages,
-                "total_chunks": 0
-            }
-        
-        # Upload to Pinecone
-        logger.info(f"🚀 Uploading {len(chunks)} chunks to Pinecone...")
-        upload_stats = uploader.upload_chunks(chunks, namespace)
-        
-        return {
-            "success": upload_stats['successful'] > 0,
-            "total_pages": result.total_pages,
-            "processed_pages": result.processed_pages,
-            "total_chunks": len(chunks),
-            "embedding_count": upload_stats['successful'],
-            "failed_embeddings": upload_stats['failed'],
-            "errors": result.errors + upload_stats.get('errors', []),
-            "processing_time": result.processing_time,
-            "namespace": namespace
-        }
-        
-    except Exception as e:
-        logger.error(f"❌ Embedding generation failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "success": False,
-            "error": str(e),
-            "errors": [str(e)]
-        }
-
-
 # ==================== MODELS ====================
 
 class BookCreate(BaseModel):
@@ -169,14 +81,16 @@ async def upload_book(
     pdf_file: UploadFile = File(...)
 ):
     """
-    Upload a new book chapter PDF, store metadata in MongoDB, and generate embeddings.
+    Upload a new book chapter PDF, store metadata in MongoDB, and queue embedding generation.
     
     This endpoint:
     1. Saves the PDF file
     2. Stores book metadata in MongoDB
-    3. Processes the PDF (OCR, text extraction, image analysis)
-    4. Generates embeddings for all content
-    5. Uploads embeddings to Pinecone
+    3. Queues an embedding job and returns its job_id immediately
+    
+    A background worker then processes the PDF (OCR, text extraction, image
+    analysis), generates embeddings and uploads them to Pinecone. Poll
+    `GET /api/books/jobs/{job_id}` for progress.
     
     Namespace Organization:
     - All chapters of a subject are stored in one namespace
@@ -271,68 +185,28 @@ async def upload_book(
         
         logger.info(f"✅ Book record created: {title} (ID: {mongo_id}, book_id: {book_id})")
         
-        # Generate embeddings if requested
-        embedding_result = None
+        # Queue embedding generation (processed by the background worker pool)
+        job = None
         if generate_embeddings:
-            try:
-                # Update status to processing
-                db.books.update_one(
-                    {"_id": ObjectId(mongo_id)},
-                    {"$set": {"processing_status": "processing"}}
-                )
-                
-                # Process PDF and generate embeddings
-                embedding_result = await process_book_embeddings(
-                    book_id=book_id,  # Use book_id for embeddings metadata
-                    pdf_path=file_path,
-                    book_metadata={
-                        "book_id": book_id,
-                        "title": title,
-                        "subject": subject,
-                        "class_level": class_level,
-                        "chapter_number": chapter_number
-                    },
-                    namespace=namespace
-                )
-                
-                # Update book with embedding info
-                db.books.update_one(
-                    {"_id": ObjectId(mongo_id)},
-                    {
-                        "$set": {
-                            "has_embeddings": embedding_result.get("success", False),
-                            "embedding_count": embedding_result.get("embedding_count", 0),
-                            "total_pages": embedding_result.get("total_pages", 0),
-                            "total_chunks": embedding_result.get("total_chunks", 0),
-                            "processing_status": "completed" if embedding_result.get("success") else "failed",
-                            "processing_errors": embedding_result.get("errors", []),
-                            "updated_at": datetime.utcnow()
-                        }
-                    }
-                )
-                
-                logger.info(f"✅ Embeddings generated: {embedding_result.get('embedding_count', 0)} vectors")
-                
-            except Exception as e:
-                logger.error(f"❌ Embedding generation failed: {e}")
-                db.books.update_one(
-                    {"_id": ObjectId(mongo_id)},
-                    {
-                        "$set": {
-                            "processing_status": "failed",
-                            "processing_errors": [str(e)],
-                            "updated_at": datetime.utcnow()
-                        }
-                    }
-                )
-                embedding_result = {"success": False, "error": str(e)}
+            job = book_job_queue.enqueue(
+                book_id=mongo_id,
+                pdf_path=file_path,
+                book_metadata={
+                    "book_id": book_id,  # Use book_id for embeddings metadata
+                    "title": title,
+                    "subject": subject,
+                    "class_level": class_level,
+                    "chapter_number": chapter_number
+                },
+                namespace=namespace
+            )
         
         return {
             "success": True,
-            "message": f"Book '{title}' uploaded successfully",
+            "message": f"Book '{title}' uploaded successfully" + (" - embeddings queued" if job else ""),
             "book_id": mongo_id,  # Return MongoDB _id for frontend
             "pdf_url": book_doc["pdf_url"],
-            "embeddings": embedding_result
+            "job_id": job["job_id"] if job else None
         }
         
     except Exception as e:
@@ -341,10 +215,13 @@ async def upload_book(
 
 
 @router.post("/{book_id}/regenerate-embeddings")
-async def regenerate_embeddings(book_id: str):
+async def regenerate_embeddings(book_id: str, force: bool = Query(default=False)):
     """
     Regenerate embeddings for an existing book.
     Useful if initial embedding generation failed or you want to update embeddings.
+    
+    Only pages and chunks that changed since the last run are reprocessed and
+    upserted (vectors of removed chunks are deleted); `force=true` redoes everything.
     """
     try:
         # Get book from database
@@ -352,52 +229,33 @@ async def regenerate_embeddings(book_id: str):
         if not book:
             raise HTTPException(status_code=404, detail="Book not found")
         
-        # Get PDF path
-        pdf_path = os.path.join(BOOKS_UPLOAD_DIR, book["pdf_filename"])
+        # Get PDF path (uploads are stored under class_X/subject/chapter_Y/)
+        pdf_path = os.path.join(BOOKS_UPLOAD_DIR, book.get("pdf_path") or book["pdf_filename"])
         if not os.path.exists(pdf_path):
             raise HTTPException(status_code=404, detail="PDF file not found")
         
-        # Update status
-        db.books.update_one(
-            {"_id": ObjectId(book_id)},
-            {"$set": {"processing_status": "processing", "updated_at": datetime.utcnow()}}
-        )
-        
-        # Process embeddings
         namespace = book.get("embedding_namespace", f"{book['subject'].lower().replace(' ', '_')}_class{book['class_level']}")
         
-        result = await process_book_embeddings(
+        job = book_job_queue.enqueue(
             book_id=book_id,
             pdf_path=pdf_path,
             book_metadata={
-                "book_id": book_id,
+                # Same book_id as the upload so chunk IDs (and Pinecone upserts) line up
+                "book_id": book.get("book_id", book_id),
                 "title": book["title"],
                 "subject": book["subject"],
-                "class_level": book["class_level"]
+                "class_level": book["class_level"],
+                "chapter_number": book.get("chapter_number", 1)
             },
-            namespace=namespace
-        )
-        
-        # Update book with results
-        db.books.update_one(
-            {"_id": ObjectId(book_id)},
-            {
-                "$set": {
-                    "has_embeddings": result.get("success", False),
-                    "embedding_count": result.get("embedding_count", 0),
-                    "total_pages": result.get("total_pages", 0),
-                    "total_chunks": result.get("total_chunks", 0),
-                    "processing_status": "completed" if result.get("success") else "failed",
-                    "processing_errors": result.get("errors", []),
-                    "updated_at": datetime.utcnow()
-                }
-            }
+            namespace=namespace,
+            force=force
         )
         
         return {
-            "success": result.get("success", False),
-            "message": f"Embeddings {'regenerated' if result.get('success') else 'failed to regenerate'}",
-            "details": result
+            "success": True,
+            "message": "Embedding regeneration queued",
+            "job_id": job["job_id"],
+            "status": job["status"]
         }
         
     except HTTPException:
@@ -407,6 +265,74 @@ async def regenerate_embeddings(book_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{book_id}/embedding-job")
+async def get_book_embedding_job(book_id: str):
+    """Latest embedding job of a book (status, attempts, page / embedding progress)."""
+    try:
+        job = book_job_queue.get_latest_job_for_book(book_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="No embedding job for this book")
+        return job
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Get book embedding job failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}")
+async def get_embedding_job(job_id: str):
+    """Status of an embedding job (queued / running / completed / failed) with progress."""
+    try:
+        job = book_job_queue.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Get embedding job failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_embedding_job(job_id: str):
+    """Re-queue a failed embedding job with a fresh attempt budget."""
+    try:
+        job = book_job_queue.retry(job_id)
+        if not job:
+            existing = book_job_queue.get_job(job_id)
+            if not existing:
+                raise HTTPException(status_code=404, detail="Job not found")
+            raise HTTPException(status_code=409, detail=f"Only failed jobs can be retried (job is {existing['status']})")
+        return {"success": True, "message": "Job re-queued", "job_id": job_id}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Retry embedding job failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admin/jobs")
+async def list_embedding_jobs(
+    status: Optional[str] = Query(default=None),
+    limit: int = Query(default=50, le=500)
+):
+    """List recent embedding jobs, optionally filtered by status, plus queue counters."""
+    try:
+        return {
+            "jobs": book_job_queue.list_jobs(status=status, limit=limit),
+            "queue": book_job_queue.get_stats()
+        }
+        
+    except Exception as e:
+        logger.error(f"❌ List embedding jobs failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/{book_id}/chapters")
 async def add_chapter(book_id: str, chapter: ChapterCreate):
     """Add a chapter to a book."""
@@ -493,6 +419,16 @@ async def delete_book(book_id: str, delete_embeddings: bool = Query(default=True
                 
                 # Delete by metadata filter (book_id)
                 namespace = book.get("embedding_namespace", "default")
+                # Vectors carry the upload's book_id, not the Mongo _id
+                vector_book_id = book.get("book_id", book_id)
+                
+                # Vectors recorded by the ingestion cache can be deleted by ID
+                recorded_ids = list(ingestion_cache.get_vectors(namespace, vector_book_id))
+                for start in range(0, len(recorded_ids), 1000):
+                    index.delete(ids=recorded_ids[start:start + 1000], namespace=namespace)
+                ingestion_cache.forget_vectors(namespace, vector_book_id)
+                if recorded_ids:
+                    logger.info(f"✅ Deleted {len(recorded_ids)} recorded vectors for book {vector_book_id}")
                 
                 # Delete all vectors with this book_id
                 # Note: Pinecone delete by filter requires specific setup
@@ -502,10 +438,10 @@ async def delete_book(book_id: str, delete_embeddings: bool = Query(default=True
                 # If using metadata filter delete (Pinecone serverless supports this):
                 try:
                     index.delete(
-                        filter={"book_id": book_id},
+                        filter={"book_id": vector_book_id},
                         namespace=namespace
                     )
-                    logger.info(f"✅ Deleted embeddings for book {book_id} from Pinecone")
+                    logger.info(f"✅ Deleted embeddings for book {vector_book_id} from Pinecone")
                 except Exception as pe:
                     logger.warning(f"Could not delete embeddings: {pe}")
                 
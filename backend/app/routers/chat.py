@@ -9,6 +9,8 @@ from app.models.schemas import ChatRequest, ChatResponse, ErrorResponse
 from app.services.rag_service import rag_service
 from app.services.enhanced_rag_service import enhanced_rag_service
 from app.services.gemini_service import gemini_service
+from app.services.rag_executor import rag_executor
+from app.core.sse import sse_response
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,7 +37,8 @@ async def chat(request: ChatRequest):
         logger.info(f"Chat request: Class {request.class_level}, {request.subject}, Ch. {request.chapter}, Mode: {request.mode}")
         
         # Query RAG system with progressive learning
-        answer, source_chunks = rag_service.query_with_rag_progressive(
+        answer, source_chunks = await rag_executor.run(
+            rag_service.query_with_rag_progressive,
             query_text=request.highlight_text,
             class_level=request.class_level,
             subject=request.subject,
@@ -83,7 +86,8 @@ async def generate_stick_flow(request: StickFlowRequest):
         logger.info(f"Stick Flow request: Class {request.class_level}, {request.subject}, Ch. {request.chapter}")
         
         # Get context from RAG
-        context = rag_service.retrieve_chapter_context(
+        context = await rag_executor.run(
+            rag_service.retrieve_chapter_context,
             class_level=request.class_level,
             subject=request.subject,
             chapter=request.chapter,
@@ -127,7 +131,7 @@ A clean, professional flow diagram that a student can use for quick revision.
 Create a brief description (2-3 sentences) of how to visualize "{request.highlight_text}" as a flow diagram.
 Focus on the steps and connections."""
 
-        description = gemini_service.generate_response(description_prompt)
+        description = await rag_executor.run(gemini_service.generate_response, description_prompt)
         
         # TODO: Integrate actual image generation
         # For now, return a placeholder
@@ -186,7 +190,8 @@ async def student_chatbot(request: StudentChatRequest):
         # Convert to new enhanced system
         if request.mode == "quick":
             # BASIC MODE: Current + recent lower classes (textbook only)
-            answer, source_chunks_list = enhanced_rag_service.answer_question_basic(
+            answer, source_chunks_list = await rag_executor.run(
+                enhanced_rag_service.answer_question_basic,
                 question=request.question,
                 subject=request.subject,
                 student_class=request.class_level,
@@ -206,7 +211,8 @@ async def student_chatbot(request: StudentChatRequest):
         
         else:  # deepdive mode
             # DEEP DIVE MODE: ALL prerequisite classes + web content
-            answer, source_chunks_list = enhanced_rag_service.answer_question_deepdive(
+            answer, source_chunks_list = await rag_executor.run(
+                enhanced_rag_service.answer_question_deepdive,
                 question=request.question,
                 subject=request.subject,
                 student_class=request.class_level,
@@ -229,3 +235,46 @@ async def student_chatbot(request: StudentChatRequest):
         import traceback
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/student/stream")
+async def student_chatbot_stream(request: StudentChatRequest):
+    """
+    ⚡ Streaming Student Chatbot (Server-Sent Events)
+    
+    Same Quick / Deep Dive retrieval as `/chat/student`, but the answer is
+    streamed as Gemini generates it instead of after the whole answer is ready:
+    - `sources`: source chunk texts (sent before generation starts)
+    - `token`: answer text deltas
+    - `done`: timings (time-to-first-token, total)
+    - `error`: sent if generation fails mid-stream
+    
+    The finished answer is stored for reuse exactly like the blocking endpoint.
+    """
+    logger.info(f"🎓 Student chat stream ({request.mode.upper()}): Class {request.class_level}, {request.subject}")
+    logger.info(f"   Question: {request.question[:100]}...")
+    
+    if request.mode == "quick":
+        options = {
+            "mode": "basic",
+            "min_sources": 2,
+            "no_sources_message": f"I couldn't find enough information in your textbooks. Try asking about specific topics covered in Chapter {request.chapter} of {request.subject}!"
+        }
+    else:
+        options = {"mode": "deepdive"}
+    
+    async def events():
+        async for event, data in rag_executor.stream(
+            enhanced_rag_service.stream_answer,
+            question=request.question,
+            subject=request.subject,
+            student_class=request.class_level,
+            chapter=request.chapter,
+            **options
+        ):
+            if event == "sources":
+                # Same chunk format as ChatResponse.source_chunks
+                data = {**data, "source_chunks": [chunk.get('text', '') for chunk in data["source_chunks"]]}
+            yield event, data
+    
+    return sse_response(events())
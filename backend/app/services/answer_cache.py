@@ -0,0 +1,260 @@
+"""
+Answer Cache - Exact-match cache for student answers.
+
+Sits in front of the vector LLM cache in EnhancedRAGService. Repeated homework
+questions are matched on normalized question text + subject + class + chapter +
+mode and returned without any embedding, Pinecone or Gemini call.
+
+Two tiers:
+- In-process LRU with TTL (microseconds, per worker)
+- MongoDB `answer_cache` collection with a TTL index (shared across workers/restarts)
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.db.mongo import db
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normalize question text for exact matching.
+
+    Only Unicode form, case, whitespace and trailing ?!. are folded:
+    "  What is a  Prime Number?? " and "what is a prime number" map to the same key,
+    but every other symbol is kept ("What is 5+3?" and "What is 5-3?" stay distinct).
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+class AnswerCache:
+    """Two-tier (memory + MongoDB) exact-match answer cache with TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        ttl_seconds: int = 7 * 24 * 3600,
+        use_mongo: bool = True,
+        collection_name: str = "answer_cache"
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_mongo = use_mongo
+        self.collection_name = collection_name
+
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._mongo_ready = False
+
+        self.stats = {
+            "memory_hits": 0,
+            "mongo_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "mongo_errors": 0
+        }
+
+    # ==================== KEYS ====================
+
+    @staticmethod
+    def make_key(
+        question: str,
+        subject: str,
+        class_level: int,
+        chapter: Optional[int],
+        mode: str
+    ) -> str:
+        """Build the cache key from normalized question text and request scope."""
+        raw = "|".join([
+            normalize_question(question),
+            (subject or "").strip().lower(),
+            str(class_level),
+            str(chapter) if chapter is not None else "-",
+            mode
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ==================== MONGO TIER ====================
+
+    def _collection(self):
+        """Get the Mongo collection, creating the TTL index on first use."""
+        collection = db.get_collection(self.collection_name)
+        if not self._mongo_ready:
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            self._mongo_ready = True
+        return collection
+
+    def _mongo_get(self, key: str) -> Optional[Dict]:
+        try:
+            doc = self._collection().find_one({"_id": key})
+        except Exception as e:
+            self.stats["mongo_errors"] += 1
+            logger.warning(f"Answer cache Mongo lookup failed: {e}")
+            return None
+
+        if not doc:
+            return None
+
+        expires_at = doc.get("expires_at")
+        if expires_at is not None:
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            # TTL monitor only runs every ~60s, so double-check expiry here
+            if expires_at <= datetime.now(timezone.utc):
+                return None
+
+        return {"answer": doc["answer"], "source_chunks": doc.get("source_chunks", [])}
+
+    def _mongo_put(self, key: str, value: Dict, metadata: Dict):
+        try:
+            now = datetime.now(timezone.utc)
+            self._collection().replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    **value,
+                    **metadata,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            self.stats["mongo_errors"] += 1
+            logger.warning(f"Answer cache Mongo store failed: {e}")
+
+    # ==================== MEMORY TIER ====================
+
+    def _memory_get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: Dict):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # ==================== PUBLIC API ====================
+
+    def get(
+        self,
+        question: str,
+        subject: str,
+        class_level: int,
+        chapter: Optional[int],
+        mode: str
+    ) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Look up a cached answer.
+
+        Returns:
+            Tuple of (answer, source_chunks) or None on miss
+        """
+        key = self.make_key(question, subject, class_level, chapter, mode)
+
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            logger.info(f"⚡ Answer cache HIT (memory): {question[:60]}...")
+            return value["answer"], value["source_chunks"]
+
+        if self.use_mongo:
+            value = self._mongo_get(key)
+            if value is not None:
+                self.stats["mongo_hits"] += 1
+                self._memory_put(key, value)
+                logger.info(f"⚡ Answer cache HIT (mongo): {question[:60]}...")
+                return value["answer"], value["source_chunks"]
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(
+        self,
+        question: str,
+        subject: str,
+        class_level: int,
+        chapter: Optional[int],
+        mode: str,
+        answer: str,
+        source_chunks: List[Dict]
+    ):
+        """Store an answer in both tiers."""
+        key = self.make_key(question, subject, class_level, chapter, mode)
+        value = {"answer": answer, "source_chunks": source_chunks}
+
+        self._memory_put(key, value)
+        if self.use_mongo:
+            self._mongo_put(key, value, {
+                "question": question[:1000],
+                "subject": subject,
+                "class_level": class_level,
+                "chapter": chapter,
+                "mode": mode
+            })
+        self.stats["stores"] += 1
+
+    def clear(self) -> int:
+        """Clear both tiers. Returns number of Mongo documents removed."""
+        with self._lock:
+            self._entries.clear()
+
+        if not self.use_mongo:
+            return 0
+        try:
+            return self._collection().delete_many({}).deleted_count
+        except Exception as e:
+            logger.warning(f"Answer cache Mongo clear failed: {e}")
+            return 0
+
+    def get_stats(self) -> Dict:
+        """Hit/miss/eviction counters and current size."""
+        hits = self.stats["memory_hits"] + self.stats["mongo_hits"]
+        lookups = hits + self.stats["misses"]
+        with self._lock:
+            size = len(self._entries)
+        return {
+            **self.stats,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "mongo_enabled": self.use_mongo
+        }
+
+
+# Global instance
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    use_mongo=settings.ANSWER_CACHE_USE_MONGO
+)
@@ -0,0 +1,295 @@
+"""
+Answer Pre-Grader - Deterministic local grading of clear-cut test answers.
+
+Every non-blank answer used to go to Gemini, including "I don't know" and answers
+that repeat the expected answer almost word for word. Questions from the topic
+question bank carry `expected_answer` and `keywords`, which is enough to settle
+those cases locally:
+
+- keyword coverage (share of `keywords` present in the answer)
+- token overlap (content-word F1) and normalized edit similarity against `expected_answer`
+- cosine similarity of local sentence embeddings (answer vs expected answer)
+
+An answer is only scored correct locally when its numbers, signs and operators and
+the order of the key terms it shares with `expected_answer` match ("20 m/s" vs
+"30 m/s", "x = 5" vs "x = -5", "faster in gases than in solids" vs the reverse look
+alike to every similarity signal). Only answers the signals cannot confidently
+score are sent to Gemini.
+"""
+
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set
+from app.core.config import settings
+from app.services.embedding_registry import embedding_registry
+import logging
+import math
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Unicode words; Indic scripts (Hindi etc.) also need their combining vowel signs,
+# which plain \w does not match
+_WORD_RE = re.compile(r"[\w\u0300-\u036f\u0900-\u0dff]+")
+
+# Numbers and the operators / relations that change what a statement says
+_SYMBOL_RE = re.compile(r"\d+(?:\.\d+)?|[-+*/^=<>%±×÷√≤≥≠−]")
+# Hyphens inside words ("carbon-dioxide") are not minus signs
+_WORD_HYPHEN_RE = re.compile(r"(?<=[^\W\d])-(?=[^\W\d])")
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "being", "of", "in",
+    "on", "at", "to", "for", "from", "by", "with", "and", "or", "but", "as", "it",
+    "its", "this", "that", "these", "those", "which", "who", "what", "when", "where",
+    "how", "why", "do", "does", "did", "has", "have", "had", "can", "could", "will",
+    "would", "should", "may", "might", "also", "so", "than", "then", "there", "their",
+    "they", "them", "we", "our", "you", "your", "i", "my", "me", "he", "she", "his", "her"
+}
+
+# Answers that are an explicit non-attempt
+_NON_ANSWER_RE = re.compile(
+    r"^(i\s*(do\s*not|don'?t|dont)\s*know|idk|no\s*idea|not\s*sure|don'?t\s*know|"
+    r"dunno|n/?a|pass|skip|skipped|no\s*answer|\?+|-+|\.+)[\s.!?]*$"
+)
+
+
+def _tokens(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _content_tokens(text: str) -> Set[str]:
+    return {token for token in _tokens(text) if token not in _STOPWORDS}
+
+
+def _symbols(text: str) -> List[str]:
+    """Numbers and operators in order, e.g. "x = -5" -> ['=', '-', '5']."""
+    return _SYMBOL_RE.findall(_WORD_HYPHEN_RE.sub(" ", text.lower()).replace(",", ""))
+
+
+def _shared_term_order(answer: str, expected: str) -> bool:
+    """True if the content words both texts share appear in the same order in each."""
+    shared = _content_tokens(answer) & _content_tokens(expected)
+
+    def order(text: str) -> List[str]:
+        seen = []
+        for token in _tokens(text):
+            if token in shared and token not in seen:
+                seen.append(token)
+        return seen
+
+    return order(answer) == order(expected)
+
+
+class AnswerPreGrader:
+    """Scores clear-cut answers locally; returns None for answers that need Gemini."""
+
+    def __init__(
+        self,
+        embedding_model: Optional[str] = "all-mpnet-base-v2",
+        correct_edit_ratio: float = 0.9,
+        correct_similarity: float = 0.9,
+        correct_coverage: float = 0.8,
+        wrong_similarity: float = 0.25
+    ):
+        """
+        Args:
+            embedding_model: Local embedding model name for semantic similarity
+                             (None/"" disables the embedding signal)
+            correct_edit_ratio: Edit similarity to the expected answer that counts as verbatim
+            correct_similarity: Embedding similarity that counts as a full answer (with keyword coverage)
+            correct_coverage: Keyword coverage required for a confident full score
+            wrong_similarity: Embedding similarity below which an answer with no
+                              keywords and no overlap is off-topic
+        """
+        self.embedding_model = embedding_model or None
+        self.correct_edit_ratio = correct_edit_ratio
+        self.correct_similarity = correct_similarity
+        self.correct_coverage = correct_coverage
+        self.wrong_similarity = wrong_similarity
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "answers": 0,
+            "short_circuited": 0,
+            "non_answers": 0,
+            "confident_correct": 0,
+            "confident_wrong": 0,
+            "symbol_mismatches": 0,
+            "sent_to_llm": 0,
+            "embedding_errors": 0
+        }
+
+    # ==================== SIGNALS ====================
+
+    def _keyword_coverage(self, answer: str, keywords: List[str]) -> Optional[float]:
+        """Share of keywords whose content words all appear in the answer (None without keywords)."""
+        keywords = [keyword for keyword in keywords if keyword and keyword.strip()]
+        if not keywords:
+            return None
+        answer_tokens = set(_tokens(answer))
+        hits = 0
+        for keyword in keywords:
+            keyword_tokens = _content_tokens(keyword) or set(_tokens(keyword))
+            if keyword_tokens and keyword_tokens <= answer_tokens:
+                hits += 1
+        return hits / len(keywords)
+
+    def _token_overlap(self, answer: str, expected: str) -> float:
+        """F1 of content words between answer and expected answer."""
+        answer_tokens = _content_tokens(answer)
+        expected_tokens = _content_tokens(expected)
+        common = len(answer_tokens & expected_tokens)
+        if not common:
+            return 0.0
+        precision = common / len(answer_tokens)
+        recall = common / len(expected_tokens)
+        return 2 * precision * recall / (precision + recall)
+
+    def _edit_ratio(self, answer: str, expected: str) -> float:
+        """Normalized edit similarity of the lowercased word sequences."""
+        return SequenceMatcher(None, " ".join(_tokens(answer)), " ".join(_tokens(expected))).ratio()
+
+    def _similarities(self, pairs: List[tuple]) -> List[Optional[float]]:
+        """Cosine similarity per (answer, expected) pair, embedded in one local batch."""
+        if not pairs or not self.embedding_model:
+            return [None] * len(pairs)
+        try:
+            embedder = embedding_registry.get_model_embedder(self.embedding_model)
+            vectors = embedder.embed_documents([text for pair in pairs for text in pair])
+        except Exception as e:
+            with self._lock:
+                self.stats["embedding_errors"] += 1
+            logger.warning(f"⚠️  Pre-grader embeddings unavailable, skipping similarity: {e}")
+            return [None] * len(pairs)
+
+        similarities = []
+        for i in range(0, len(vectors), 2):
+            a, b = vectors[i], vectors[i + 1]
+            norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+            similarities.append(sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0)
+        return similarities
+
+    # ==================== GRADING ====================
+
+    def _result(self, score: float, feedback: str, expected_answer: Optional[str], signals: Dict) -> Dict:
+        return {
+            "is_correct": score >= 6,
+            "score": score,
+            "feedback": feedback,
+            "correct_answer": expected_answer or "Please refer to the textbook.",
+            "graded_by": "pregrader",
+            "signals": signals
+        }
+
+    def _decide(self, item: Dict, similarity: Optional[float], signals: Dict) -> Optional[Dict]:
+        expected = item.get("expected_answer")
+        coverage = signals.get("keyword_coverage")
+        overlap = signals.get("token_overlap", 0.0)
+        coverage_ok = coverage is None or coverage >= self.correct_coverage
+
+        # Never short-circuit to "correct" when numbers, signs, operators or the order of
+        # key terms differ from the expected answer - only Gemini can judge those
+        if signals.get("symbols_match") and signals.get("term_order_match"):
+            if signals.get("edit_ratio", 0.0) >= self.correct_edit_ratio:
+                return self._result(10, "Excellent! Your answer matches the textbook answer.", expected, signals)
+            if similarity is not None and similarity >= self.correct_similarity and coverage_ok:
+                return self._result(9, "Very good! Your answer explains the key idea correctly.", expected, signals)
+
+        if (
+            similarity is not None and similarity < self.wrong_similarity
+            and not coverage and overlap < 0.1
+        ):
+            return self._result(
+                0,
+                "Your answer does not address this question. Review this topic in the textbook and try again.",
+                expected, signals
+            )
+        return None
+
+    def grade_many(self, items: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Pre-grade a batch of answers (blocking: may run the local embedding model).
+
+        Args:
+            items: Dicts with 'answer', 'expected_answer' and 'keywords' (as built by
+                   RAGEvaluationService._build_qa_pairs)
+
+        Returns:
+            Evaluation dict (is_correct, score 0-10, feedback, correct_answer) per item,
+            or None where the answer needs an LLM evaluation
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        signals_by_item: Dict[int, Dict] = {}
+        needs_similarity: List[int] = []
+        non_answers = 0
+        symbol_mismatches = 0
+
+        for i, item in enumerate(items):
+            answer = (item.get("answer") or "").strip()
+            expected = (item.get("expected_answer") or "").strip()
+
+            if not answer or _NON_ANSWER_RE.match(answer.lower()):
+                non_answers += 1
+                feedback = "No answer provided." if not answer else \
+                    "You didn't attempt this question. Review the textbook and give it a try next time."
+                results[i] = self._result(0, feedback, item.get("expected_answer"), {"non_answer": True})
+                continue
+
+            if not expected:
+                # Nothing to compare against locally
+                continue
+
+            signals = {
+                "keyword_coverage": self._keyword_coverage(answer, item.get("keywords") or []),
+                "token_overlap": round(self._token_overlap(answer, expected), 3),
+                "edit_ratio": round(self._edit_ratio(answer, expected), 3),
+                "symbols_match": _symbols(answer) == _symbols(expected),
+                "term_order_match": _shared_term_order(answer, expected)
+            }
+            if not signals["symbols_match"]:
+                symbol_mismatches += 1
+            signals_by_item[i] = signals
+            results[i] = self._decide(item, None, signals)
+            if results[i] is None:
+                needs_similarity.append(i)
+
+        # Only embed answers the cheap signals could not settle
+        similarities = self._similarities([
+            ((items[i].get("answer") or "").strip(), (items[i].get("expected_answer") or "").strip())
+            for i in needs_similarity
+        ])
+        for i, similarity in zip(needs_similarity, similarities):
+            if similarity is None:
+                continue
+            signals_by_item[i]["embedding_similarity"] = round(similarity, 3)
+            results[i] = self._decide(items[i], similarity, signals_by_item[i])
+
+        decided = [result for result in results if result is not None]
+        with self._lock:
+            self.stats["answers"] += len(items)
+            self.stats["short_circuited"] += len(decided)
+            self.stats["non_answers"] += non_answers
+            self.stats["symbol_mismatches"] += symbol_mismatches
+            self.stats["confident_correct"] += sum(1 for result in decided if result["is_correct"])
+            self.stats["confident_wrong"] += sum(
+                1 for result in decided if not result["is_correct"]
+            ) - non_answers
+            self.stats["sent_to_llm"] += len(items) - len(decided)
+
+        return results
+
+    def get_stats(self) -> Dict:
+        """How many answers were scored locally vs sent to Gemini."""
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "short_circuit_rate": round(stats["short_circuited"] / stats["answers"], 3) if stats["answers"] else 0.0,
+            "embedding_model": self.embedding_model
+        }
+
+
+# Global instance
+answer_pregrader = AnswerPreGrader(
+    embedding_model=settings.TEST_PREGRADER_EMBEDDING_MODEL
+)
@@ -0,0 +1,584 @@
+"""
+Book Job Queue - Background embedding generation for uploaded books.
+
+`POST /api/books/upload` and `/{book_id}/regenerate-embeddings` used to run the
+whole pipeline (rasterization, Tesseract OCR, Gemini Vision, per-chunk embeddings)
+inside the request, blocking the event loop for minutes per book. They now only
+enqueue a job:
+
+- Jobs live in the `book_embedding_jobs` collection (queued → running →
+  completed / failed), so they survive restarts
+- A dispatcher thread claims queued jobs atomically and runs them on a local
+  process pool (BOOK_JOB_WORKERS), keeping CPU-bound OCR out of the API process
+- Workers write page / embedding progress to the book (`processing_progress`)
+  and the job; the dispatcher heartbeats running jobs
+- Failed jobs are retried with backoff up to BOOK_JOB_MAX_ATTEMPTS; jobs whose
+  heartbeat stops (server crashed mid-book) are reclaimed and resumed
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from app.core.config import settings
+from app.db.mongo import db
+from bson import ObjectId
+from pymongo import ReturnDocument
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "book_embedding_jobs"
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def process_book_embeddings(
+    pdf_path: str,
+    book_metadata: Dict,
+    namespace: str,
+    progress_callback: Optional[Callable[[str, int, int, str], None]] = None,
+    force: bool = False
+) -> Dict:
+    """
+    Process a PDF and generate embeddings for Pinecone.
+
+    This function:
+    1. Extracts text from PDF using PyPDF2 and OCR
+    2. Handles images, formulas, and diagrams
+    3. Chunks the content appropriately
+    4. Generates embeddings using Gemini
+    5. Uploads to Pinecone
+
+    Args:
+        pdf_path: Absolute path of the PDF
+        book_metadata: book_id, title, subject, class_level, chapter_number
+        namespace: Pinecone namespace
+        progress_callback: Optional callback (stage, current, total, message)
+        force: Ignore cached pages / embeddings and re-upsert every chunk
+
+    Unchanged pages, chunk embeddings and vectors are reused from the ingestion
+    cache, and vectors of chunks that disappeared are deleted (unless a page
+    failed to extract, so a transient failure never removes good vectors).
+
+    Returns statistics about the processing.
+    """
+    try:
+        from app.services.pdf_processor import AdvancedPDFProcessor, PineconeEmbeddingUploader
+        from app.services.ingestion_cache import ingestion_cache
+
+        logger.info(f"🔄 Starting embedding generation for book: {book_metadata.get('book_id')}")
+
+        def stage_callback(stage: str):
+            if progress_callback is None:
+                return None
+            return lambda current, total, message: progress_callback(stage, current, total, message)
+
+        # Initialize processors
+        pdf_processor = AdvancedPDFProcessor(
+            chunk_size=800,
+            chunk_overlap=150,
+            dpi=200,  # Balance between quality and speed
+            use_gemini_vision=True,
+            page_window=settings.PDF_PAGE_WINDOW,
+            # Default: split the cores between concurrently running book jobs
+            page_workers=settings.PDF_PAGE_WORKERS or max(1, (os.cpu_count() or 1) // settings.BOOK_JOB_WORKERS),
+            smart_ocr=settings.PDF_SMART_OCR,
+            cache=ingestion_cache
+        )
+
+        uploader = PineconeEmbeddingUploader(
+            cache=ingestion_cache,
+            embed_batch_size=settings.INGEST_EMBED_BATCH_SIZE,
+            embed_workers=settings.INGEST_EMBED_WORKERS
+        )
+
+        # Process PDF
+        logger.info("📄 Processing PDF...")
+        result = pdf_processor.process_pdf(
+            pdf_path=pdf_path,
+            book_metadata=book_metadata,
+            progress_callback=stage_callback("pages"),
+            refresh=force
+        )
+
+        if not result.success:
+            return {
+                "success": False,
+                "error": "PDF processing failed",
+                "errors": result.errors,
+                "total_pages": result.total_pages,
+                "processed_pages": result.processed_pages
+            }
+
+        # Create chunks
+        logger.info("📦 Creating chunks...")
+        chunks = pdf_processor.create_chunks(result.pages, book_metadata)
+
+        if not chunks:
+            return {
+                "success": False,
+                "error": "No content extracted from PDF",
+                "total_pages": result.total_pages,
+                "total_chunks": 0
+            }
+
+        # Upload to Pinecone
+        logger.info(f"🚀 Uploading {len(chunks)} chunks to Pinecone...")
+        upload_stats = uploader.upload_chunks(
+            chunks,
+            namespace,
+            progress_callback=stage_callback("embeddings"),
+            source_id=book_metadata.get("book_id"),
+            refresh=force,
+            # A page that failed this run (OCR / Vision hiccup) keeps its existing vectors
+            complete=not result.errors,
+            # Books uploaded before the ingestion cache have globally numbered chunk IDs
+            purge_filter={"book_id": book_metadata["book_id"]} if book_metadata.get("book_id") else None
+        )
+        # Vectors already in Pinecone from an earlier run count towards the book
+        embedding_count = upload_stats['successful'] + upload_stats['unchanged']
+
+        return {
+            "success": embedding_count > 0,
+            "total_pages": result.total_pages,
+            "processed_pages": result.processed_pages,
+            "total_chunks": len(chunks),
+            "embedding_count": embedding_count,
+            "upserted": upload_stats['successful'],
+            "unchanged": upload_stats['unchanged'],
+            "deleted": upload_stats['deleted'],
+            "embedding_cache_hits": upload_stats['embedding_cache_hits'],
+            "embedding_requests": upload_stats['embedding_requests'],
+            "failed_embeddings": upload_stats['failed'],
+            "errors": result.errors + upload_stats.get('errors', []),
+            "processing_time": result.processing_time,
+            "peak_rss_mb": result.peak_rss_mb,
+            "ocr": result.ocr_stats,
+            "namespace": namespace
+        }
+
+    except Exception as e:
+        logger.error(f"❌ Embedding generation failed: {e}")
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e),
+            "errors": [str(e)]
+        }
+
+
+# ==================== WORKER PROCESS ====================
+
+class _ProgressReporter:
+    """Writes worker progress to the job and its book, at most every `interval` seconds per stage."""
+
+    def __init__(self, job_id: str, book_id: str, interval: float = 2.0):
+        self.job_id = job_id
+        self.book_id = book_id
+        self.interval = interval
+        self._last_write = 0.0
+        self._last_stage = None
+
+    def __call__(self, stage: str, current: int, total: int, message: str):
+        now = time.monotonic()
+        if stage == self._last_stage and current < total and now - self._last_write < self.interval:
+            return
+        self._last_write = now
+        self._last_stage = stage
+
+        progress = {
+            "stage": stage,
+            "current": current,
+            "total": total,
+            "percent": round(current / total * 100, 1) if total else 0.0,
+            "message": message,
+            "updated_at": datetime.utcnow()
+        }
+        try:
+            db.get_collection(JOBS_COLLECTION).update_one(
+                {"job_id": self.job_id},
+                {"$set": {"progress": progress}}
+            )
+            db.books.update_one(
+                {"_id": ObjectId(self.book_id)},
+                {"$set": {"processing_progress": progress}}
+            )
+        except Exception as e:
+            logger.warning(f"Progress update failed for job {self.job_id}: {e}")
+
+
+def _init_worker():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def run_book_job(job: Dict) -> Dict:
+    """Worker-process entry point: process one book job."""
+    logger.info(f"🛠️  Worker {os.getpid()} running job {job['job_id']} ({job['book_metadata'].get('title')})")
+    return process_book_embeddings(
+        pdf_path=job["pdf_path"],
+        book_metadata=job["book_metadata"],
+        namespace=job["namespace"],
+        progress_callback=_ProgressReporter(job["job_id"], job["book_id"]),
+        force=job.get("force", False)
+    )
+
+
+# ==================== QUEUE ====================
+
+class BookJobQueue:
+    """Mongo-backed queue of book embedding jobs with a local worker-process pool."""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_attempts: int = 3,
+        poll_seconds: float = 2.0,
+        stale_seconds: float = 900.0,
+        retry_backoff_seconds: float = 30.0
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._dispatcher: Optional[threading.Thread] = None
+
+        self.stats = {
+            "claimed": 0,
+            "completed": 0,
+            "failed": 0,
+            "retried": 0,
+            "reclaimed_stale": 0
+        }
+
+    @property
+    def collection(self):
+        return db.get_collection(JOBS_COLLECTION)
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self):
+        """Create indexes, start the worker pool and the dispatcher thread (idempotent)."""
+        with self._lock:
+            if self._dispatcher and self._dispatcher.is_alive():
+                return
+            try:
+                self.collection.create_index("job_id", unique=True)
+                self.collection.create_index([("status", 1), ("run_after", 1)])
+                self.collection.create_index("book_id")
+            except Exception as e:
+                logger.warning(f"Book job index creation failed: {e}")
+
+            self._pool = self._new_pool()
+            self._stop_event.clear()
+            self._dispatcher = threading.Thread(
+                target=self._run,
+                name="book-job-dispatcher",
+                daemon=True
+            )
+            self._dispatcher.start()
+        logger.info(f"✅ Book job queue started ({self.workers} worker processes)")
+
+    def stop(self):
+        """Stop dispatching. Jobs still running here are marked stale so the next start resumes them."""
+        self._stop_event.set()
+        self._wake.set()
+        if self._dispatcher:
+            self._dispatcher.join(timeout=5)
+            self._dispatcher = None
+        with self._lock:
+            job_ids = list(self._running)
+        if job_ids:
+            try:
+                self.collection.update_many(
+                    {"job_id": {"$in": job_ids}, "status": RUNNING},
+                    {"$set": {"heartbeat_at": datetime(1970, 1, 1)}}
+                )
+            except Exception as e:
+                logger.warning(f"Could not release running book jobs: {e}")
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: forked children would inherit the parent's Mongo/gRPC clients and threads
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+
+    # ==================== PRODUCER ====================
+
+    def enqueue(
+        self,
+        book_id: str,
+        pdf_path: str,
+        book_metadata: Dict,
+        namespace: str,
+        force: bool = False
+    ) -> Dict:
+        """
+        Queue embedding generation for a book (returns the already active job if there is one).
+
+        Args:
+            book_id: MongoDB _id of the book (str)
+            pdf_path: Absolute path of the PDF
+            book_metadata: Metadata stored with each vector
+            namespace: Pinecone namespace
+            force: Bypass the ingestion cache and re-upsert every chunk
+
+        Returns:
+            The job document
+        """
+        active = self.collection.find_one(
+            {"book_id": book_id, "status": {"$in": [QUEUED, RUNNING]}},
+            {"_id": 0}
+        )
+        if active:
+            return active
+
+        now = datetime.utcnow()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "book_id": book_id,
+            "pdf_path": pdf_path,
+            "book_metadata": book_metadata,
+            "namespace": namespace,
+            "force": force,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "run_after": now,
+            "started_at": None,
+            "finished_at": None,
+            "heartbeat_at": None,
+            "worker": None
+        }
+        self.collection.insert_one(dict(job))
+        db.books.update_one(
+            {"_id": ObjectId(book_id)},
+            {"$set": {
+                "processing_status": "processing",
+                "processing_job_id": job["job_id"],
+                "processing_progress": {"stage": QUEUED, "current": 0, "total": 0, "percent": 0.0,
+                                        "message": "Waiting for a worker", "updated_at": now},
+                "updated_at": now
+            }}
+        )
+        logger.info(f"📥 Queued embedding job {job['job_id']} for book {book_id}")
+        self._wake.set()
+        return job
+
+    def retry(self, job_id: str) -> Optional[Dict]:
+        """Re-queue a failed job with a fresh attempt budget (None if not found / not failed)."""
+        now = datetime.utcnow()
+        job = self.collection.find_one_and_update(
+            {"job_id": job_id, "status": FAILED},
+            {"$set": {
+                "status": QUEUED, "attempts": 0, "run_after": now, "error": None,
+                "progress": None, "finished_at": None
+            }},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            db.books.update_one(
+                {"_id": ObjectId(job["book_id"])},
+                {"$set": {"processing_status": "processing", "processing_job_id": job_id, "updated_at": now}}
+            )
+            logger.info(f"🔁 Job {job_id} re-queued")
+            self._wake.set()
+        return job
+
+    # ==================== QUERIES ====================
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.collection.find_one({"job_id": job_id}, {"_id": 0})
+
+    def get_latest_job_for_book(self, book_id: str) -> Optional[Dict]:
+        return self.collection.find_one({"book_id": book_id}, {"_id": 0}, sort=[("created_at", -1)])
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        query = {"status": status} if status else {}
+        return list(self.collection.find(query, {"_id": 0}).sort("created_at", -1).limit(limit))
+
+    # ==================== DISPATCHER ====================
+
+    def _claim(self) -> Optional[Dict]:
+        """Atomically take the oldest runnable job (queued and due, or running with a stale heartbeat)."""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.stale_seconds)
+        for query in (
+            {"status": RUNNING, "heartbeat_at": {"$lt": stale_before}},
+            {"status": QUEUED, "run_after": {"$lte": now}}
+        ):
+            job = self.collection.find_one_and_update(
+                query,
+                {
+                    "$set": {"status": RUNNING, "started_at": now, "heartbeat_at": now, "worker": self.worker_id},
+                    "$inc": {"attempts": 1}
+                },
+                projection={"_id": 0},
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if job:
+                if query["status"] == RUNNING:
+                    self.stats["reclaimed_stale"] += 1
+                    logger.warning(f"♻️  Resuming stale job {job['job_id']} (no heartbeat since {stale_before})")
+                return job
+        return None
+
+    def _heartbeat(self):
+        with self._lock:
+            job_ids = list(self._running)
+        if job_ids:
+            self.collection.update_many(
+                {"job_id": {"$in": job_ids}, "status": RUNNING},
+                {"$set": {"heartbeat_at": datetime.utcnow()}}
+            )
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            claimed = False
+            try:
+                self._heartbeat()
+                with self._lock:
+                    free = self.workers - len(self._running)
+                if free > 0:
+                    job = self._claim()
+                    if job:
+                        self._submit(job)
+                        claimed = True
+            except Exception as e:
+                logger.error(f"❌ Book job dispatcher error: {e}")
+
+            if not claimed:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def _submit(self, job: Dict):
+        self.stats["claimed"] += 1
+        logger.info(f"🚚 Dispatching job {job['job_id']} (attempt {job['attempts']}/{job['max_attempts']})")
+        try:
+            future = self._pool.submit(run_book_job, job)
+        except BrokenProcessPool:
+            logger.warning("⚠️  Book worker pool broken, recreating")
+            self._pool = self._new_pool()
+            future = self._pool.submit(run_book_job, job)
+
+        with self._lock:
+            self._running[job["job_id"]] = future
+        future.add_done_callback(lambda done, job=job: self._finish(job, done))
+
+    def _finish(self, job: Dict, future: Future):
+        """Record a finished job; schedule a retry with backoff if attempts remain."""
+        with self._lock:
+            self._running.pop(job["job_id"], None)
+
+        try:
+            result = future.result()
+        except Exception as e:
+            # Worker crashed (e.g. OOM-killed) or the pool was shut down
+            result = {"success": False, "error": f"{type(e).__name__}: {e}", "errors": [str(e)]}
+
+        now = datetime.utcnow()
+        try:
+            if result.get("success"):
+                self.stats["completed"] += 1
+                self.collection.update_one(
+                    {"job_id": job["job_id"]},
+                    {"$set": {"status": COMPLETED, "result": result, "error": None, "finished_at": now}}
+                )
+                book_status = "completed"
+                logger.info(f"✅ Job {job['job_id']}: {result.get('embedding_count', 0)} vectors")
+            elif job["attempts"] < job["max_attempts"]:
+                self.stats["retried"] += 1
+                delay = self.retry_backoff_seconds * 2 ** (job["attempts"] - 1)
+                self.collection.update_one(
+                    {"job_id": job["job_id"]},
+                    {"$set": {
+                        "status": QUEUED, "result": result, "error": result.get("error"),
+                        "run_after": now + timedelta(seconds=delay)
+                    }}
+                )
+                logger.warning(f"⚠️  Job {job['job_id']} failed ({result.get('error')}), retrying in {delay:.0f}s")
+                return
+            else:
+                self.stats["failed"] += 1
+                self.collection.update_one(
+                    {"job_id": job["job_id"]},
+                    {"$set": {"status": FAILED, "result": result, "error": result.get("error"), "finished_at": now}}
+                )
+                book_status = "failed"
+                logger.error(f"❌ Job {job['job_id']} failed after {job['attempts']} attempts: {result.get('error')}")
+
+            # Update book with embedding info
+            db.books.update_one(
+                {"_id": ObjectId(job["book_id"])},
+                {"$set": {
+                    "has_embeddings": result.get("success", False),
+                    "embedding_count": result.get("embedding_count", 0),
+                    "total_pages": result.get("total_pages", 0),
+                    "total_chunks": result.get("total_chunks", 0),
+                    "processing_status": book_status,
+                    "processing_errors": result.get("errors", []),
+                    "updated_at": now
+                }}
+            )
+        except Exception as e:
+            logger.error(f"❌ Failed to record result of job {job['job_id']}: {e}")
+        finally:
+            self._wake.set()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            running = list(self._running)
+        counts = {}
+        try:
+            for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+                counts[row["_id"]] = row["count"]
+        except Exception as e:
+            counts = {"error": str(e)}
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "running_here": running,
+            "jobs_by_status": counts
+        }
+
+
+# Global instance
+book_job_queue = BookJobQueue(
+    workers=settings.BOOK_JOB_WORKERS,
+    max_attempts=settings.BOOK_JOB_MAX_ATTEMPTS,
+    poll_seconds=settings.BOOK_JOB_POLL_SECONDS,
+    stale_seconds=settings.BOOK_JOB_STALE_SECONDS
+)
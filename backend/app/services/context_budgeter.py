@@ -0,0 +1,281 @@
+"""
+Context Budgeter - Deduplicates retrieved chunks and fits them into a token budget.
+
+Retrieved context is wasteful in two ways:
+- Neighbouring textbook chunks overlap (pdf_processor carries the last sentences
+  of one chunk into the next), and the same passage is often returned for
+  several class levels or copied across web pages.
+- Every chunk that was retrieved went into the prompt, however many tokens it cost.
+
+Before the prompt is built, chunks are:
+1. Ordered by priority: textbook > stored LLM answers > web, and within the
+   textbook by score with a bonus for lower (foundational) classes
+2. Deduplicated: near-identical chunks (MinHash over word shingles) are dropped,
+   and text a kept chunk already covers at its start/end is trimmed
+3. Admitted until the per-mode token budget is spent
+
+The tokens saved per request are logged and counted in get_stats().
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.gemini_scheduler import estimate_tokens
+import logging
+import re
+import threading
+import zlib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+# Mersenne prime for the MinHash permutations (h * a stays below 2**63)
+_MINHASH_PRIME = (1 << 31) - 1
+
+# Source tiers in prompt priority order
+SOURCE_TIERS = ("textbook", "llm", "web")
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens for a piece of context (same estimate as the Gemini scheduler)."""
+    return estimate_tokens(text, output_tokens=0)
+
+
+class ContextBudgeter:
+    """Near-duplicate removal and per-mode token budgeting for RAG context."""
+
+    def __init__(
+        self,
+        budgets: Dict[str, int],
+        similarity_threshold: float = 0.8,
+        foundation_bonus: float = 0.02,
+        shingle_size: int = 5,
+        num_perm: int = 64,
+        min_overlap_chars: int = 40
+    ):
+        """
+        Args:
+            budgets: Context token budget per mode ("basic", "deepdive", ...)
+            similarity_threshold: Estimated Jaccard similarity above which a chunk is a duplicate
+            foundation_bonus: Score bonus per class below the student's class (textbook only)
+            shingle_size: Words per shingle
+            num_perm: MinHash signature length
+            min_overlap_chars: Shortest shared prefix/suffix that is trimmed as overlap
+        """
+        self.budgets = budgets
+        self.similarity_threshold = similarity_threshold
+        self.foundation_bonus = foundation_bonus
+        self.shingle_size = shingle_size
+        self.min_overlap_chars = min_overlap_chars
+
+        rng = np.random.RandomState(1)
+        self._perm_a = rng.randint(1, _MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self._perm_b = rng.randint(0, _MINHASH_PRIME, size=num_perm).astype(np.uint64)
+
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "duplicates_dropped": 0,
+            "overlap_chars_trimmed": 0,
+            "over_budget_dropped": 0
+        }
+        self.saved_per_request = deque(maxlen=500)
+
+    # ==================== SIMILARITY ====================
+
+    def _shingles(self, text: str) -> Set[int]:
+        words = _WORD_RE.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {zlib.crc32(" ".join(words).encode())} if words else set()
+        return {
+            zlib.crc32(" ".join(words[i:i + self.shingle_size]).encode())
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def _signatures(self, texts: List[str]) -> np.ndarray:
+        """MinHash signature matrix, one row per text."""
+        signatures = np.full((len(texts), len(self._perm_a)), _MINHASH_PRIME, dtype=np.uint64)
+        for row, text in enumerate(texts):
+            shingles = self._shingles(text)
+            if not shingles:
+                continue
+            hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles)) % _MINHASH_PRIME
+            permuted = (np.outer(self._perm_a, hashes) + self._perm_b[:, None]) % _MINHASH_PRIME
+            signatures[row] = permuted.min(axis=1)
+        return signatures
+
+    def _overlap(self, head: str, tail: str) -> int:
+        """Length of the longest suffix of `head` that is also a prefix of `tail`."""
+        if len(tail) < self.min_overlap_chars:
+            return 0
+        probe = tail[:self.min_overlap_chars]
+        start = head.find(probe)
+        while start != -1:
+            length = len(head) - start
+            if tail.startswith(head[start:]):
+                return length
+            start = head.find(probe, start + 1)
+        return 0
+
+    # ==================== SELECTION ====================
+
+    def _priority(self, tier: str, chunk: Dict, student_class: int) -> float:
+        score = chunk.get("score", 0) or 0
+        if tier == "textbook":
+            class_level = chunk.get("class", student_class) or student_class
+            score += self.foundation_bonus * max(student_class - class_level, 0)
+        return score
+
+    def select(
+        self,
+        textbook_chunks: List[Dict],
+        llm_chunks: List[Dict],
+        web_chunks: List[Dict],
+        student_class: int,
+        mode: str = "basic",
+        budget: Optional[int] = None,
+        record: bool = True
+    ) -> Tuple[Dict[str, List[Dict]], Dict]:
+        """
+        Deduplicate and budget the retrieved chunks for one prompt.
+
+        Kept chunks are copies (trimmed text where they overlapped a higher
+        priority chunk) and stay in their original order within each source.
+
+        Args:
+            textbook_chunks: Textbook chunks (with 'text', 'score', 'class')
+            llm_chunks: Stored LLM answer chunks
+            web_chunks: Web content chunks
+            student_class: Student's class (lower classes count as foundational)
+            mode: Budget to apply ("basic", "deepdive", ...)
+            budget: Override the mode's token budget
+            record: Count this call in get_stats() (one prompt = one request)
+
+        Returns:
+            (chunks by source tier, report with token counts)
+        """
+        if budget is None:
+            budget = self.budgets.get(mode, self.budgets["basic"])
+
+        candidates = []
+        for tier, chunks in zip(SOURCE_TIERS, (textbook_chunks, llm_chunks, web_chunks)):
+            for position, chunk in enumerate(chunks):
+                if chunk.get("text"):
+                    candidates.append((tier, position, chunk))
+        candidates.sort(key=lambda c: (
+            SOURCE_TIERS.index(c[0]), -self._priority(c[0], c[2], student_class)
+        ))
+
+        texts = [chunk["text"] for _, _, chunk in candidates]
+        tokens_in = sum(count_tokens(text) for text in texts)
+        signatures = self._signatures(texts)
+
+        kept: List[int] = []
+        kept_texts: List[str] = []
+        selected: Dict[str, List[Tuple[int, Dict]]] = {tier: [] for tier in SOURCE_TIERS}
+        duplicates = over_budget = trimmed_chars = tokens_out = 0
+
+        for index, (tier, position, chunk) in enumerate(candidates):
+            if kept:
+                similarity = (signatures[kept] == signatures[index]).mean(axis=1)
+                if similarity.max() >= self.similarity_threshold:
+                    duplicates += 1
+                    continue
+
+            text = texts[index]
+            for previous in kept_texts:
+                cut = self._overlap(previous, text)
+                if cut:
+                    text = text[cut:].lstrip()
+                cut = self._overlap(text, previous)
+                if cut:
+                    text = text[:len(text) - cut].rstrip()
+            trimmed_chars += len(texts[index]) - len(text)
+            # Short chunks (definitions, formula lines) are kept unless trimming left only a scrap
+            if len(text) < len(texts[index]) and len(text) < self.min_overlap_chars:
+                duplicates += 1
+                continue
+
+            tokens = count_tokens(text)
+            if tokens_out + tokens > budget:
+                if kept:
+                    over_budget += 1
+                    continue
+                # Never send an empty context: cut the top chunk down to the budget
+                text = text[:budget * 4]
+                tokens = count_tokens(text)
+
+            tokens_out += tokens
+            kept.append(index)
+            kept_texts.append(text)
+            selected[tier].append((position, {**chunk, "text": text}))
+
+        result = {
+            tier: [chunk for _, chunk in sorted(chunks, key=lambda c: c[0])]
+            for tier, chunks in selected.items()
+        }
+        report = {
+            "mode": mode,
+            "budget": budget,
+            "chunks_in": len(candidates),
+            "chunks_out": len(kept),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": tokens_in - tokens_out,
+            "duplicates_dropped": duplicates,
+            "overlap_chars_trimmed": trimmed_chars,
+            "over_budget_dropped": over_budget
+        }
+
+        if not record:
+            return result, report
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["tokens_in"] += tokens_in
+            self.stats["tokens_out"] += tokens_out
+            self.stats["duplicates_dropped"] += duplicates
+            self.stats["overlap_chars_trimmed"] += trimmed_chars
+            self.stats["over_budget_dropped"] += over_budget
+            self.saved_per_request.append(report["tokens_saved"])
+
+        return result, report
+
+    def deduplicate(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        Drop near-duplicate / overlapping chunks from one list, without a token budget.
+
+        Not counted in get_stats(), which tracks prompt budgeting.
+        """
+        selected, _report = self.select(chunks, [], [], student_class=0, budget=float("inf"), record=False)
+        return selected["textbook"]
+
+    def get_stats(self) -> Dict:
+        """Tokens in/out/saved and how many chunks were dropped for each reason."""
+        with self._lock:
+            stats = dict(self.stats)
+            saved = list(self.saved_per_request)
+        tokens_saved = stats["tokens_in"] - stats["tokens_out"]
+        return {
+            **stats,
+            "tokens_saved": tokens_saved,
+            "saved_fraction": round(tokens_saved / stats["tokens_in"], 3) if stats["tokens_in"] else 0.0,
+            "avg_tokens_saved_per_request": round(sum(saved) / len(saved), 1) if saved else 0.0,
+            "budgets": self.budgets,
+            "similarity_threshold": self.similarity_threshold
+        }
+
+
+# Global instance
+context_budgeter = ContextBudgeter(
+    budgets={
+        "basic": settings.RAG_CONTEXT_TOKENS_BASIC,
+        "deepdive": settings.RAG_CONTEXT_TOKENS_DEEPDIVE
+    },
+    similarity_threshold=settings.RAG_CONTEXT_DEDUP_THRESHOLD,
+    foundation_bonus=settings.RAG_CONTEXT_FOUNDATION_BONUS
+)
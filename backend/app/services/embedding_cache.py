@@ -0,0 +1,280 @@
+"""
+Embedding Cache - Persistent cache for query embeddings.
+
+Students ask the same questions over and over (chapter exercises across a class,
+re-asks after a refresh), and every ask used to pay for a Gemini embedding call.
+Query embeddings are cached under (model, task_type, hash of the text with
+case and whitespace folded):
+
+- In-process LRU of packed float32 vectors (per worker)
+- SQLite blob table on disk (shared across workers/restarts), bounded to
+  EMBEDDING_CACHE_DISK_MAX_ENTRIES by evicting the least recently used rows.
+  A relative path is resolved against the backend directory; if the store
+  cannot be opened the cache carries on memory-only.
+"""
+
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from app.core.config import settings
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Relative disk paths are resolved here, not against the working directory
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """Two-tier (memory + SQLite) embedding cache with LRU eviction."""
+
+    # Only trim the disk tier every N inserts (COUNT(*) is not free)
+    EVICT_CHECK_EVERY = 500
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        disk_path: Optional[str] = "cache/embeddings.sqlite3",
+        disk_max_entries: int = 200_000
+    ):
+        self.max_entries = max_entries
+        if disk_path and not Path(disk_path).is_absolute():
+            disk_path = str(BACKEND_DIR / disk_path)
+        self.disk_path = disk_path or None
+        self.disk_max_entries = disk_max_entries
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._inserts_since_check = 0
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0
+        }
+
+    # ==================== KEYS ====================
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        """
+        Cache key from model, task type and text with only case and whitespace folded.
+
+        Punctuation and symbols stay part of the key: "5+3" and "5-3" are different
+        queries with different embeddings.
+        """
+        text = re.sub(r"\s+", " ", text or "").strip().casefold()
+        raw = f"{model}|{task_type}|{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ==================== DISK TIER ====================
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """
+        Open the SQLite store on first use (caller holds _disk_lock).
+
+        If it cannot be opened (read-only or invalid path, corrupt file) the disk
+        tier is disabled and None is returned.
+        """
+        if self._conn is None and self.disk_path:
+            try:
+                Path(self.disk_path).parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(self.disk_path, check_same_thread=False, timeout=5)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+            except (OSError, sqlite3.Error) as e:
+                self.stats["disk_errors"] += 1
+                logger.warning(f"Embedding cache disk tier disabled ({self.disk_path}): {e}")
+                self.disk_path = None
+                return None
+            self._conn = conn
+            logger.info(f"✅ Embedding cache disk tier: {self.disk_path}")
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        try:
+            with self._disk_lock:
+                conn = self._connection()
+                if conn is None:
+                    return None
+                row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                return row[0]
+        except sqlite3.Error as e:
+            self.stats["disk_errors"] += 1
+            logger.warning(f"Embedding cache disk lookup failed: {e}")
+            return None
+
+    def _disk_put(self, key: str, model: str, blob: bytes):
+        try:
+            with self._disk_lock:
+                conn = self._connection()
+                if conn is None:
+                    return
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (key, model, blob, time.time())
+                )
+                self._inserts_since_check += 1
+                if self._inserts_since_check >= self.EVICT_CHECK_EVERY:
+                    self._inserts_since_check = 0
+                    self._disk_evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            self.stats["disk_errors"] += 1
+            logger.warning(f"Embedding cache disk store failed: {e}")
+
+    def _disk_evict(self, conn: sqlite3.Connection):
+        """Drop least recently used rows above disk_max_entries."""
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.disk_max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+            self.stats["disk_evictions"] += excess
+
+    # ==================== MEMORY TIER ====================
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+            return blob
+
+    def _memory_put(self, key: str, blob: bytes):
+        with self._lock:
+            self._entries[key] = blob
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["memory_evictions"] += 1
+
+    # ==================== PUBLIC API ====================
+
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        """Look up a cached embedding (None on miss)."""
+        key = self.make_key(model, task_type, text)
+
+        blob = self._memory_get(key)
+        if blob is not None:
+            self.stats["memory_hits"] += 1
+            return _unpack(blob)
+
+        if self.disk_path:
+            blob = self._disk_get(key)
+            if blob is not None:
+                self.stats["disk_hits"] += 1
+                self._memory_put(key, blob)
+                return _unpack(blob)
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, model: str, task_type: str, text: str, vector: List[float]):
+        """Store an embedding in both tiers."""
+        key = self.make_key(model, task_type, text)
+        blob = _pack(vector)
+
+        self._memory_put(key, blob)
+        if self.disk_path:
+            self._disk_put(key, model, blob)
+        self.stats["stores"] += 1
+
+    def get_or_compute(
+        self,
+        model: str,
+        task_type: str,
+        text: str,
+        compute: Callable[[str], List[float]]
+    ) -> List[float]:
+        """
+        Return the cached embedding, computing and storing it on a miss.
+
+        Args:
+            model: Embedding model name (part of the key)
+            task_type: e.g. "retrieval_query" (part of the key)
+            text: Text to embed
+            compute: Called with `text` on a miss
+        """
+        vector = self.get(model, task_type, text)
+        if vector is None:
+            vector = list(compute(text))
+            self.put(model, task_type, text, vector)
+        return vector
+
+    def clear(self) -> int:
+        """Clear both tiers. Returns number of disk rows removed."""
+        with self._lock:
+            self._entries.clear()
+
+        if not self.disk_path:
+            return 0
+        try:
+            with self._disk_lock:
+                conn = self._connection()
+                if conn is None:
+                    return 0
+                removed = conn.execute("DELETE FROM embeddings").rowcount
+                conn.commit()
+                return removed
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache disk clear failed: {e}")
+            return 0
+
+    def get_stats(self) -> Dict:
+        """Hit/miss/eviction counters and hit rate."""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        with self._lock:
+            size = len(self._entries)
+        return {
+            **self.stats,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": size,
+            "max_entries": self.max_entries,
+            "disk_path": self.disk_path,
+            "disk_max_entries": self.disk_max_entries
+        }
+
+
+# Global instance
+embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    disk_path=settings.EMBEDDING_CACHE_DISK_PATH,
+    disk_max_entries=settings.EMBEDDING_CACHE_DISK_MAX_ENTRIES
+)
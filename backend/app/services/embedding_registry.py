@@ -0,0 +1,442 @@
+"""
+Embedding Model Registry
+
+Every Pinecone index declares which embedding model (and dimension) its vectors
+live in, and every reader and writer resolves its embedder through this registry.
+This keeps query vectors and stored vectors in the same space - e.g. the
+`ncert-llm` answer cache used to be written with all-mpnet-base-v2 but queried
+with Gemini text-embedding-004, so its similarity scores were meaningless.
+
+Index bindings (configurable via settings):
+- textbook -> EMBEDDING_MODEL_TEXTBOOK (Gemini text-embedding-004)
+- web      -> EMBEDDING_MODEL_WEB (all-mpnet-base-v2, the model its vectors were written with)
+- llm      -> EMBEDDING_MODEL_LLM (all-mpnet-base-v2, likewise)
+
+Local (sentence-transformers) models are loaded once per process through
+model_registry and shared by every service that uses them. Concurrent query embeddings are micro-batched:
+requests arriving within EMBEDDING_BATCH_WINDOW_MS go through a single `encode`.
+"""
+
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+from app.core.config import settings
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingModelSpec:
+    """Declaration of one embedding model."""
+
+    def __init__(
+        self,
+        name: str,
+        provider: str,
+        model_id: str,
+        dimension: int,
+        query_task_type: Optional[str] = None,
+        document_task_type: Optional[str] = None
+    ):
+        self.name = name
+        self.provider = provider  # "gemini" or "local"
+        self.model_id = model_id
+        self.dimension = dimension
+        self.query_task_type = query_task_type
+        self.document_task_type = document_task_type
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "provider": self.provider,
+            "model_id": self.model_id,
+            "dimension": self.dimension
+        }
+
+
+# Known embedding models
+EMBEDDING_MODELS: Dict[str, EmbeddingModelSpec] = {
+    "gemini-text-embedding-004": EmbeddingModelSpec(
+        name="gemini-text-embedding-004",
+        provider="gemini",
+        model_id="models/text-embedding-004",
+        dimension=768,
+        query_task_type="retrieval_query",
+        document_task_type="retrieval_document"
+    ),
+    "all-mpnet-base-v2": EmbeddingModelSpec(
+        name="all-mpnet-base-v2",
+        provider="local",
+        model_id="sentence-transformers/all-mpnet-base-v2",
+        dimension=768
+    )
+}
+
+
+class Embedder(ABC):
+    """Base embedder: one model, query and document embedding."""
+
+    def __init__(self, spec: EmbeddingModelSpec):
+        self.spec = spec
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, served from the embedding cache when it was seen before."""
+        from app.services.embedding_cache import embedding_cache
+        return embedding_cache.get_or_compute(
+            self.spec.model_id,
+            self.spec.query_task_type or "query",
+            text,
+            self._embed_query
+        )
+
+    @abstractmethod
+    def _embed_query(self, text: str) -> List[float]:
+        """Embed one query (uncached)."""
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts for storage."""
+
+
+class GeminiEmbedder(Embedder):
+    """Gemini embedding API (key chosen by the scheduler; documents are sent in batches)."""
+
+    # batchEmbedContents accepts at most 100 texts per request
+    MAX_BATCH_SIZE = 100
+
+    def _embed(self, text: str, task_type: Optional[str]) -> List[float]:
+        from app.services.gemini_client_pool import gemini_client_pool
+        from app.services.gemini_scheduler import gemini_embedding_scheduler, estimate_tokens
+
+        def call(api_key: str) -> List[float]:
+            result = gemini_client_pool.embed_content(
+                api_key,
+                model=self.spec.model_id,
+                content=text,
+                task_type=task_type
+            )
+            return result['embedding']
+
+        return gemini_embedding_scheduler.run(call, estimated_tokens=estimate_tokens(text, output_tokens=0))
+
+    def _embed_batch(self, texts: List[str], task_type: Optional[str]) -> List[List[float]]:
+        """One request for up to MAX_BATCH_SIZE texts; the scheduler meters its summed tokens."""
+        from app.services.gemini_client_pool import gemini_client_pool
+        from app.services.gemini_scheduler import gemini_embedding_scheduler, estimate_tokens
+
+        def call(api_key: str) -> List[List[float]]:
+            result = gemini_client_pool.embed_content(
+                api_key,
+                model=self.spec.model_id,
+                content=texts,
+                task_type=task_type
+            )
+            return result['embedding']
+
+        vectors = gemini_embedding_scheduler.run(
+            call,
+            estimated_tokens=sum(estimate_tokens(text, output_tokens=0) for text in texts)
+        )
+        if len(vectors) != len(texts):
+            raise RuntimeError(f"Gemini returned {len(vectors)} embeddings for {len(texts)} texts")
+        return vectors
+
+    def _embed_query(self, text: str) -> List[float]:
+        return self._embed(text, self.spec.query_task_type)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.MAX_BATCH_SIZE):
+            vectors.extend(self._embed_batch(texts[start:start + self.MAX_BATCH_SIZE], self.spec.document_task_type))
+        return vectors
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-text encode calls into batched calls.
+
+    Callers block on `submit`; a daemon thread takes the first pending text, waits
+    up to `window_ms` for more (or until `max_batch_size`), encodes them together
+    and hands each caller its own vector.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], List[List[float]]],
+        window_ms: float = 5.0,
+        max_batch_size: int = 64,
+        name: str = "embed-batch"
+    ):
+        self.encode_batch = encode_batch
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> List[float]:
+        """Encode one text, batched with any concurrent callers."""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self) -> List:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                vectors = self.encode_batch([text for text, _ in batch])
+                if len(vectors) != len(batch):
+                    raise RuntimeError(f"Encoder returned {len(vectors)} vectors for {len(batch)} texts")
+            except Exception as e:
+                # Every caller is blocked on its future: fail them all rather than leave any waiting
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def get_stats(self) -> Dict:
+        return {
+            "window_ms": self.window_seconds * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "pending": self._queue.qsize()
+        }
+
+
+class LocalEmbedder(Embedder):
+    """In-process sentence-transformers model (loaded on first use, shared per process)."""
+
+    def __init__(self, spec: EmbeddingModelSpec):
+        super().__init__(spec)
+        self._model = None
+        self.batcher = None
+        if settings.EMBEDDING_BATCH_WINDOW_MS > 0:
+            self.batcher = MicroBatcher(
+                self._encode_batch,
+                window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                name=f"embed-batch-{spec.name}"
+            )
+
+    @property
+    def model(self):
+        if self._model is None:
+            from app.services.model_registry import model_registry
+            self._model = model_registry.get_sentence_transformer(self.spec.model_id)
+        return self._model
+
+    def _encode_batch(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.model.encode(texts, show_progress_bar=False)]
+
+    def _embed_query(self, text: str) -> List[float]:
+        if self.batcher is None:
+            return self.model.encode(text, show_progress_bar=False).tolist()
+        return self.batcher.submit(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode_batch(texts)
+
+    def get_stats(self) -> Dict:
+        return {
+            "loaded": self._model is not None,
+            "batching": self.batcher.get_stats() if self.batcher else None
+        }
+
+
+EMBEDDER_PROVIDERS = {
+    "gemini": GeminiEmbedder,
+    "local": LocalEmbedder
+}
+
+
+class EmbeddingRegistry:
+    """Resolves the embedding model and embedder for each Pinecone index."""
+
+    def __init__(self, index_bindings: Dict[str, str]):
+        for index_key, model_name in index_bindings.items():
+            if model_name not in EMBEDDING_MODELS:
+                raise ValueError(f"Unknown embedding model '{model_name}' for index '{index_key}'")
+        self.index_bindings = index_bindings
+        self._embedders: Dict[str, Embedder] = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, index_key: str) -> EmbeddingModelSpec:
+        """Get the embedding model declared for an index ("textbook", "web", "llm")."""
+        return EMBEDDING_MODELS[self.index_bindings[index_key]]
+
+    def get_embedder(self, index_key: str) -> Embedder:
+        """Get the (shared) embedder for an index."""
+        return self.get_model_embedder(self.get_model(index_key).name)
+
+    def get_model_embedder(self, model_name: str) -> Embedder:
+        """
+        Get the shared embedder for a model by name.
+
+        Used by ingestion code that is tied to a specific model rather than an
+        index binding (e.g. PhysicsEmbedder -> "all-mpnet-base-v2").
+        """
+        spec = EMBEDDING_MODELS[model_name]
+        with self._lock:
+            if spec.name not in self._embedders:
+                self._embedders[spec.name] = EMBEDDER_PROVIDERS[spec.provider](spec)
+            return self._embedders[spec.name]
+
+    def _get_index(self, index_key: str):
+        from app.db.mongo import pinecone_db, pinecone_web_db, pinecone_llm_db
+        return {
+            "textbook": pinecone_db,
+            "web": pinecone_web_db,
+            "llm": pinecone_llm_db
+        }[index_key].index
+
+    def check_consistency(self, sample_size: int = 20) -> Dict[str, Dict]:
+        """
+        Compare each connected index against its declared embedding model.
+
+        Checks the index dimension and samples vectors for an `embedding_model`
+        metadata tag written by a different model. Vectors without a tag (written
+        before every writer tagged them) are reported as "untagged", not as a mismatch.
+
+        Returns:
+            Dict of index_key -> report (also logged as warnings on mismatch)
+        """
+        report = {}
+
+        for index_key in self.index_bindings:
+            spec = self.get_model(index_key)
+            entry = {"model": spec.name, "status": "ok"}
+            report[index_key] = entry
+
+            index = self._get_index(index_key)
+            if index is None:
+                entry["status"] = "not_connected"
+                continue
+
+            try:
+                stats = index.describe_index_stats()
+                dimension = stats.get('dimension')
+                entry["index_dimension"] = dimension
+                if dimension and dimension != spec.dimension:
+                    entry["status"] = "dimension_mismatch"
+                    logger.error(
+                        f"❌ Embedding check: '{index_key}' index has dimension {dimension} "
+                        f"but is bound to {spec.name} ({spec.dimension})"
+                    )
+                    continue
+
+                # Sample vectors from every namespace and inspect their model tag
+                probe = [1.0] + [0.0] * (spec.dimension - 1)
+                mismatched = {}
+                untagged = 0
+                for namespace in (stats.get('namespaces') or {"": {}}).keys():
+                    results = index.query(
+                        namespace=namespace,
+                        vector=probe,
+                        top_k=sample_size,
+                        include_metadata=True
+                    )
+                    for match in results.get('matches', []):
+                        tag = (match.get('metadata') or {}).get('embedding_model')
+                        if tag is None:
+                            untagged += 1
+                        elif tag != spec.name:
+                            mismatched[tag] = mismatched.get(tag, 0) + 1
+
+                if untagged:
+                    entry["sampled_untagged"] = untagged
+
+                if mismatched:
+                    entry["status"] = "model_mismatch"
+                    entry["sampled_mismatches"] = mismatched
+                    logger.warning(
+                        f"⚠️ Embedding check: '{index_key}' index is bound to {spec.name} "
+                        f"but sampled vectors were written by {mismatched}. "
+                        f"Run scripts/reembed_vectors.py --index {index_key} to migrate them."
+                    )
+                elif untagged:
+                    # Written before writers tagged their vectors: unknown, not wrong
+                    entry["status"] = "untagged"
+                    logger.info(
+                        f"ℹ️  Embedding check: '{index_key}' index has {untagged} sampled vectors "
+                        f"without an embedding_model tag; their model cannot be verified"
+                    )
+                else:
+                    logger.info(f"✅ Embedding check: '{index_key}' index consistent with {spec.name}")
+
+            except Exception as e:
+                entry["status"] = "error"
+                entry["error"] = str(e)
+                logger.warning(f"Embedding consistency check failed for '{index_key}': {e}")
+
+        return report
+
+    def describe(self) -> Dict[str, Dict]:
+        """Index -> declared model details."""
+        return {index_key: self.get_model(index_key).to_dict() for index_key in self.index_bindings}
+
+    def local_embedders(self) -> List[LocalEmbedder]:
+        """Local embedders bound to an index (candidates for startup warm-up)."""
+        names = {self.get_model(index_key).name for index_key in self.index_bindings}
+        return [
+            self.get_model_embedder(name)
+            for name in sorted(names)
+            if EMBEDDING_MODELS[name].provider == "local"
+        ]
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Load / micro-batching stats for the local embedders created so far."""
+        with self._lock:
+            embedders = dict(self._embedders)
+        return {
+            name: embedder.get_stats()
+            for name, embedder in embedders.items()
+            if isinstance(embedder, LocalEmbedder)
+        }
+
+
+# Global instance
+embedding_registry = EmbeddingRegistry({
+    "textbook": settings.EMBEDDING_MODEL_TEXTBOOK,
+    "web": settings.EMBEDDING_MODEL_WEB,
+    "llm": settings.EMBEDDING_MODEL_LLM
+})
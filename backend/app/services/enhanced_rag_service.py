@@ -7,18 +7,64 @@ Implements intelligent cross-index retrieval:
 - Triple-Index: Textbook + Web Scraped + LLM Generated content
 """
 
+from app.core.config import settings
 from app.services.gemini_service import gemini_service
 from app.db.mongo import pinecone_db, pinecone_web_db, pinecone_llm_db
 from app.services.llm_storage_service import llm_storage_service
 from app.services.web_scraper_service import web_scraper_service
+from app.services.retrieval_orchestrator import retrieval_orchestrator
+from app.services.answer_cache import answer_cache
+from app.services.llm_usage_tracker import llm_usage_tracker
+from app.services.embedding_registry import EmbeddingRegistry, embedding_registry
+from app.services.context_budgeter import context_budgeter
+from app.services.reranker import Reranker, reranker
 import logging
 import re
-from typing import List, Dict, Tuple, Optional
-import google.generativeai as genai
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Dict, Tuple, Optional
 
 logger = logging.getLogger(__name__)
 
 
+class QueryContext:
+    """
+    Per-request query state shared by all retrieval paths.
+    
+    The question embedding is computed lazily on first access and then reused
+    by the textbook, LLM-answer and web-content lookups of the same request.
+    Embeddings are cached per model, so indexes bound to the same model in the
+    embedding registry share one vector. `embedding_calls` counts how many
+    embedding round trips were made, which should be exactly 1 per answered
+    question while all indexes use the same model.
+    """
+    
+    def __init__(self, query_text: str, registry: EmbeddingRegistry = embedding_registry):
+        self.query_text = query_text
+        self._registry = registry
+        self._embeddings: Dict[str, List[float]] = {}  # model name -> vector
+        self._lock = threading.Lock()
+        self.embedding_calls = 0
+    
+    def embedding_for(self, index_key: str) -> List[float]:
+        """Question embedding in the model space of `index_key` ("textbook", "web", "llm")."""
+        model_name = self._registry.get_model(index_key).name
+        if model_name not in self._embeddings:
+            with self._lock:
+                if model_name not in self._embeddings:
+                    embedder = self._registry.get_embedder(index_key)
+                    self._embeddings[model_name] = embedder.embed_query(self.query_text)
+                    self.embedding_calls += 1
+        return self._embeddings[model_name]
+    
+    @property
+    def embedding(self) -> List[float]:
+        """Question embedding for the textbook index."""
+        return self.embedding_for("textbook")
+
+
 class EnhancedRAGService:
     """
     Enhanced RAG service with multi-index progressive learning.
@@ -29,6 +75,25 @@ class EnhancedRAGService:
     - Intelligent namespace/index routing
     """
     
+    # Retrieval settings for stream_answer (same as the blocking answer_* methods)
+    STREAM_MODES = {
+        "basic": {
+            "retrieval_mode": "basic", "chunks_per_class": 5, "llm_top_k": 2, "web_top_k": 3,
+            "cache_hit_score": 0.95, "llm_threshold": 0.75, "quality_score": 0.9,
+            "scrape_threshold": 5, "scrape_sources": 2, "scrape_requery": False
+        },
+        "annotation": {
+            "retrieval_mode": "basic", "chunks_per_class": 5, "llm_top_k": 3, "web_top_k": 2,
+            "cache_hit_score": 0.90, "llm_threshold": 0.65, "quality_score": 0.9,
+            "scrape_threshold": None, "scrape_sources": 0, "scrape_requery": False
+        },
+        "deepdive": {
+            "retrieval_mode": "deepdive", "chunks_per_class": 8, "llm_top_k": 3, "web_top_k": 10,
+            "cache_hit_score": 0.95, "llm_threshold": 0.75, "quality_score": 0.95,
+            "scrape_threshold": 8, "scrape_sources": 3, "scrape_requery": True
+        }
+    }
+    
     def __init__(self):
         self.gemini = gemini_service
         self.textbook_db = pinecone_db  # ncert-all-subjects index
@@ -39,12 +104,38 @@ class EnhancedRAGService:
         self.llm_storage = llm_storage_service
         self.web_scraper = web_scraper_service
         
-        # CRITICAL FIX: Use same embedding model as data upload
-        # Data was uploaded using sentence-transformers, so we must use it for queries too!
-        self.embedding_model_name = 'models/text-embedding-004'
-        logger.info("✅ RAG Service: Using Gemini text-embedding-004 for embeddings")
+        # Exact-match answer cache in front of the vector LLM cache
+        self.answer_cache = answer_cache
+        
+        # Concurrent textbook / LLM / web lookups with per-branch timings
+        self.retrieval = retrieval_orchestrator
+        
+        # Dedup + per-mode token budget for prompt context
+        self.context_budgeter = context_budgeter
+        
+        # Rerank stage between textbook retrieval and the prompt (RAG_RERANK_STRATEGY)
+        self.reranker = reranker
+        
+        # CRITICAL: Query embeddings must match the model each index was written with.
+        # Models are declared per index in the embedding registry.
+        for index_key, model in embedding_registry.describe().items():
+            logger.info(f"✅ RAG Service: {index_key} index embeddings via {model['name']}")
         logger.info("✅ Triple-Index System: Textbook + Web + LLM content")
         
+        # Bounded pool for concurrent per-class textbook queries (see query_multi_class)
+        self._class_query_executor = ThreadPoolExecutor(
+            max_workers=settings.RAG_CLASS_QUERY_WORKERS,
+            thread_name_prefix="rag-class-query"
+        )
+        
+        # Embedding usage counters (see QueryContext)
+        self.questions_answered = 0
+        self.embedding_calls_total = 0
+        
+        # Streaming latency samples in ms (see stream_answer)
+        self.stream_ttft_ms = deque(maxlen=500)
+        self.stream_total_ms = deque(maxlen=500)
+        
         # Subject to namespace mapping for ncert-all-subjects index
         self.subject_namespaces = {
             "Mathematics": "mathematics",
@@ -76,28 +167,79 @@ class EnhancedRAGService:
         }
 
     def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding using Gemini text-embedding-004.
+        """Generate a query embedding for the textbook index.
         
         CRITICAL: Must use same model as PDF upload for retrieval to work!
-        Returns 768-dimensional embedding vector.
+        The model is resolved through the embedding registry (768-dim by default).
         """
         try:
-            # Configure API key before embedding generation
-            from app.services.gemini_key_manager import gemini_key_manager
-            api_key = gemini_key_manager.get_available_key()
-            genai.configure(api_key=api_key)
-            
-            result = genai.embed_content(
-                model=self.embedding_model_name,
-                content=text,
-                task_type="retrieval_query"
-            )
-            return result['embedding']
+            return embedding_registry.get_embedder("textbook").embed_query(text)
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
             raise
+    
+    def create_query_context(self, query_text: str) -> QueryContext:
+        """Create a per-request context that embeds `query_text` at most once."""
+        return QueryContext(query_text)
+    
+    def _resolve_query_context(
+        self,
+        query_text: str,
+        query_context: Optional[QueryContext]
+    ) -> QueryContext:
+        """Reuse the caller's context if it is for the same text, else start a new one."""
+        if query_context is not None and query_context.query_text == query_text:
+            return query_context
+        return self.create_query_context(query_text)
+    
+    def _record_query_context(self, query_context: QueryContext):
+        """Accumulate per-question embedding usage into service-wide counters."""
+        self.questions_answered += 1
+        self.embedding_calls_total += query_context.embedding_calls
+        logger.info(f"   Embedding calls for this question: {query_context.embedding_calls}")
+    
+    def _cache_answer(
+        self,
+        question: str,
+        subject: str,
+        student_class: int,
+        chapter: Optional[int],
+        mode: str,
+        answer: str,
+        source_chunks: List[Dict]
+    ):
+        """Store a sourced answer in the exact-match cache (fallback answers are not cached)."""
+        if answer and source_chunks:
+            self.answer_cache.put(question, subject, student_class, chapter, mode, answer, source_chunks)
+    
+    def get_embedding_stats(self) -> Dict:
+        """Embedding calls made per answered question (should stay at 1.0)."""
+        return {
+            "questions_answered": self.questions_answered,
+            "embedding_calls": self.embedding_calls_total,
+            "embedding_calls_per_question": round(
+                self.embedding_calls_total / self.questions_answered, 3
+            ) if self.questions_answered else 0.0
+        }
 
-
+    def get_stream_stats(self) -> Dict:
+        """Time-to-first-token and total time of recent streamed answers."""
+        def summary(samples) -> Dict:
+            ordered = sorted(samples)
+            if not ordered:
+                return {"count": 0}
+            return {
+                "count": len(ordered),
+                "avg_ms": round(sum(ordered) / len(ordered), 1),
+                "p50_ms": round(ordered[len(ordered) // 2], 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+            }
+        
+        return {
+            "time_to_first_token": summary(self.stream_ttft_ms),
+            "total": summary(self.stream_total_ms)
+        }
+    
     def _clean_markdown_formatting(self, text: str) -> str:
         """
         Clean markdown formatting to make text more readable for display.
@@ -162,6 +304,180 @@ class EnhancedRAGService:
             # Example: Class 10 Math → [5, 6, 7, 8, 9, 10]
             return available_classes
     
+    def _build_class_filter(
+        self,
+        class_levels: List[int],
+        subject: str,
+        chapter: Optional[int] = None
+    ) -> Dict:
+        """
+        Build the textbook metadata filter for one or more class levels.
+        
+        Pinecone stores class_level and chapter_number as INTEGERS (from pdf_processor.py).
+        """
+        if len(class_levels) == 1:
+            class_filter = {"$eq": class_levels[0]}
+        else:
+            class_filter = {"$in": class_levels}
+        
+        metadata_filter = {
+            "class_level": class_filter,
+            "subject": subject
+        }
+        
+        if chapter is not None:
+            metadata_filter["chapter_number"] = chapter
+        
+        return metadata_filter
+    
+    def _query_class_levels(
+        self,
+        namespace: str,
+        query_embedding: List[float],
+        class_levels: List[int],
+        subject: str,
+        chapter: Optional[int],
+        top_k: int,
+        include_values: bool = False
+    ) -> List[Dict]:
+        """Run one textbook index query restricted to `class_levels`."""
+        results = self.textbook_db.index.query(
+            namespace=namespace,
+            vector=query_embedding,
+            top_k=top_k,
+            filter=self._build_class_filter(class_levels, subject, chapter),
+            include_metadata=True,
+            include_values=include_values
+        )
+        return results.get('matches', [])
+    
+    def _fetch_class_matches(
+        self,
+        namespace: str,
+        query_embedding: List[float],
+        classes_to_search: List[int],
+        subject: str,
+        chapter: Optional[int],
+        chunks_per_class: int,
+        strategy: str,
+        include_values: bool = False
+    ) -> Dict[int, List[Dict]]:
+        """
+        Fetch raw matches for every class level using the given strategy.
+        
+        Strategies:
+        - "parallel": one query per class, all in flight at once on a bounded pool
+        - "single": one `$in` query over all classes, per-class quota applied client-side
+        - "serial": one query per class, one after another (original behaviour)
+        
+        `include_values` also returns the stored vectors (needed by the MMR reranker).
+        
+        Returns:
+            Dict of class_level -> matches (missing key = that class query failed)
+        """
+        matches_by_class: Dict[int, List[Dict]] = {}
+        
+        if strategy == "single" and len(classes_to_search) > 1:
+            # Over-fetch so every class can fill its quota; a class that dominates
+            # the top scores can still crowd out the others, as with any top-k.
+            try:
+                matches = self._query_class_levels(
+                    namespace, query_embedding, classes_to_search, subject, chapter,
+                    top_k=chunks_per_class * len(classes_to_search),
+                    include_values=include_values
+                )
+            except Exception as query_error:
+                logger.warning(f"  ✗ Multi-class $in query failed: {query_error}")
+                return matches_by_class
+            
+            for class_level in classes_to_search:
+                matches_by_class[class_level] = []
+            for match in matches:  # Already sorted by score (descending)
+                class_level = match.get('metadata', {}).get('class_level')
+                try:
+                    class_level = int(class_level)
+                except (TypeError, ValueError):
+                    continue
+                bucket = matches_by_class.get(class_level)
+                if bucket is not None and len(bucket) < chunks_per_class:
+                    bucket.append(match)
+            return matches_by_class
+        
+        if strategy == "parallel" and len(classes_to_search) > 1:
+            futures = {
+                class_level: self._class_query_executor.submit(
+                    self._query_class_levels,
+                    namespace, query_embedding, [class_level], subject, chapter, chunks_per_class,
+                    include_values
+                )
+                for class_level in classes_to_search
+            }
+            for class_level, future in futures.items():
+                try:
+                    matches_by_class[class_level] = future.result()
+                except Exception as class_error:
+                    logger.warning(f"  ✗ Class {class_level} query failed: {class_error}")
+            return matches_by_class
+        
+        for class_level in classes_to_search:
+            try:
+                matches_by_class[class_level] = self._query_class_levels(
+                    namespace, query_embedding, [class_level], subject, chapter, chunks_per_class,
+                    include_values
+                )
+            except Exception as class_error:
+                logger.warning(f"  ✗ Class {class_level} query failed: {class_error}")
+        return matches_by_class
+    
+    def _collect_class_chunks(
+        self,
+        matches_by_class: Dict[int, List[Dict]],
+        classes_to_search: List[int],
+        subject: str,
+        mode: str
+    ) -> Tuple[List[Dict], List[Optional[List[float]]]]:
+        """
+        Turn raw per-class matches into textbook chunks above the mode's score threshold.
+        
+        Returns:
+            Tuple of (chunks, stored vectors aligned with chunks; None where not fetched)
+        """
+        # Dynamic threshold based on mode
+        threshold = 0.3 if mode == "basic" else 0.2
+        
+        chunks = []
+        vectors = []
+        
+        for class_level in classes_to_search:
+            matches = matches_by_class.get(class_level)
+            if not matches:
+                continue
+            
+            class_chunks = 0
+            for match in matches:
+                score = match.get('score', 0)
+                
+                if score >= threshold:
+                    metadata = match.get('metadata', {})
+                    chunk_data = {
+                        'id': match.get('id'),
+                        'text': metadata.get('text', ''),
+                        'class': class_level,
+                        'subject': subject,
+                        'chapter': metadata.get('chapter'),
+                        'page': metadata.get('page'),
+                        'score': score,
+                        'source': 'textbook'
+                    }
+                    chunks.append(chunk_data)
+                    vectors.append(match.get('values') or None)
+                    class_chunks += 1
+            
+            if class_chunks > 0:
+                logger.info(f"  ✓ Class {class_level}: {class_chunks} chunks (scores: {[round(m['score'], 2) for m in matches[:3]]})")
+        
+        return chunks, vectors
+    
     def query_multi_class(
         self,
         query_text: str,
@@ -169,7 +485,10 @@ class EnhancedRAGService:
         student_class: int,
         chapter: Optional[int] = None,
         mode: str = "basic",
-        chunks_per_class: int = 5
+        chunks_per_class: int = 5,
+        query_context: Optional[QueryContext] = None,
+        strategy: Optional[str] = None,
+        reranker: Optional[Reranker] = None
     ) -> Tuple[List[Dict], Dict[int, int]]:
         """
         Query across multiple class levels for progressive learning.
@@ -181,77 +500,51 @@ class EnhancedRAGService:
             chapter: Optional chapter filter (None for all chapters)
             mode: "basic" or "deepdive"
             chunks_per_class: Max chunks per class level
+            query_context: Optional per-request context holding the question embedding
+            strategy: "parallel", "single" or "serial" (defaults to settings.RAG_CLASS_QUERY_STRATEGY)
+            reranker: Rerank stage to apply (defaults to self.reranker)
         
         Returns:
             Tuple of (chunks, class_distribution)
         """
         try:
-            # Get embedding using sentence-transformers (CRITICAL: Must match data upload model!)
-            query_embedding = self.generate_embedding(query_text)
+            # Reuse the request's embedding (computed once per question)
+            query_embedding = self._resolve_query_context(query_text, query_context).embedding
             
             # Get classes to search
             classes_to_search = self.get_prerequisite_classes(subject, student_class, mode)
-            logger.info(f"🔍 {mode.upper()} mode: Searching classes {classes_to_search} for {subject}")
+            strategy = strategy or settings.RAG_CLASS_QUERY_STRATEGY
+            logger.info(f"🔍 {mode.upper()} mode: Searching classes {classes_to_search} for {subject} ({strategy})")
             
             # Get namespace
             namespace = self.get_namespace(subject)
             
-            # Query each class level
-            all_chunks = []
-            class_distribution = {}
+            reranker = reranker or self.reranker
+            matches_by_class = self._fetch_class_matches(
+                namespace=namespace,
+                query_embedding=query_embedding,
+                classes_to_search=classes_to_search,
+                subject=subject,
+                chapter=chapter,
+                chunks_per_class=chunks_per_class,
+                strategy=strategy,
+                include_values=reranker.needs_vectors
+            )
             
-            for class_level in classes_to_search:
-                # Build metadata filter
-                # Pinecone stores class_level as INTEGER (from pdf_processor.py)
-                metadata_filter = {
-                    "class_level": {"$eq": class_level},  # Integer as stored in pdf_processor
-                    "subject": subject
-                }
-                
-                if chapter is not None:
-                    metadata_filter["chapter_number"] = chapter  # Integer as stored in pdf_processor
-                
-                try:
-                    # Query textbook index with namespace
-                    results = self.textbook_db.index.query(
-                        namespace=namespace,
-                        vector=query_embedding,
-                        top_k=chunks_per_class,
-                        filter=metadata_filter,
-                        include_metadata=True
-                    )
-                    
-                    # Extract matches
-                    matches = results.get('matches', [])
-                    class_chunks = 0
-                    
-                    for match in matches:
-                        score = match.get('score', 0)
-                        
-                        # Dynamic threshold based on mode
-                        threshold = 0.3 if mode == "basic" else 0.2
-                        
-                        if score >= threshold:
-                            metadata = match.get('metadata', {})
-                            chunk_data = {
-                                'text': metadata.get('text', ''),
-                                'class': class_level,
-                                'subject': subject,
-                                'chapter': metadata.get('chapter'),
-                                'page': metadata.get('page'),
-                                'score': score,
-                                'source': 'textbook'
-                            }
-                            all_chunks.append(chunk_data)
-                            class_chunks += 1
-                    
-                    if class_chunks > 0:
-                        class_distribution[class_level] = class_chunks
-                        logger.info(f"  ✓ Class {class_level}: {class_chunks} chunks (scores: {[round(m['score'], 2) for m in matches[:3]]})")
-                
-                except Exception as class_error:
-                    logger.warning(f"  ✗ Class {class_level} query failed: {class_error}")
-                    continue
+            all_chunks, vectors = self._collect_class_chunks(
+                matches_by_class, classes_to_search, subject, mode
+            )
+            
+            # Keep a smaller, more diverse set for the prompt
+            top_k = settings.RAG_RERANK_TOP_K_DEEPDIVE if mode == "deepdive" else settings.RAG_RERANK_TOP_K_BASIC
+            candidates = len(all_chunks)
+            all_chunks = reranker.rerank(query_text, query_embedding, all_chunks, vectors, top_k)
+            if candidates > len(all_chunks):
+                logger.info(f"🎯 Reranked ({reranker.name}): {candidates} → {len(all_chunks)} chunks")
+            
+            class_distribution = {}
+            for chunk in all_chunks:
+                class_distribution[chunk['class']] = class_distribution.get(chunk['class'], 0) + 1
             
             # Sort chunks: earlier classes first (for progressive building)
             all_chunks.sort(key=lambda x: (x['class'], -x['score']))
@@ -269,7 +562,8 @@ class EnhancedRAGService:
         query_text: str,
         subject: str,
         student_class: int,
-        top_k: int = 10
+        top_k: int = 10,
+        query_context: Optional[QueryContext] = None
     ) -> List[Dict]:
         """
         Query web content index for additional context (DeepDive mode).
@@ -279,6 +573,7 @@ class EnhancedRAGService:
             subject: Subject name
             student_class: Current class level
             top_k: Number of results
+            query_context: Optional per-request context holding the question embedding
         
         Returns:
             List of web content chunks
@@ -288,8 +583,8 @@ class EnhancedRAGService:
                 logger.info("ℹ️ Web content DB not available")
                 return []
             
-            # Generate embedding using sentence-transformers (CRITICAL: Must match data upload model!)
-            query_embedding = self.generate_embedding(query_text)
+            # Reuse the request's embedding (computed once per question)
+            query_embedding = self._resolve_query_context(query_text, query_context).embedding_for("web")
             
             # Query web content index
             # Note: Web content may use broader metadata structure
@@ -328,7 +623,8 @@ class EnhancedRAGService:
         query_text: str,
         subject: str,
         top_k: int = 3,
-        similarity_threshold: float = 0.75
+        similarity_threshold: float = 0.75,
+        query_context: Optional[QueryContext] = None
     ) -> List[Dict]:
         """
         Query stored LLM-generated answers for similar questions.
@@ -338,6 +634,7 @@ class EnhancedRAGService:
             subject: Subject name
             top_k: Number of results
             similarity_threshold: Minimum similarity score (0.0-1.0) to reuse answer
+            query_context: Optional per-request context holding the question embedding
         
         Returns:
             List of LLM-generated answer chunks
@@ -347,8 +644,8 @@ class EnhancedRAGService:
                 logger.debug("LLM content DB not available")
                 return []
             
-            # Generate embedding using sentence-transformers
-            query_embedding = self.generate_embedding(query_text)
+            # Reuse the request's embedding (computed once per question)
+            query_embedding = self._resolve_query_context(query_text, query_context).embedding_for("llm")
             
             # Query LLM content index
             results = self.llm_db.query(
@@ -363,24 +660,28 @@ class EnhancedRAGService:
                 top_scores = [f"{m.get('score', 0):.3f}" for m in all_matches[:3]]
                 logger.info(f"💡 LLM index check: Found {len(all_matches)} similar answers (top scores: {top_scores})")
             
+            reused = [
+                match for match in results.get('matches', [])
+                if match.get('score', 0) >= similarity_threshold  # Configurable threshold for LLM reuse
+            ]
+            # Count the reuse (buffered, flushed to Mongo in the background)
+            for match in reused:
+                llm_usage_tracker.record(match['id'], subject)
+            usage_counts = llm_usage_tracker.get_usage_counts([match['id'] for match in reused]) if reused else {}
+            
             llm_chunks = []
-            for match in results.get('matches', []):
-                # Use configurable threshold for LLM reuse
-                if match.get('score', 0) >= similarity_threshold:
-                    metadata = match.get('metadata', {})
-                    
-                    # Increment usage count
-                    self.llm_db.increment_usage(match['id'], subject)
-                    
-                    chunk_data = {
-                        'text': metadata.get('answer', ''),
-                        'source': 'llm_generated',
-                        'score': match.get('score', 0),
-                        'topic': metadata.get('topic', 'general'),
-                        'quality_score': metadata.get('quality_score', 0.9),
-                        'usage_count': metadata.get('usage_count', 0) + 1
-                    }
-                    llm_chunks.append(chunk_data)
+            for match in reused:
+                metadata = match.get('metadata', {})
+                
+                chunk_data = {
+                    'text': metadata.get('answer', ''),
+                    'source': 'llm_generated',
+                    'score': match.get('score', 0),
+                    'topic': metadata.get('topic', 'general'),
+                    'quality_score': metadata.get('quality_score', 0.9),
+                    'usage_count': usage_counts.get(match['id'], 0)
+                }
+                llm_chunks.append(chunk_data)
             
             if llm_chunks:
                 scores_list = [f"{c['score']:.2f}" for c in llm_chunks]
@@ -593,7 +894,47 @@ Generate a thorough, well-structured deep dive explanation:"""
             Generated answer
         """
         if not textbook_chunks and not llm_chunks and not web_chunks:
-            return f"I couldn't find enough information to answer your question. Try asking about specific topics from your {subject} curriculum!"
+            return self._no_sources_message(subject)
+        
+        prompt = self._build_multi_source_prompt(
+            question, textbook_chunks, llm_chunks, web_chunks, student_class, subject, mode
+        )
+        answer = self.gemini.generate_response(prompt)
+        
+        # Log sources used
+        sources_summary = f"Textbook: {len(textbook_chunks)}, LLM: {len(llm_chunks)}, Web: {len(web_chunks)}"
+        logger.info(f"✅ Answer generated ({len(answer)} chars) from {sources_summary}")
+        
+        # Keep markdown formatting for ReactMarkdown frontend rendering
+        # answer = self._clean_markdown_formatting(answer)  # DISABLED - frontend uses ReactMarkdown
+        
+        return answer
+    
+    def _no_sources_message(self, subject: str) -> str:
+        return f"I couldn't find enough information to answer your question. Try asking about specific topics from your {subject} curriculum!"
+    
+    def _build_multi_source_prompt(
+        self,
+        question: str,
+        textbook_chunks: List[Dict],
+        llm_chunks: List[Dict],
+        web_chunks: List[Dict],
+        student_class: int,
+        subject: str,
+        mode: str = "basic"
+    ) -> str:
+        """Build the triple-index (Textbook + LLM + Web) answer prompt."""
+        # Drop duplicate / overlapping chunks and fit the rest into the mode's token budget
+        selected, report = self.context_budgeter.select(
+            textbook_chunks[:10], llm_chunks[:2], web_chunks[:5], student_class, mode
+        )
+        textbook_chunks, llm_chunks, web_chunks = selected["textbook"], selected["llm"], selected["web"]
+        logger.info(
+            f"✂️  Context: {report['tokens_in']} → {report['tokens_out']} tokens "
+            f"({report['tokens_saved']} saved; {report['duplicates_dropped']} duplicates, "
+            f"{report['overlap_chars_trimmed']} overlap chars trimmed, "
+            f"{report['over_budget_dropped']} over {report['budget']}-token budget)"
+        )
         
         # Build multi-source context
         context_sections = []
@@ -604,7 +945,7 @@ Generate a thorough, well-structured deep dive explanation:"""
             context_sections.append(f"**PRIMARY SOURCE - NCERT Textbook (Classes {', '.join(map(str, classes_used))}):**\n")
             
             textbook_context = []
-            for chunk in textbook_chunks[:10]:
+            for chunk in textbook_chunks:
                 class_level = chunk.get('class', student_class)
                 textbook_context.append(f"[Class {class_level}] {chunk['text']}")
             
@@ -615,7 +956,7 @@ Generate a thorough, well-structured deep dive explanation:"""
             context_sections.append("\n\n**REFERENCE - Previously Generated Explanations:**\n")
             
             llm_context = []
-            for chunk in llm_chunks[:2]:
+            for chunk in llm_chunks:
                 topic = chunk.get('topic', 'general')
                 score = chunk.get('score', 0)
                 llm_context.append(f"[Topic: {topic}, Relevance: {score:.2f}]\n{chunk['text']}")
@@ -627,7 +968,7 @@ Generate a thorough, well-structured deep dive explanation:"""
             context_sections.append("\n\n**SUPPLEMENTARY - Web Resources:**\n")
             
             web_context = []
-            for chunk in web_chunks[:5]:
+            for chunk in web_chunks:
                 source_url = chunk.get('url', 'N/A')
                 web_context.append(f"[Source: {source_url[:50]}...]\n{chunk['text']}")
             
@@ -660,19 +1001,155 @@ Generate a thorough, well-structured deep dive explanation:"""
 
 Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answer:"""
         
-        answer = self.gemini.generate_response(prompt)
+        return prompt
+    
+    def _retrieve_triple_index(
+        self,
+        query_context: QueryContext,
+        subject: str,
+        student_class: int,
+        chapter: Optional[int],
+        mode: str,
+        chunks_per_class: int,
+        llm_top_k: int,
+        web_top_k: int,
+        cache_hit_score: float,
+        llm_threshold: float = 0.75
+    ) -> Tuple[List[Dict], Dict[int, int], List[Dict], List[Dict]]:
+        """
+        Query textbook, stored LLM answers and web content concurrently.
         
-        # Log sources used
-        sources_summary = f"Textbook: {len(textbook_chunks)}, LLM: {len(llm_chunks)}, Web: {len(web_chunks)}"
-        logger.info(f"✅ Answer generated ({len(answer)} chars) from {sources_summary}")
+        The three lookups are independent, so they run in parallel through the
+        retrieval orchestrator. If the LLM index returns a cache hit
+        (top score >= cache_hit_score) the web lookup is cancelled/ignored; the
+        textbook lookup is still collected because it is returned as sources.
         
-        # Keep markdown formatting for ReactMarkdown frontend rendering
-        # answer = self._clean_markdown_formatting(answer)  # DISABLED - frontend uses ReactMarkdown
+        Returns:
+            Tuple of (textbook_chunks, class_distribution, llm_chunks, web_chunks)
+        """
+        question = query_context.query_text
         
-        return answer
+        # Embed up front (once per distinct model) so the branches don't wait on each other
+        for index_key in ("textbook", "llm", "web"):
+            query_context.embedding_for(index_key)
+        
+        result = self.retrieval.run(
+            branches={
+                "textbook": lambda: self.query_multi_class(
+                    query_text=question,
+                    subject=subject,
+                    student_class=student_class,
+                    chapter=chapter,
+                    mode=mode,
+                    chunks_per_class=chunks_per_class,
+                    query_context=query_context
+                ),
+                "llm": lambda: self.query_llm_content(
+                    query_text=question,
+                    subject=subject,
+                    top_k=llm_top_k,
+                    similarity_threshold=llm_threshold,
+                    query_context=query_context
+                ),
+                "web": lambda: self.query_web_content(
+                    query_text=question,
+                    subject=subject,
+                    student_class=student_class,
+                    top_k=web_top_k,
+                    query_context=query_context
+                )
+            },
+            defaults={"textbook": ([], {}), "llm": [], "web": []},
+            short_circuit_branch="llm",
+            short_circuit_when=lambda chunks: bool(chunks) and chunks[0]['score'] >= cache_hit_score,
+            skip_on_short_circuit=["web"]
+        )
+        
+        textbook_chunks, class_dist = result.get("textbook")
+        return textbook_chunks, class_dist, result.get("llm"), result.get("web")
+    
+    def _search_previous_classes(
+        self,
+        question: str,
+        subject: str,
+        student_class: int,
+        query_context: QueryContext
+    ) -> Tuple[List[Dict], Dict[int, int]]:
+        """Search the previous 3 classes (no chapter filter) for foundational content."""
+        for prev_class in range(student_class - 1, max(4, student_class - 4), -1):
+            logger.info(f"   Searching Class {prev_class}...")
+            prev_chunks, prev_dist = self.query_multi_class(
+                query_text=question,
+                subject=subject,
+                student_class=prev_class,
+                chapter=None,  # Remove chapter filter for broader search
+                mode="basic",
+                chunks_per_class=5,
+                query_context=query_context
+            )
+            
+            if prev_chunks:
+                logger.info(f"✅ Found {len(prev_chunks)} chunks in Class {prev_class} (foundation content)")
+                return prev_chunks, prev_dist
+        return [], {}
+    
+    def _build_fallback_prompt(self, question: str, subject: str, student_class: int) -> str:
+        """General-knowledge prompt (with disclaimer) for questions with no content in any class."""
+        return f"""The student asked: "{question}"
+
+This topic doesn't appear to be explicitly covered in their Class {student_class} {subject} textbook.
+
+Provide a simple, age-appropriate explanation suitable for Class {student_class} students:
+1. Basic definition or concept (2-3 sentences)
+2. One simple example
+3. End with: "Note: This explanation is based on general {subject} knowledge. Check your textbook or ask your teacher for content specific to your Class {student_class} syllabus."
+
+Keep it under 200 words and student-friendly."""
     
     # Main public methods
     
+    def _scrape_if_thin(
+        self,
+        question: str,
+        subject: str,
+        student_class: int,
+        textbook_chunks: List[Dict],
+        web_chunks: List[Dict],
+        threshold: int,
+        max_sources: int,
+        requery_top_k: Optional[int] = None,
+        query_context: Optional[QueryContext] = None
+    ) -> List[Dict]:
+        """
+        Scrape the web for the question's topic when textbook + web content is thin.
+        
+        Shared by the blocking and streaming answer paths. With `requery_top_k`
+        the web index is queried again after scraping.
+        
+        Returns:
+            Web chunks to answer with (re-queried ones if the web index was refreshed)
+        """
+        total_chunks = len(textbook_chunks) + len(web_chunks)
+        if not self.web_scraper.should_scrape(total_chunks, threshold=threshold):
+            return web_chunks
+        
+        # Extract topic and trigger scraping
+        topic = self.llm_storage._extract_topic(question)
+        logger.info(f"🌐 Triggering web scraping for topic: {topic}")
+        self.web_scraper.scrape_topic(subject, topic, student_class, max_sources=max_sources)
+        
+        if requery_top_k is None:
+            return web_chunks
+        
+        # Re-query web content after scraping
+        return self.query_web_content(
+            query_text=question,
+            subject=subject,
+            student_class=student_class,
+            top_k=requery_top_k,
+            query_context=query_context
+        )
+    
     def answer_question_basic(
         self,
         question: str,
@@ -696,21 +1173,25 @@ Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answ
         logger.info(f"📚 BASIC MODE (Triple-Index): Class {student_class} {subject}")
         logger.info(f"   Question: {question[:100]}...")
         
-        # 1. Query textbook content (primary source)
-        textbook_chunks, class_dist = self.query_multi_class(
-            query_text=question,
+        # ⚡ EXACT-MATCH CACHE: Repeated questions skip embedding + vector lookups entirely
+        cached = self.answer_cache.get(question, subject, student_class, chapter, mode="basic")
+        if cached:
+            return cached
+        
+        # One embedding per question, shared by every retrieval path below
+        query_context = self.create_query_context(question)
+        
+        # 1-3. Query textbook (primary source), stored LLM answers and web content concurrently
+        textbook_chunks, class_dist, llm_chunks, web_chunks = self._retrieve_triple_index(
+            query_context=query_context,
             subject=subject,
             student_class=student_class,
             chapter=chapter,
             mode="basic",
-            chunks_per_class=5
-        )
-        
-        # 2. Query stored LLM answers
-        llm_chunks = self.query_llm_content(
-            query_text=question,
-            subject=subject,
-            top_k=2
+            chunks_per_class=5,
+            llm_top_k=2,
+            web_top_k=3,
+            cache_hit_score=0.95
         )
         
         # 🎯 CACHE HIT: Return cached answer directly if high similarity
@@ -721,23 +1202,15 @@ Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answ
             
             # Return cached answer with source information
             source_chunks = textbook_chunks + llm_chunks
+            self._record_query_context(query_context)
+            self._cache_answer(question, subject, student_class, chapter, "basic", cached_answer, source_chunks)
             return cached_answer, source_chunks
         
-        # 3. Query web content
-        web_chunks = self.query_web_content(
-            query_text=question,
-            subject=subject,
-            student_class=student_class,
-            top_k=3
-        )
-        
         # 4. Check if we need more content via web scraping
-        total_chunks = len(textbook_chunks) + len(web_chunks)
-        if self.web_scraper.should_scrape(total_chunks, threshold=5):
-            # Extract topic and trigger scraping
-            topic = self.llm_storage._extract_topic(question)
-            logger.info(f"🌐 Triggering web scraping for topic: {topic}")
-            self.web_scraper.scrape_topic(subject, topic, student_class, max_sources=2)
+        web_chunks = self._scrape_if_thin(
+            question, subject, student_class, textbook_chunks, web_chunks,
+            threshold=5, max_sources=2
+        )
         
         # Combine all sources
         all_chunks = textbook_chunks + llm_chunks + web_chunks
@@ -766,6 +1239,10 @@ Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answ
                 quality_score=0.9
             )
         
+        self._record_query_context(query_context)
+        
+        self._cache_answer(question, subject, student_class, chapter, "basic", answer, all_chunks)
+        
         return answer, all_chunks
     
     def answer_annotation_basic(
@@ -797,22 +1274,26 @@ Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answ
         logger.info(f"📝 ANNOTATION MODE (Lower threshold): Class {student_class} {subject}")
         logger.info(f"   Question: {question[:100]}...")
         
-        # 1. Query textbook content (primary source)
-        textbook_chunks, class_dist = self.query_multi_class(
-            query_text=question,
+        # ⚡ EXACT-MATCH CACHE: Repeated questions skip embedding + vector lookups entirely
+        cached = self.answer_cache.get(question, subject, student_class, chapter, mode="annotation")
+        if cached:
+            return cached
+        
+        # One embedding per question, shared by every retrieval path below
+        query_context = self.create_query_context(question)
+        
+        # 1-3. Query textbook (primary source), stored LLM answers and web content concurrently
+        textbook_chunks, class_dist, llm_chunks, web_chunks = self._retrieve_triple_index(
+            query_context=query_context,
             subject=subject,
             student_class=student_class,
             chapter=chapter,
             mode="basic",
-            chunks_per_class=5
-        )
-        
-        # 2. Query stored LLM answers with LOWER threshold for annotations
-        llm_chunks = self.query_llm_content(
-            query_text=question,
-            subject=subject,
-            top_k=3,
-            similarity_threshold=0.65  # Lower threshold for annotation reuse
+            chunks_per_class=5,
+            llm_top_k=3,
+            web_top_k=2,
+            cache_hit_score=0.90,  # Slightly lower for annotations (0.90 vs 0.95)
+            llm_threshold=0.65  # Lower threshold for annotation reuse
         )
         
         # 🎯 CACHE HIT: Return cached answer directly if high similarity
@@ -823,38 +1304,19 @@ Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answ
             
             # Return cached answer with source information
             source_chunks = textbook_chunks + llm_chunks
+            self._record_query_context(query_context)
+            self._cache_answer(question, subject, student_class, chapter, "annotation", cached_answer, source_chunks)
             return cached_answer, source_chunks
         
-        # 3. Query web content (optional)
-        web_chunks = self.query_web_content(
-            query_text=question,
-            subject=subject,
-            student_class=student_class,
-            top_k=2
-        )
-        
         # EDGE CASE 1: No content found - Try progressive search (earlier classes)
         if not textbook_chunks and not llm_chunks:
             logger.warning(f"⚠️ EDGE CASE: No content found for '{question[:50]}...' in Class {student_class}")
             logger.info(f"🔄 Attempting progressive search in Classes {max(5, student_class-3)}-{student_class-1}...")
             
-            # Try searching previous 3 classes for foundational content
-            for prev_class in range(student_class - 1, max(4, student_class - 4), -1):
-                logger.info(f"   Searching Class {prev_class}...")
-                prev_chunks, prev_dist = self.query_multi_class(
-                    query_text=question,
-                    subject=subject,
-                    student_class=prev_class,
-                    chapter=None,  # Remove chapter filter for broader search
-                    mode="basic",
-                    chunks_per_class=5
-                )
-                
-                if prev_chunks:
-                    logger.info(f"✅ Found {len(prev_chunks)} chunks in Class {prev_class} (foundation content)")
-                    textbook_chunks = prev_chunks
-                    class_dist = prev_dist
-                    break
+            prev_chunks, prev_dist = self._search_previous_classes(question, subject, student_class, query_context)
+            if prev_chunks:
+                textbook_chunks = prev_chunks
+                class_dist = prev_dist
         
         # Combine all sources
         all_chunks = textbook_chunks + llm_chunks + web_chunks
@@ -864,22 +1326,12 @@ Generate a {'comprehensive' if mode == 'deepdive' else 'clear and focused'} answ
             logger.warning(f"⚠️ EDGE CASE: No content in any class for '{question[:50]}...'")
             logger.info(f"🤖 Using Gemini fallback (general knowledge with disclaimer)")
             
-            fallback_prompt = f"""The student asked: "{question}"
-
-This topic doesn't appear to be explicitly covered in their Class {student_class} {subject} textbook.
-
-Provide a simple, age-appropriate explanation suitable for Class {student_class} students:
-1. Basic definition or concept (2-3 sentences)
-2. One simple example
-3. End with: "Note: This explanation is based on general {subject} knowledge. Check your textbook or ask your teacher for content specific to your Class {student_class} syllabus."
-
-Keep it under 200 words and student-friendly."""
-            
-            answer = self.gemini.generate_response(fallback_prompt)
+            answer = self.gemini.generate_response(self._build_fallback_prompt(question, subject, student_class))
             # Keep markdown formatting for ReactMarkdown frontend rendering
             # answer = self._clean_markdown_formatting(answer)  # DISABLED - frontend uses ReactMarkdown
             
             logger.info(f"✓ Fallback answer generated ({len(answer)} chars)")
+            self._record_query_context(query_context)
             return answer, []  # Return empty chunks to indicate fallback was used
         
         # Generate answer from multiple sources
@@ -906,6 +1358,10 @@ Keep it under 200 words and student-friendly."""
                 quality_score=0.9
             )
         
+        self._record_query_context(query_context)
+        
+        self._cache_answer(question, subject, student_class, chapter, "annotation", answer, all_chunks)
+        
         return answer, all_chunks
     
     def answer_question_deepdive(
@@ -930,23 +1386,27 @@ Keep it under 200 words and student-friendly."""
         """
         logger.info(f"🔍 DEEP DIVE MODE (Triple-Index): Class {student_class} {subject}")
         logger.info(f"   Question: {question[:100]}...")
+        
+        # ⚡ EXACT-MATCH CACHE: Repeated questions skip embedding + vector lookups entirely
+        cached = self.answer_cache.get(question, subject, student_class, chapter, mode="deepdive")
+        if cached:
+            return cached
+        
+        # One embedding per question, shared by every retrieval path below
+        query_context = self.create_query_context(question)
         logger.info(f"   Will search from fundamentals (earliest class) to current class")
         
-        # 1. Query textbook content (all prerequisite classes)
-        textbook_chunks, class_dist = self.query_multi_class(
-            query_text=question,
+        # 1-3. Query textbook (all prerequisite classes), stored LLM answers and web content concurrently
+        textbook_chunks, class_dist, llm_chunks, web_chunks = self._retrieve_triple_index(
+            query_context=query_context,
             subject=subject,
             student_class=student_class,
             chapter=chapter,
             mode="deepdive",
-            chunks_per_class=8  # More chunks per class for comprehensive coverage
-        )
-        
-        # 2. Query stored LLM answers
-        llm_chunks = self.query_llm_content(
-            query_text=question,
-            subject=subject,
-            top_k=3
+            chunks_per_class=8,  # More chunks per class for comprehensive coverage
+            llm_top_k=3,
+            web_top_k=10,
+            cache_hit_score=0.95
         )
         
         # 🎯 CACHE HIT: Return cached answer directly if high similarity
@@ -957,32 +1417,16 @@ Keep it under 200 words and student-friendly."""
             
             # Return cached answer with source information
             source_chunks = textbook_chunks + llm_chunks
+            self._record_query_context(query_context)
+            self._cache_answer(question, subject, student_class, chapter, "deepdive", cached_answer, source_chunks)
             return cached_answer, source_chunks
         
-        # 3. Query web content for additional context
-        web_chunks = self.query_web_content(
-            query_text=question,
-            subject=subject,
-            student_class=student_class,
-            top_k=10
+        # 4. Check if we need more content via web scraping (then re-query the web index)
+        web_chunks = self._scrape_if_thin(
+            question, subject, student_class, textbook_chunks, web_chunks,
+            threshold=8, max_sources=3, requery_top_k=10, query_context=query_context
         )
         
-        # 4. Check if we need more content via web scraping
-        total_chunks = len(textbook_chunks) + len(web_chunks)
-        if self.web_scraper.should_scrape(total_chunks, threshold=8):
-            # Extract topic and trigger scraping
-            topic = self.llm_storage._extract_topic(question)
-            logger.info(f"🌐 Triggering web scraping for topic: {topic}")
-            self.web_scraper.scrape_topic(subject, topic, student_class, max_sources=3)
-            
-            # Re-query web content after scraping
-            web_chunks = self.query_web_content(
-                query_text=question,
-                subject=subject,
-                student_class=student_class,
-                top_k=10
-            )
-        
         # Combine all sources
         all_chunks = textbook_chunks + llm_chunks + web_chunks
         
@@ -1010,7 +1454,178 @@ Keep it under 200 words and student-friendly."""
                 quality_score=0.95  # Higher score for deepdive answers
             )
         
+        self._record_query_context(query_context)
+        
+        self._cache_answer(question, subject, student_class, chapter, "deepdive", answer, all_chunks)
+        
         return answer, all_chunks
+    
+    def stream_answer(
+        self,
+        question: str,
+        subject: str,
+        student_class: int,
+        chapter: Optional[int] = None,
+        mode: str = "basic",
+        prompt_builder: Optional[Callable[[List[Dict]], str]] = None,
+        min_sources: int = 1,
+        no_sources_message: Optional[str] = None,
+        cache_mode: Optional[str] = None
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        Answer a question as a stream of events, optimised for time-to-first-token.
+        
+        Retrieval matches answer_question_basic / answer_annotation_basic /
+        answer_question_deepdive, but the answer is streamed from Gemini instead
+        of returned whole. On completion it is stored through LLMStorageService
+        and the answer cache like the blocking methods.
+        
+        Args:
+            question: Student's question
+            subject: Subject name
+            student_class: Current class level
+            chapter: Optional chapter filter
+            mode: "basic", "annotation" or "deepdive"
+            prompt_builder: Optional custom prompt from the source chunks
+                            (e.g. annotation define/elaborate); skips the LLM cache hit
+            min_sources: Fewer source chunks than this counts as "no sources"
+                         (also applied to cached answers before serving them)
+            no_sources_message: Answer to send when there are no sources
+                                (default: annotation falls back to general knowledge)
+            cache_mode: Answer-cache mode key (default: `mode`)
+        
+        Yields:
+            ("sources", {"source_chunks", "cached"}) first, then
+            ("token", {"text"}) deltas, then ("done", {"ttft_ms", "total_ms", "answer_chars"})
+        """
+        config = self.STREAM_MODES[mode]
+        cache_mode = cache_mode or mode
+        started_at = time.perf_counter()
+        
+        def finish(answer: str, first_token_at: float) -> Tuple[str, Dict]:
+            ttft_ms = (first_token_at - started_at) * 1000
+            total_ms = (time.perf_counter() - started_at) * 1000
+            self.stream_ttft_ms.append(ttft_ms)
+            self.stream_total_ms.append(total_ms)
+            logger.info(f"✅ Streamed answer ({len(answer)} chars): first token {ttft_ms:.0f}ms, total {total_ms:.0f}ms")
+            return "done", {
+                "ttft_ms": round(ttft_ms, 1),
+                "total_ms": round(total_ms, 1),
+                "answer_chars": len(answer)
+            }
+        
+        def thin_cache_hit() -> Iterator[Tuple[str, Dict]]:
+            # Cached answers backed by fewer than `min_sources` chunks get the same
+            # "no sources" reply the blocking endpoint gives them
+            message = no_sources_message if no_sources_message is not None else self._no_sources_message(subject)
+            logger.info(f"🎯 Cached answer has fewer than {min_sources} sources, not serving it")
+            yield "sources", {"source_chunks": [], "cached": True}
+            yield "token", {"text": message}
+            yield finish(message, time.perf_counter())
+        
+        # ⚡ EXACT-MATCH CACHE
+        cached = self.answer_cache.get(question, subject, student_class, chapter, mode=cache_mode)
+        if cached:
+            answer, source_chunks = cached
+            if len(source_chunks) < min_sources:
+                yield from thin_cache_hit()
+                return
+            yield "sources", {"source_chunks": source_chunks, "cached": True}
+            yield "token", {"text": answer}
+            yield finish(answer, time.perf_counter())
+            return
+        
+        query_context = self.create_query_context(question)
+        textbook_chunks, class_dist, llm_chunks, web_chunks = self._retrieve_triple_index(
+            query_context=query_context,
+            subject=subject,
+            student_class=student_class,
+            chapter=chapter,
+            mode=config["retrieval_mode"],
+            chunks_per_class=config["chunks_per_class"],
+            llm_top_k=config["llm_top_k"],
+            web_top_k=config["web_top_k"],
+            cache_hit_score=config["cache_hit_score"],
+            llm_threshold=config["llm_threshold"]
+        )
+        
+        # 🎯 CACHE HIT: stored answer is sent as a single delta
+        if prompt_builder is None and llm_chunks and llm_chunks[0]['score'] >= config["cache_hit_score"]:
+            cached_answer = llm_chunks[0]['text']
+            source_chunks = textbook_chunks + llm_chunks
+            self._record_query_context(query_context)
+            self._cache_answer(question, subject, student_class, chapter, cache_mode, cached_answer, source_chunks)
+            if len(source_chunks) < min_sources:
+                yield from thin_cache_hit()
+                return
+            logger.info(f"🎯 CACHE HIT! Streaming cached answer (similarity: {llm_chunks[0]['score']:.3f})")
+            yield "sources", {"source_chunks": source_chunks, "cached": True}
+            yield "token", {"text": cached_answer}
+            yield finish(cached_answer, time.perf_counter())
+            return
+        
+        # Thin content: scrape the web like the blocking path of this mode
+        if config["scrape_threshold"] is not None:
+            web_chunks = self._scrape_if_thin(
+                question, subject, student_class, textbook_chunks, web_chunks,
+                threshold=config["scrape_threshold"],
+                max_sources=config["scrape_sources"],
+                requery_top_k=config["web_top_k"] if config["scrape_requery"] else None,
+                query_context=query_context
+            )
+        
+        # EDGE CASE: annotations search earlier classes when nothing was found
+        if mode == "annotation" and not textbook_chunks and not llm_chunks:
+            textbook_chunks, class_dist = self._search_previous_classes(
+                question, subject, student_class, query_context
+            )
+        
+        all_chunks = textbook_chunks + llm_chunks + web_chunks
+        has_sources = len(all_chunks) >= min_sources
+        yield "sources", {"source_chunks": all_chunks if has_sources else [], "cached": False}
+        
+        if not has_sources:
+            if no_sources_message is None and mode != "annotation":
+                no_sources_message = self._no_sources_message(subject)
+            if no_sources_message is not None:
+                self._record_query_context(query_context)
+                yield "token", {"text": no_sources_message}
+                yield finish(no_sources_message, time.perf_counter())
+                return
+            logger.info("🤖 Streaming Gemini fallback (general knowledge with disclaimer)")
+            prompt = self._build_fallback_prompt(question, subject, student_class)
+        elif prompt_builder is not None:
+            prompt = prompt_builder(all_chunks)
+        else:
+            prompt = self._build_multi_source_prompt(
+                question, textbook_chunks, llm_chunks, web_chunks,
+                student_class, subject, config["retrieval_mode"]
+            )
+        
+        parts = []
+        first_token_at = None
+        for delta in self.gemini.generate_response_stream(prompt):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(delta)
+            yield "token", {"text": delta}
+        answer = "".join(parts)
+        
+        # Store sourced answers like the blocking path (fallback answers are not stored)
+        if has_sources and self.llm_storage._should_store_answer(answer):
+            self.llm_storage.store_answer(
+                question=question,
+                answer=answer,
+                subject=subject,
+                class_level=student_class,
+                topic=self.llm_storage._extract_topic(question),
+                quality_score=config["quality_score"]
+            )
+        self._record_query_context(query_context)
+        if has_sources:
+            self._cache_answer(question, subject, student_class, chapter, cache_mode, answer, all_chunks)
+        
+        yield finish(answer, first_token_at or time.perf_counter())
 
 
 # Global instance
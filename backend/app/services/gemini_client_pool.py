@@ -0,0 +1,64 @@
+"""
+Gemini Client Pool - One API client per key, passed explicitly to each call.
+
+`genai.configure(api_key=...)` sets a process-global client. With requests running
+concurrently (rag_executor, parallel retrieval), one call could reconfigure the
+key under another call that was already in flight. The pool builds one
+GenerativeServiceClient per API key and binds it to each model / embedding call,
+so generation and embedding can run in parallel across keys without touching
+global state.
+"""
+
+from typing import Dict, List
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiClientPool:
+    """Caches one configured GenerativeServiceClient per API key."""
+
+    def __init__(self):
+        self._clients: Dict[str, glm.GenerativeServiceClient] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, api_key: str) -> glm.GenerativeServiceClient:
+        """Get (or create) the client bound to `api_key`."""
+        client = self._clients.get(api_key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(api_key)
+                if client is None:
+                    client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+                    self._clients[api_key] = client
+                    logger.info(f"🔌 Gemini client created for key ...{api_key[-6:]}")
+        return client
+
+    def get_model(self, api_key: str, model_name: str, **kwargs) -> genai.GenerativeModel:
+        """
+        Get a GenerativeModel whose calls go through the client for `api_key`.
+
+        Args:
+            api_key: Gemini API key (e.g. from gemini_key_manager.get_available_key())
+            model_name: e.g. 'models/gemini-2.5-flash'
+            **kwargs: Passed to genai.GenerativeModel (generation_config, ...)
+        """
+        model = genai.GenerativeModel(model_name, **kwargs)
+        # GenerativeModel only falls back to the global client when _client is unset
+        model._client = self.get_client(api_key)
+        return model
+
+    def embed_content(self, api_key: str, **kwargs) -> Dict:
+        """genai.embed_content using the client for `api_key`."""
+        return genai.embed_content(client=self.get_client(api_key), **kwargs)
+
+    def get_stats(self) -> Dict[str, List[str]]:
+        with self._lock:
+            return {"clients": [f"...{api_key[-6:]}" for api_key in self._clients]}
+
+
+# Global instance
+gemini_client_pool = GeminiClientPool()
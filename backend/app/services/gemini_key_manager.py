@@ -6,13 +6,19 @@ This service manages multiple Gemini API keys to overcome free tier limits:
 - Automatic rotation when quota exhausted
 - Tracks usage in MongoDB
 - Auto-resets at midnight Pacific Time
+
+Quota counts live in an in-process ledger, so picking a key never touches MongoDB.
+A background thread flushes local increments to `gemini_quota_tracker` as batched
+`$inc` deltas and reads back the totals, which folds in usage from other workers.
 """
 
 import os
+import atexit
 import logging
+import threading
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, List
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from app.core.config import settings
 import pytz
 from dotenv import load_dotenv
@@ -35,12 +41,31 @@ class GeminiKeyManager:
         self.daily_limit = 20  # Free tier limit per key
         self.db = None
         
+        # In-memory quota ledger: key_id -> {date, count, pending, last_used}
+        # `count` is the best known total for today, `pending` the local
+        # increments not yet flushed to MongoDB
+        self._ledger: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        # Serializes flush and refresh, so a refresh never pairs a stored total
+        # read before a flush with `pending` already reduced by it
+        self._sync_lock = threading.Lock()
+        self.sync_interval_seconds = settings.GEMINI_QUOTA_SYNC_SECONDS
+        self._stop_event = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+        
         # Load API keys from environment
         self._load_keys_from_env()
         
         # Initialize MongoDB connection for tracking
         self._init_db()
         
+        # Seed the ledger from MongoDB
+        today = self._get_current_pacific_date()
+        for key_info in self.keys:
+            self._ledger[key_info["id"]] = {"date": today, "count": 0, "pending": 0, "last_used": None}
+        self._refresh_from_db()
+        atexit.register(self.stop)
+        
         logger.info(f"🔑 Gemini Key Manager initialized with {len(self.keys)} API keys")
         logger.info(f"📊 Total daily capacity: {len(self.keys) * self.daily_limit} requests")
     
@@ -93,88 +118,210 @@ class GeminiKeyManager:
         """Get current date in Pacific timezone (for quota reset)."""
         return datetime.now(PACIFIC_TZ).strftime("%Y-%m-%d")
     
-    def _get_quota_data(self, key_id: str) -> Dict:
-        """Get quota data for a specific key from MongoDB."""
-        if self.db is None:
-            return {"request_count": 0, "date": self._get_current_pacific_date()}
+    def _roll_date(self, key_id: str, entry: Dict, current_date: str):
+        """Reset a ledger entry when the Pacific date changes (caller holds the lock)."""
+        if entry["date"] != current_date:
+            logger.info(f"🔄 Quota reset for {key_id} (new day: {current_date})")
+            entry.update(date=current_date, count=0, pending=0)
+    
+    # ==================== MONGO SYNC ====================
+    
+    def start(self):
+        """Start the background quota sync thread (idempotent)."""
+        with self._lock:
+            if self._sync_thread and self._sync_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._sync_thread = threading.Thread(
+                target=self._run,
+                name="gemini-quota-sync",
+                daemon=True
+            )
+            self._sync_thread.start()
+    
+    def stop(self):
+        """Stop the sync thread and flush pending usage."""
+        self._stop_event.set()
+        if self._sync_thread:
+            self._sync_thread.join(timeout=5)
+            self._sync_thread = None
+        self.flush()
+    
+    def _run(self):
+        while not self._stop_event.wait(self.sync_interval_seconds):
+            self.reconcile()
+    
+    def flush(self) -> int:
+        """
+        Write pending local increments to MongoDB in one ordered bulk write.
         
-        data = self.quota_collection.find_one({"key_id": key_id})
+        The increments stay in `pending` until the write succeeds, so the ledger
+        never counts less than the stored total plus local usage.
         
-        if not data:
-            # Initialize new key entry
-            data = {
-                "key_id": key_id,
-                "request_count": 0,
-                "date": self._get_current_pacific_date(),
-                "last_used": None
+        Returns:
+            Number of increments written
+        """
+        if self.db is None:
+            return 0
+        
+        with self._sync_lock:
+            return self._flush()
+    
+    def _flush(self) -> int:
+        """flush() body (caller holds _sync_lock)."""
+        with self._lock:
+            pending = {
+                key_id: (entry["pending"], entry["date"], entry["last_used"])
+                for key_id, entry in self._ledger.items()
+                if entry["pending"]
             }
-            self.quota_collection.insert_one(data)
         
-        # Check if date changed (quota reset at midnight PT)
-        current_date = self._get_current_pacific_date()
-        if data["date"] != current_date:
-            logger.info(f"🔄 Quota reset for {key_id} (new day: {current_date})")
-            data["request_count"] = 0
-            data["date"] = current_date
-            self.quota_collection.update_one(
-                {"key_id": key_id},
-                {"$set": {"request_count": 0, "date": current_date}}
-            )
+        if not pending:
+            return 0
+        
+        operations = []
+        for key_id, (delta, date, last_used) in pending.items():
+            operations.extend([
+                # Create the tracker doc if missing
+                UpdateOne(
+                    {"key_id": key_id},
+                    {"$setOnInsert": {"request_count": 0, "date": date, "last_used": None}},
+                    upsert=True
+                ),
+                # New day: reset the stored counter (never roll a newer date back)
+                UpdateOne(
+                    {"key_id": key_id, "date": {"$lt": date}},
+                    {"$set": {"request_count": 0, "date": date}}
+                ),
+                UpdateOne(
+                    {"key_id": key_id, "date": date},
+                    {"$inc": {"request_count": delta}, "$set": {"last_used": last_used}}
+                )
+            ])
+        
+        try:
+            self.quota_collection.bulk_write(operations, ordered=True)
+        except Exception as e:
+            # The increments are still pending and go out with the next flush
+            logger.warning(f"Gemini quota flush failed: {e}")
+            return 0
         
-        return data
+        # Now stored: stop counting them as local (unless the day rolled over meanwhile)
+        with self._lock:
+            for key_id, (delta, date, _last_used) in pending.items():
+                entry = self._ledger[key_id]
+                if entry["date"] == date:
+                    entry["pending"] = max(entry["pending"] - delta, 0)
+        
+        return sum(delta for delta, _date, _last_used in pending.values())
     
-    def _increment_usage(self, key_id: str):
-        """Increment usage counter for a key."""
+    def _refresh_from_db(self):
+        """Read stored totals (all workers) into the ledger, keeping unflushed local usage."""
         if self.db is None:
             return
         
+        with self._sync_lock:
+            try:
+                docs = list(self.quota_collection.find({"key_id": {"$in": list(self._ledger)}}))
+            except Exception as e:
+                logger.warning(f"Gemini quota refresh failed: {e}")
+                return
+            self._apply_stored_totals(docs)
+    
+    def _apply_stored_totals(self, docs: List[Dict]):
+        """Set each key's count to its stored total plus unflushed local usage."""
         current_date = self._get_current_pacific_date()
-        self.quota_collection.update_one(
-            {"key_id": key_id},
-            {
-                "$inc": {"request_count": 1},
-                "$set": {"last_used": datetime.now(timezone.utc), "date": current_date}
-            },
-            upsert=True
-        )
+        with self._lock:
+            for doc in docs:
+                key_id = doc["key_id"]
+                entry = self._ledger.get(key_id)
+                if entry is None:
+                    continue
+                self._roll_date(key_id, entry, current_date)
+                if doc.get("date") == current_date:
+                    entry["count"] = doc.get("request_count", 0) + entry["pending"]
+                if entry["last_used"] is None:
+                    entry["last_used"] = doc.get("last_used")
+    
+    def reconcile(self):
+        """Flush local increments, then pick up usage recorded by other workers."""
+        self.flush()
+        self._refresh_from_db()
+    
+    # ==================== KEY SELECTION ====================
     
     def get_available_key(self) -> Optional[str]:
         """
-        Get an API key with available quota.
+        Get an API key with available quota (in-memory, no database round trip).
         
         Returns:
             API key string if available, None if all keys exhausted
         """
-        # Try current key first
-        for attempt in range(len(self.keys)):
-            key_info = self.keys[self.current_key_index]
-            quota_data = self._get_quota_data(key_info["id"])
-            
-            if quota_data["request_count"] < self.daily_limit:
-                # Key has available quota
-                api_key = key_info["key"]
-                logger.info(
-                    f"✅ Using {key_info['id']} "
-                    f"({quota_data['request_count'] + 1}/{self.daily_limit} requests today)"
-                )
-                
-                # Increment usage
-                self._increment_usage(key_info["id"])
+        if self._sync_thread is None:
+            self.start()
+        
+        current_date = self._get_current_pacific_date()
+        with self._lock:
+            # Try current key first
+            for attempt in range(len(self.keys)):
+                key_info = self.keys[self.current_key_index]
+                entry = self._ledger[key_info["id"]]
+                self._roll_date(key_info["id"], entry, current_date)
                 
-                return api_key
-            else:
-                # Key exhausted, try next one
-                logger.warning(
-                    f"⚠️  {key_info['id']} quota exhausted "
-                    f"({quota_data['request_count']}/{self.daily_limit}). "
-                    f"Rotating to next key..."
-                )
-                self.current_key_index = (self.current_key_index + 1) % len(self.keys)
+                if entry["count"] < self.daily_limit:
+                    # Key has available quota - reserve it
+                    entry["count"] += 1
+                    entry["pending"] += 1
+                    entry["last_used"] = datetime.now(timezone.utc)
+                    logger.info(
+                        f"✅ Using {key_info['id']} "
+                        f"({entry['count']}/{self.daily_limit} requests today)"
+                    )
+                    return key_info["key"]
+                else:
+                    # Key exhausted, try next one
+                    logger.warning(
+                        f"⚠️  {key_info['id']} quota exhausted "
+                        f"({entry['count']}/{self.daily_limit}). "
+                        f"Rotating to next key..."
+                    )
+                    self.current_key_index = (self.current_key_index + 1) % len(self.keys)
         
         # All keys exhausted
         logger.error("❌ All API keys exhausted! All quotas used for today.")
         return None
     
+    def remaining_quota(self, key_id: str) -> int:
+        """Requests left today for one key (in-memory)."""
+        current_date = self._get_current_pacific_date()
+        with self._lock:
+            entry = self._ledger[key_id]
+            self._roll_date(key_id, entry, current_date)
+            return max(self.daily_limit - entry["count"], 0)
+    
+    def reserve(self, key_id: str) -> bool:
+        """
+        Count one request against a specific key's daily quota.
+        
+        Used by gemini_scheduler, which chooses the key itself.
+        
+        Returns:
+            False if the key has no quota left today
+        """
+        if self._sync_thread is None:
+            self.start()
+        
+        current_date = self._get_current_pacific_date()
+        with self._lock:
+            entry = self._ledger[key_id]
+            self._roll_date(key_id, entry, current_date)
+            if entry["count"] >= self.daily_limit:
+                return False
+            entry["count"] += 1
+            entry["pending"] += 1
+            entry["last_used"] = datetime.now(timezone.utc)
+            return True
+    
     def get_quota_status(self) -> Dict:
         """
         Get overall quota status for all keys.
@@ -182,14 +329,20 @@ class GeminiKeyManager:
         Returns:
             Dictionary with quota information
         """
+        self.reconcile()
+        
         total_used = 0
         total_available = len(self.keys) * self.daily_limit
         keys_status = []
+        current_date = self._get_current_pacific_date()
         
         for key_info in self.keys:
-            quota_data = self._get_quota_data(key_info["id"])
-            used = quota_data["request_count"]
-            remaining = self.daily_limit - used
+            with self._lock:
+                entry = self._ledger[key_info["id"]]
+                self._roll_date(key_info["id"], entry, current_date)
+                quota_data = dict(entry)
+            used = quota_data["count"]
+            remaining = max(self.daily_limit - used, 0)
             
             total_used += used
             
@@ -199,7 +352,8 @@ class GeminiKeyManager:
                 "remaining": remaining,
                 "limit": self.daily_limit,
                 "status": "exhausted" if remaining == 0 else "available",
-                "last_used": quota_data.get("last_used")
+                "last_used": quota_data.get("last_used"),
+                "pending_sync": quota_data["pending"]
             })
         
         return {
@@ -218,11 +372,15 @@ class GeminiKeyManager:
     
     def force_reset_all_quotas(self):
         """Force reset all quota counters (for testing purposes)."""
+        current_date = self._get_current_pacific_date()
+        with self._lock:
+            for entry in self._ledger.values():
+                entry.update(date=current_date, count=0, pending=0)
+        
         if self.db is None:
             logger.warning("⚠️  Cannot reset quotas: MongoDB not initialized")
             return
         
-        current_date = self._get_current_pacific_date()
         result = self.quota_collection.update_many(
             {},
             {"$set": {"request_count": 0, "date": current_date}}
@@ -0,0 +1,316 @@
+"""
+Gemini Scheduler - Rate-aware dispatch of Gemini calls across all API keys.
+
+GeminiKeyManager used keys one at a time: every request went to
+`current_key_index` until that key was exhausted or returned 429, and callers
+retried recursively. Under load all traffic funnelled through one key and hit
+its per-minute limit early.
+
+The scheduler keeps, per key:
+- an RPM and a TPM token bucket (per-minute limits)
+- the daily quota (via the key manager's in-memory ledger)
+- in-flight count and a 429 cooldown (exponential backoff with jitter)
+
+Each call is dispatched to the least-loaded key that can take it right now.
+When no key can, the caller waits in a bounded queue (GEMINI_SCHEDULER_MAX_QUEUE)
+for up to GEMINI_SCHEDULER_WAIT_SECONDS.
+"""
+
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List
+from app.core.config import settings
+from app.services.gemini_key_manager import gemini_key_manager
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiCapacityError(Exception):
+    """No key could take the request (quota exhausted, queue full or wait timed out)."""
+
+
+def estimate_tokens(prompt: str, output_tokens: int = 1024) -> int:
+    """Rough token estimate for TPM accounting (~4 characters per token + expected output)."""
+    return len(prompt) // 4 + output_tokens
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for Gemini 429 / ResourceExhausted errors."""
+    return "429" in str(error) or type(error).__name__ == "ResourceExhausted"
+
+
+class _KeyState:
+    """Token buckets and load counters for one API key."""
+
+    def __init__(self, key_id: str, api_key: str, rpm: int, tpm: int):
+        self.key_id = key_id
+        self.api_key = api_key
+        self.rpm_tokens = float(rpm)
+        self.tpm_tokens = float(tpm)
+        self.last_refill = time.monotonic()
+
+        self.in_flight = 0
+        self.dispatched = 0
+        self.rate_limited = 0
+        self.consecutive_429 = 0
+        self.cooldown_until = 0.0
+        self.recent: deque = deque()  # (dispatch time, tokens) in the last minute
+
+
+class GeminiScheduler:
+    """Dispatches calls to the least-loaded Gemini key within RPM / TPM / daily limits."""
+
+    def __init__(
+        self,
+        name: str,
+        rpm_per_key: int,
+        tpm_per_key: int,
+        max_queue: int = 64,
+        wait_timeout_seconds: float = 30.0,
+        max_attempts: int = 4,
+        backoff_base_seconds: float = 2.0,
+        backoff_max_seconds: float = 60.0
+    ):
+        self.name = name
+        self.rpm_per_key = rpm_per_key
+        self.tpm_per_key = tpm_per_key
+        self.max_queue = max_queue
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        self._keys: List[_KeyState] = [
+            _KeyState(key_info["id"], key_info["key"], rpm_per_key, tpm_per_key)
+            for key_info in gemini_key_manager.keys
+        ]
+        self._cond = threading.Condition()
+
+        self.waiting = 0
+        self.max_waiting = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.retries = 0
+
+    # ==================== BUCKETS ====================
+
+    def _refill(self, state: _KeyState, now: float):
+        elapsed = now - state.last_refill
+        state.last_refill = now
+        state.rpm_tokens = min(self.rpm_per_key, state.rpm_tokens + elapsed * self.rpm_per_key / 60)
+        state.tpm_tokens = min(self.tpm_per_key, state.tpm_tokens + elapsed * self.tpm_per_key / 60)
+        while state.recent and state.recent[0][0] < now - 60:
+            state.recent.popleft()
+
+    def _ready_in(self, state: _KeyState, tokens: int, now: float) -> float:
+        """Seconds until this key can take a request of `tokens` (0 = now)."""
+        wait = max(state.cooldown_until - now, 0.0)
+        if state.rpm_tokens < 1:
+            wait = max(wait, (1 - state.rpm_tokens) * 60 / self.rpm_per_key)
+        if state.tpm_tokens < tokens:
+            wait = max(wait, (tokens - state.tpm_tokens) * 60 / self.tpm_per_key)
+        return wait
+
+    # ==================== DISPATCH ====================
+
+    def acquire(self, estimated_tokens: int) -> _KeyState:
+        """
+        Reserve a key for one request, waiting in the bounded queue if needed.
+
+        Raises:
+            GeminiCapacityError: all keys exhausted today, queue full, or wait timed out
+        """
+        tokens = min(estimated_tokens, self.tpm_per_key)
+        deadline = time.monotonic() + self.wait_timeout_seconds
+        queued = False
+
+        with self._cond:
+            try:
+                while True:
+                    now = time.monotonic()
+                    candidates = [
+                        state for state in self._keys
+                        if gemini_key_manager.remaining_quota(state.key_id) > 0
+                    ]
+                    if not candidates:
+                        raise GeminiCapacityError(
+                            "❌ All Gemini API keys exhausted! "
+                            f"Total capacity: {len(self._keys) * gemini_key_manager.daily_limit} requests/day. "
+                            "Quotas reset at midnight Pacific Time."
+                        )
+
+                    ready, next_ready = [], float("inf")
+                    for state in candidates:
+                        self._refill(state, now)
+                        wait = self._ready_in(state, tokens, now)
+                        if wait <= 0:
+                            ready.append(state)
+                        else:
+                            next_ready = min(next_ready, wait)
+
+                    # Least loaded first: fewest in flight, then most per-minute headroom
+                    ready.sort(key=lambda state: (state.in_flight, -state.rpm_tokens))
+                    for state in ready:
+                        if gemini_key_manager.reserve(state.key_id):
+                            state.rpm_tokens -= 1
+                            state.tpm_tokens -= tokens
+                            state.in_flight += 1
+                            state.dispatched += 1
+                            state.recent.append((now, tokens))
+                            return state
+                    if ready:
+                        # Lost a daily-quota race; re-evaluate the candidates
+                        continue
+
+                    if not queued:
+                        if self.waiting >= self.max_queue:
+                            self.rejected += 1
+                            raise GeminiCapacityError(
+                                f"❌ Gemini {self.name} queue full ({self.waiting} requests waiting)"
+                            )
+                        queued = True
+                        self.waiting += 1
+                        self.max_waiting = max(self.max_waiting, self.waiting)
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise GeminiCapacityError(
+                            f"❌ Timed out after {self.wait_timeout_seconds}s waiting for a Gemini key"
+                        )
+                    self._cond.wait(timeout=min(next_ready, remaining))
+            finally:
+                if queued:
+                    self.waiting -= 1
+
+    def release(self, state: _KeyState, rate_limited: bool = False):
+        """Return a key after a call; on 429 put it in exponential-backoff cooldown."""
+        with self._cond:
+            state.in_flight -= 1
+            if rate_limited:
+                state.rate_limited += 1
+                state.consecutive_429 += 1
+                backoff = min(
+                    self.backoff_base_seconds * 2 ** (state.consecutive_429 - 1),
+                    self.backoff_max_seconds
+                ) * random.uniform(0.5, 1.5)
+                state.cooldown_until = time.monotonic() + backoff
+                logger.warning(f"⚠️  429 on {state.key_id}, cooling down for {backoff:.1f}s")
+            else:
+                state.consecutive_429 = 0
+            self._cond.notify_all()
+
+    def run(self, call: Callable[[str], Any], estimated_tokens: int = 1024) -> Any:
+        """
+        Run `call(api_key)` on the best available key, retrying 429s on other keys.
+
+        Args:
+            call: Function taking an API key and making one Gemini request
+            estimated_tokens: Prompt + expected output tokens (for TPM accounting)
+
+        Returns:
+            Whatever `call` returns
+        """
+        last_error = None
+        for attempt in range(self.max_attempts):
+            state = self.acquire(estimated_tokens)
+            try:
+                result = call(state.api_key)
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    self.release(state, rate_limited=True)
+                    self.retries += 1
+                    last_error = e
+                    continue
+                self.release(state)
+                raise
+            self.release(state)
+            return result
+
+        raise GeminiCapacityError(
+            f"❌ Gemini {self.name} still rate limited after {self.max_attempts} attempts: {last_error}"
+        )
+
+    def stream(self, call: Callable[[str], Iterator[Any]], estimated_tokens: int = 1024) -> Iterator[Any]:
+        """
+        Streaming variant of `run`: yields the items of `call(api_key)`.
+
+        The key stays leased until the stream is exhausted or closed. A 429
+        before the first item is retried on another key; once items have been
+        yielded, errors propagate to the caller.
+        """
+        last_error = None
+        for attempt in range(self.max_attempts):
+            state = self.acquire(estimated_tokens)
+            started = False
+            rate_limited = False
+            try:
+                for item in call(state.api_key):
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                if started or not is_rate_limit_error(e):
+                    raise
+                rate_limited = True
+                self.retries += 1
+                last_error = e
+            finally:
+                self.release(state, rate_limited=rate_limited)
+
+        raise GeminiCapacityError(
+            f"❌ Gemini {self.name} still rate limited after {self.max_attempts} attempts: {last_error}"
+        )
+
+    def get_stats(self) -> Dict:
+        """Queue depth and per-key utilisation over the last minute."""
+        with self._cond:
+            now = time.monotonic()
+            keys = {}
+            for state in self._keys:
+                self._refill(state, now)
+                requests = len(state.recent)
+                tokens = sum(t for _, t in state.recent)
+                keys[state.key_id] = {
+                    "in_flight": state.in_flight,
+                    "dispatched": state.dispatched,
+                    "rate_limited": state.rate_limited,
+                    "requests_last_minute": requests,
+                    "rpm_utilisation": round(requests / self.rpm_per_key, 3),
+                    "tpm_utilisation": round(tokens / self.tpm_per_key, 3),
+                    "cooldown_seconds": round(max(state.cooldown_until - now, 0.0), 1),
+                    "daily_remaining": gemini_key_manager.remaining_quota(state.key_id)
+                }
+            return {
+                "queue_depth": self.waiting,
+                "max_queue_depth": self.max_waiting,
+                "max_queue": self.max_queue,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "retries": self.retries,
+                "rpm_per_key": self.rpm_per_key,
+                "tpm_per_key": self.tpm_per_key,
+                "keys": keys
+            }
+
+
+# Global instances (generation and embedding models have separate per-minute limits)
+gemini_scheduler = GeminiScheduler(
+    "generation",
+    rpm_per_key=settings.GEMINI_RPM_PER_KEY,
+    tpm_per_key=settings.GEMINI_TPM_PER_KEY,
+    max_queue=settings.GEMINI_SCHEDULER_MAX_QUEUE,
+    wait_timeout_seconds=settings.GEMINI_SCHEDULER_WAIT_SECONDS,
+    max_attempts=settings.GEMINI_SCHEDULER_MAX_ATTEMPTS
+)
+gemini_embedding_scheduler = GeminiScheduler(
+    "embedding",
+    rpm_per_key=settings.GEMINI_EMBED_RPM_PER_KEY,
+    tpm_per_key=settings.GEMINI_EMBED_TPM_PER_KEY,
+    max_queue=settings.GEMINI_SCHEDULER_MAX_QUEUE,
+    wait_timeout_seconds=settings.GEMINI_SCHEDULER_WAIT_SECONDS,
+    max_attempts=settings.GEMINI_SCHEDULER_MAX_ATTEMPTS
+)
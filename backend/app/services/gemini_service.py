@@ -2,9 +2,13 @@
 Gemini Service - Handles all Google Gemini AI interactions with multi-key rotation.
 """
 
-import google.generativeai as genai
 from app.core.config import settings
 from app.services.gemini_key_manager import gemini_key_manager
+from app.services.embedding_cache import embedding_cache
+from app.services.gemini_client_pool import gemini_client_pool
+from app.services.gemini_scheduler import gemini_scheduler, gemini_embedding_scheduler, estimate_tokens
+from app.services.rag_executor import rag_executor
+from typing import Iterator
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,7 +18,7 @@ class GeminiService:
     """Service for interacting with Google Gemini AI with automatic key rotation."""
     
     def __init__(self):
-        # Don't configure API key here - will be set per request via key manager
+        # Don't configure API key here - each call gets a per-key client from the pool
         # Initialize Gemini 2.5 Flash model
         self.model_name = 'models/gemini-2.5-flash'
         logger.info(f"🚀 Gemini Service initialized with model: {self.model_name}")
@@ -23,38 +27,48 @@ class GeminiService:
         # Initialize embedding model
         self.embedding_model = 'models/text-embedding-004'
     
-    def _get_model_with_available_key(self, retry_count: int = 0):
+    def _generate(self, prompt) -> str:
         """
-        Get a GenerativeModel instance with an available API key.
+        Run one generate_content call on the best available key.
+        
+        The scheduler spreads calls across keys within per-minute and daily
+        limits and retries 429s on other keys with backoff.
         
         Args:
-            retry_count: Number of retries attempted (for recursive retry logic)
+            prompt: Prompt text
         
         Returns:
-            Tuple of (model, key_info) for error handling
+            Response text
         """
-        if retry_count >= len(gemini_key_manager.keys):
-            # Tried all keys, none worked
-            raise Exception(
-                "❌ All Gemini API keys exhausted or rate limited! "
-                f"Total capacity: {gemini_key_manager.get_quota_status()['total_capacity']} requests/day. "
-                "Quotas reset at midnight Pacific Time."
-            )
+        def call(api_key: str) -> str:
+            # Bind the model to this key's client (no global genai.configure)
+            model = gemini_client_pool.get_model(api_key, self.model_name)
+            return model.generate_content(prompt).text
         
-        api_key = gemini_key_manager.get_available_key()
+        return gemini_scheduler.run(call, estimated_tokens=estimate_tokens(prompt))
+    
+    def generate_response_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Stream a text response from Gemini as it is generated.
         
-        if not api_key:
-            raise Exception(
-                "❌ All Gemini API keys exhausted! "
-                f"Total capacity: {gemini_key_manager.get_quota_status()['total_capacity']} requests/day. "
-                "Quotas reset at midnight Pacific Time."
-            )
+        Args:
+            prompt: Input prompt
         
-        # Configure Gemini with the available key
-        genai.configure(api_key=api_key)
+        Yields:
+            Text deltas in generation order
+        """
+        def call(api_key: str) -> Iterator[str]:
+            model = gemini_client_pool.get_model(api_key, self.model_name)
+            for chunk in model.generate_content(prompt, stream=True):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. safety / finish metadata only)
+                    continue
+                if text:
+                    yield text
         
-        # Return model instance with current key index for error handling
-        return genai.GenerativeModel(self.model_name), gemini_key_manager.current_key_index
+        yield from gemini_scheduler.stream(call, estimated_tokens=estimate_tokens(prompt))
     
     def generate_embedding(self, text: str) -> list[float]:
         """
@@ -67,29 +81,37 @@ class GeminiService:
             Embedding vector (list of floats)
         """
         try:
-            # Configure API key before embedding generation
-            from app.services.gemini_key_manager import gemini_key_manager
-            api_key = gemini_key_manager.get_available_key()
-            genai.configure(api_key=api_key)
-            
-            result = genai.embed_content(
+            # Repeated questions are served from the embedding cache
+            return embedding_cache.get_or_compute(
+                self.embedding_model,
+                "retrieval_query",
+                text,
+                self._embed_query
+            )
+        
+        except Exception as e:
+            logger.error(f"❌ Embedding generation failed: {e}")
+            raise
+    
+    def _embed_query(self, text: str) -> list[float]:
+        """Call the Gemini embedding API (cache miss)."""
+        def call(api_key: str) -> list[float]:
+            result = gemini_client_pool.embed_content(
+                api_key,
                 model=self.embedding_model,
                 content=text,
                 task_type="retrieval_query"
             )
             return result['embedding']
         
-        except Exception as e:
-            logger.error(f"❌ Embedding generation failed: {e}")
-            raise
+        return gemini_embedding_scheduler.run(call, estimated_tokens=estimate_tokens(text, output_tokens=0))
     
     def format_explanation(
         self, 
         context: str, 
         question: str, 
         mode: str,
-        class_level: int = 6,
-        retry_count: int = 0
+        class_level: int = 6
     ) -> str:
         """
         Generate explanation using Gemini based on RAG context and mode.
@@ -99,7 +121,6 @@ class GeminiService:
             question: Student's highlighted text/question
             mode: Explanation mode (simple/meaning/story/example/summary)
             class_level: Student's class level (5-10)
-            retry_count: Number of retries attempted (internal use)
         
         Returns:
             Formatted explanation string
@@ -108,64 +129,39 @@ class GeminiService:
             # Build mode-specific prompt with class level
             prompt = self._build_prompt(context, question, mode, class_level)
             
-            # Get model with available API key
-            model, key_index = self._get_model_with_available_key(retry_count)
-            
-            # Generate response
-            response = model.generate_content(prompt)
-            
-            return response.text
+            # Generate response on the best available key
+            return self._generate(prompt)
         
         except Exception as e:
-            error_str = str(e)
-            
-            # Check if it's a 429 rate limit error
-            if "429" in error_str and retry_count < len(gemini_key_manager.keys):
-                logger.warning(f"⚠️  429 Rate limit hit. Rotating to next key (retry {retry_count + 1})...")
-                
-                # Force rotation to next key
-                gemini_key_manager.current_key_index = (gemini_key_manager.current_key_index + 1) % len(gemini_key_manager.keys)
-                
-                # Retry with next key
-                return self.format_explanation(context, question, mode, class_level, retry_count + 1)
-            
             logger.error(f"❌ Gemini explanation failed: {e}")
             raise
     
-    def generate_response(self, prompt: str, retry_count: int = 0) -> str:
+    def generate_response(self, prompt: str) -> str:
         """
         Generate a simple text response from Gemini with automatic retry on 429 errors.
         
         Args:
             prompt: Input prompt
-            retry_count: Number of retries attempted (internal use)
         
         Returns:
             Generated text response
         """
         try:
-            # Get model with available API key
-            model, key_index = self._get_model_with_available_key(retry_count)
-            
-            response = model.generate_content(prompt)
-            return response.text
+            # Generate response on the best available key
+            return self._generate(prompt)
         
         except Exception as e:
-            error_str = str(e)
-            
-            # Check if it's a 429 rate limit error
-            if "429" in error_str and retry_count < len(gemini_key_manager.keys):
-                logger.warning(f"⚠️  429 Rate limit hit. Rotating to next key (retry {retry_count + 1})...")
-                
-                # Force rotation to next key
-                gemini_key_manager.current_key_index = (gemini_key_manager.current_key_index + 1) % len(gemini_key_manager.keys)
-                
-                # Retry with next key
-                return self.generate_response(prompt, retry_count + 1)
-            
             logger.error(f"❌ Gemini generation failed: {e}")
             raise
     
+    async def generate_text(self, prompt: str) -> str:
+        """
+        Async variant of generate_response for `async def` callers.
+        
+        Runs on the RAG executor so the blocking call does not stall the event loop.
+        """
+        return await rag_executor.run(self.generate_response, prompt)
+    
     def _build_prompt(self, context: str, question: str, mode: str, class_level: int = 6) -> str:
         """Build prompt based on mode and class level to generate helpful answers."""
         
@@ -274,8 +270,7 @@ MODE: SUMMARY (Class {class_level})
         num_questions: int,
         class_level: int,
         subject: str,
-        chapter: int,
-        retry_count: int = 0
+        chapter: int
     ) -> list[dict]:
         """
         Generate concept-based MCQs using Gemini with automatic retry on 429 errors.
@@ -286,7 +281,6 @@ MODE: SUMMARY (Class {class_level})
             class_level: Student's class (5-10)
             subject: Subject name
             chapter: Chapter number
-            retry_count: Number of retries attempted (internal use)
         
         Returns:
             List of MCQ dictionaries
@@ -320,14 +314,12 @@ OUTPUT FORMAT (JSON):
 
 Generate {num_questions} MCQs now in valid JSON format:"""
             
-            # Get model with available API key
-            model, key_index = self._get_model_with_available_key(retry_count)
-            response = model.generate_content(prompt)
+            # Generate on the best available key
+            text = self._generate(prompt)
             
             # Parse JSON response
             import json
             # Extract JSON from response (handle markdown code blocks)
-            text = response.text
             if "```json" in text:
                 text = text.split("```json")[1].split("```")[0]
             elif "```" in text:
@@ -337,18 +329,6 @@ Generate {num_questions} MCQs now in valid JSON format:"""
             return mcqs
         
         except Exception as e:
-            error_str = str(e)
-            
-            # Check if it's a 429 rate limit error
-            if "429" in error_str and retry_count < len(gemini_key_manager.keys):
-                logger.warning(f"⚠️  429 Rate limit hit. Rotating to next key (retry {retry_count + 1})...")
-                
-                # Force rotation to next key
-                gemini_key_manager.current_key_index = (gemini_key_manager.current_key_index + 1) % len(gemini_key_manager.keys)
-                
-                # Retry with next key
-                return self.generate_mcqs(context, num_questions, class_level, subject, chapter, retry_count + 1)
-            
             logger.error(f"❌ MCQ generation failed: {e}")
             raise
     
@@ -357,8 +337,7 @@ Generate {num_questions} MCQs now in valid JSON format:"""
         questions_and_answers: list[dict],
         class_level: int,
         subject: str,
-        chapter: int,
-        retry_count: int = 0
+        chapter: int
     ) -> dict:
         """
         Evaluate voice assessment answers using Gemini AI with automatic retry on 429 errors.
@@ -368,7 +347,6 @@ Generate {num_questions} MCQs now in valid JSON format:"""
             class_level: Student's class
             subject: Subject name
             chapter: Chapter number
-            retry_count: Number of retries attempted (internal use)
         
         Returns:
             Evaluation result with score and feedback
@@ -410,13 +388,11 @@ OUTPUT FORMAT (JSON):
 
 Provide evaluation in JSON format:"""
             
-            # Get model with available API key
-            model, key_index = self._get_model_with_available_key(retry_count)
-            response = model.generate_content(prompt)
+            # Generate on the best available key
+            text = self._generate(prompt)
             
             # Parse JSON response
             import json
-            text = response.text
             if "```json" in text:
                 text = text.split("```json")[1].split("```")[0]
             elif "```" in text:
@@ -426,18 +402,6 @@ Provide evaluation in JSON format:"""
             return evaluation
         
         except Exception as e:
-            error_str = str(e)
-            
-            # Check if it's a 429 rate limit error
-            if "429" in error_str and retry_count < len(gemini_key_manager.keys):
-                logger.warning(f"⚠️  429 Rate limit hit. Rotating to next key (retry {retry_count + 1})...")
-                
-                # Force rotation to next key
-                gemini_key_manager.current_key_index = (gemini_key_manager.current_key_index + 1) % len(gemini_key_manager.keys)
-                
-                # Retry with next key
-                return self.evaluate_assessment(questions_and_answers, class_level, subject, chapter, retry_count + 1)
-            
             logger.error(f"❌ Assessment evaluation failed: {e}")
             raise
 
@@ -0,0 +1,239 @@
+"""
+Ingestion Cache - Content-addressed local cache for book ingestion.
+
+Regenerating a book's embeddings used to redo everything: rasterize, OCR, Gemini
+Vision, chunk and embed every chunk, then upsert every vector - even when only a
+few pages changed or only chunking parameters were tuned. This SQLite store
+(shared by the API and worker processes) remembers:
+
+- pages: per-page extraction results, keyed by a fingerprint of the PDF page
+  (content stream + embedded images) and the extractor version/parameters
+- chunk_embeddings: document embeddings, keyed by model, task type and exact chunk text
+- vectors: the vector IDs (and a hash of their text + metadata) last upserted for
+  each source (namespace + book), so a re-run upserts only changed vectors and
+  deletes the ones whose chunks disappeared
+"""
+
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from app.core.config import settings
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def page_fingerprint(page) -> Optional[str]:
+    """
+    Hash of what a PyPDF2 page draws: its content stream(s), embedded images and
+    form XObjects, box and rotation. None if the page cannot be read.
+    """
+    try:
+        digest = hashlib.sha256()
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources is not None else {}
+        xobjects = resources.get("/XObject")
+        if xobjects is not None:
+            xobjects = xobjects.get_object()
+            for name in sorted(xobjects):
+                xobject = xobjects[name].get_object()
+                digest.update(name.encode("utf-8"))
+                try:
+                    digest.update(xobject.get_data())
+                except Exception:
+                    digest.update(repr(sorted(xobject.items())).encode("utf-8"))
+
+        digest.update(repr([float(value) for value in page.mediabox]).encode("utf-8"))
+        digest.update(str(page.get("/Rotate", 0)).encode("utf-8"))
+        return digest.hexdigest()
+    except Exception as e:
+        logger.debug(f"Page fingerprint failed: {e}")
+        return None
+
+
+class IngestionCache:
+    """SQLite-backed page, chunk-embedding and upserted-vector cache."""
+
+    def __init__(self, path: Optional[str] = "cache/ingestion.sqlite3"):
+        self.path = path or None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "page_hits": 0,
+            "page_misses": 0,
+            "embedding_hits": 0,
+            "embedding_misses": 0,
+            "vectors_unchanged": 0,
+            "vectors_deleted": 0,
+            "errors": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    # ==================== KEYS ====================
+
+    @staticmethod
+    def page_key(extractor: str, params: Dict, fingerprint: str) -> str:
+        """Cache key for a page's extraction under one extractor version and parameters."""
+        raw = f"{extractor}|{json.dumps(params, sort_keys=True)}|{fingerprint}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def embedding_key(model: str, task_type: str, text: str) -> str:
+        raw = f"{model}|{task_type}|{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def vector_hash(text: str, metadata: Dict, model: str) -> str:
+        """Hash of everything that ends up in a Pinecone vector."""
+        raw = f"{model}|{text}|{json.dumps(metadata, sort_keys=True, default=str)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ==================== STORE ====================
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the SQLite store on first use (caller holds _lock)."""
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "key TEXT PRIMARY KEY, data TEXT, last_used REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "namespace TEXT, source_id TEXT, vector_id TEXT, content_hash TEXT, updated_at REAL, "
+                "PRIMARY KEY (namespace, source_id, vector_id))"
+            )
+            self._conn = conn
+            logger.info(f"✅ Ingestion cache: {self.path}")
+        return self._conn
+
+    def _execute(self, write: bool, fn):
+        """Run fn(conn) under the lock; errors are logged and treated as a miss."""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                value = fn(conn)
+                if write:
+                    conn.commit()
+                return value
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Ingestion cache operation failed: {e}")
+            return None
+
+    # ==================== PAGES ====================
+
+    def get_page(self, key: str) -> Optional[Dict]:
+        row = self._execute(False, lambda conn: conn.execute(
+            "SELECT data FROM pages WHERE key = ?", (key,)
+        ).fetchone())
+        if row is None:
+            self.stats["page_misses"] += 1
+            return None
+        self.stats["page_hits"] += 1
+        return json.loads(row[0])
+
+    def put_page(self, key: str, data: Dict):
+        self._execute(True, lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO pages (key, data, last_used) VALUES (?, ?, ?)",
+            (key, json.dumps(data), time.time())
+        ))
+
+    # ==================== CHUNK EMBEDDINGS ====================
+
+    def get_embedding(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        key = self.embedding_key(model, task_type, text)
+        row = self._execute(False, lambda conn: conn.execute(
+            "SELECT vector FROM chunk_embeddings WHERE key = ?", (key,)
+        ).fetchone())
+        if row is None:
+            self.stats["embedding_misses"] += 1
+            return None
+        self.stats["embedding_hits"] += 1
+        return _unpack(row[0])
+
+    def put_embedding(self, model: str, task_type: str, text: str, vector: List[float]):
+        key = self.embedding_key(model, task_type, text)
+        self._execute(True, lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO chunk_embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+            (key, model, _pack(vector), time.time())
+        ))
+
+    # ==================== UPSERTED VECTORS ====================
+
+    def get_vectors(self, namespace: str, source_id: str) -> Dict[str, str]:
+        """vector_id -> content hash last upserted for this source."""
+        rows = self._execute(False, lambda conn: conn.execute(
+            "SELECT vector_id, content_hash FROM vectors WHERE namespace = ? AND source_id = ?",
+            (namespace, source_id)
+        ).fetchall())
+        return dict(rows or [])
+
+    def record_vectors(self, namespace: str, source_id: str, hashes: Dict[str, str]):
+        if not hashes:
+            return
+        now = time.time()
+        self._execute(True, lambda conn: conn.executemany(
+            "INSERT OR REPLACE INTO vectors (namespace, source_id, vector_id, content_hash, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(namespace, source_id, vector_id, content_hash, now) for vector_id, content_hash in hashes.items()]
+        ))
+
+    def forget_vectors(self, namespace: str, source_id: str, vector_ids: Optional[Iterable[str]] = None):
+        """Forget some (or all) vectors recorded for a source, e.g. after deleting them."""
+        if vector_ids is None:
+            self._execute(True, lambda conn: conn.execute(
+                "DELETE FROM vectors WHERE namespace = ? AND source_id = ?", (namespace, source_id)
+            ))
+            return
+        vector_ids = list(vector_ids)
+        if vector_ids:
+            self._execute(True, lambda conn: conn.executemany(
+                "DELETE FROM vectors WHERE namespace = ? AND source_id = ? AND vector_id = ?",
+                [(namespace, source_id, vector_id) for vector_id in vector_ids]
+            ))
+
+    def forget_namespace(self, namespace: str):
+        """Forget every vector recorded in a namespace (after the namespace was cleared)."""
+        self._execute(True, lambda conn: conn.execute(
+            "DELETE FROM vectors WHERE namespace = ?", (namespace,)
+        ))
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, "path": self.path}
+
+
+# Global instance
+ingestion_cache = IngestionCache(path=settings.INGESTION_CACHE_PATH)
@@ -3,8 +3,9 @@ LLM Storage Service
 Stores high-quality LLM-generated answers for reuse and knowledge building.
 """
 
-from sentence_transformers import SentenceTransformer
 from app.db.mongo import pinecone_llm_db
+from app.services.embedding_registry import embedding_registry
+from app.services.llm_usage_tracker import llm_usage_tracker
 import hashlib
 import logging
 import re
@@ -19,9 +20,12 @@ class LLMStorageService:
     """
     
     def __init__(self):
-        """Initialize LLM storage service with embedding model."""
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-        logger.info("✅ LLM Storage Service initialized with sentence-transformers")
+        """Initialize LLM storage service with the llm index's registered embedder."""
+        # Writers and readers of ncert-llm must share one vector space, so the
+        # embedder comes from the registry rather than a hard-coded model.
+        # Stored vectors embed the *question*, so both sides use query embeddings.
+        self.embedder = embedding_registry.get_embedder("llm")
+        logger.info(f"✅ LLM Storage Service initialized with {self.embedder.spec.name} embeddings")
     
     def store_answer(
         self,
@@ -57,7 +61,7 @@ class LLMStorageService:
                 topic = self._extract_topic(question)
             
             # Generate embedding from question
-            question_embedding = self.embedding_model.encode(question).tolist()
+            question_embedding = self.embedder.embed_query(question)
             
             # Create unique ID
             question_hash = hashlib.md5(question.lower().strip().encode()).hexdigest()[:16]
@@ -72,7 +76,8 @@ class LLMStorageService:
                 topic=topic,
                 class_level=class_level,
                 embedding=question_embedding,
-                quality_score=quality_score
+                quality_score=quality_score,
+                embedding_model=self.embedder.spec.name
             )
             
             if success:
@@ -216,7 +221,7 @@ class LLMStorageService:
         """
         try:
             # Generate query embedding
-            query_embedding = self.embedding_model.encode(question).tolist()
+            query_embedding = self.embedder.embed_query(question)
             
             # Query Pinecone LLM DB
             results = pinecone_llm_db.query(
@@ -226,23 +231,23 @@ class LLMStorageService:
             )
             
             # Filter by score and format results
+            matches = [match for match in results.get('matches', []) if match.get('score', 0) >= min_score]
+            # Count the reuse (buffered, flushed to Mongo in the background)
+            for match in matches:
+                llm_usage_tracker.record(match['id'], subject)
+            usage_counts = llm_usage_tracker.get_usage_counts([match['id'] for match in matches]) if matches else {}
+            
             matching_answers = []
-            for match in results.get('matches', []):
-                score = match.get('score', 0)
-                if score >= min_score:
-                    metadata = match.get('metadata', {})
-                    
-                    # Increment usage count
-                    pinecone_llm_db.increment_usage(match['id'], subject)
-                    
-                    matching_answers.append({
-                        'text': metadata.get('answer', ''),
-                        'score': score,
-                        'source': 'llm_generated',
-                        'topic': metadata.get('topic', 'general'),
-                        'quality_score': metadata.get('quality_score', 0.9),
-                        'usage_count': metadata.get('usage_count', 0) + 1
-                    })
+            for match in matches:
+                metadata = match.get('metadata', {})
+                matching_answers.append({
+                    'text': metadata.get('answer', ''),
+                    'score': match.get('score', 0),
+                    'source': 'llm_generated',
+                    'topic': metadata.get('topic', 'general'),
+                    'quality_score': metadata.get('quality_score', 0.9),
+                    'usage_count': usage_counts.get(match['id'], 0)
+                })
             
             if matching_answers:
                 scores_list = [f"{a['score']:.2f}" for a in matching_answers]
@@ -0,0 +1,146 @@
+"""
+LLM Usage Tracker - Write-behind usage counters for stored LLM answers.
+
+Cache hits used to bump `usage_count` in the answer's Pinecone metadata inline,
+fetching the full vector and upserting it again (two network calls on the hot
+path). Hits are now recorded in an in-memory buffer and flushed in bulk (`$inc`)
+to the MongoDB `llm_answer_usage` collection by a background thread, so responses
+never wait on usage tracking and counts survive restarts. Retrieved answers report
+their count from here (get_usage_counts); the Pinecone `usage_count` is no longer kept.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.db.mongo import db
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUsageTracker:
+    """Buffers usage increments per stored answer and flushes them periodically."""
+
+    def __init__(self, flush_interval_seconds: float = 30.0, collection_name: str = "llm_answer_usage"):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.collection_name = collection_name
+
+        self._buffer: Counter = Counter()  # (vector_id, subject) -> pending increments
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.flushed_total = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.last_flush_at: Optional[datetime] = None
+
+    def start(self):
+        """Start the background flush thread (idempotent)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="llm-usage-flush",
+                daemon=True
+            )
+            self._thread.start()
+        logger.info(f"✅ LLM usage tracker started (flush every {self.flush_interval_seconds}s)")
+
+    def stop(self):
+        """Stop the flush thread and write out any buffered counts."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def record(self, vector_id: str, subject: str):
+        """Record one use of a stored answer (non-blocking)."""
+        with self._lock:
+            self._buffer[(vector_id, subject.lower())] += 1
+        if self._thread is None:
+            self.start()
+
+    def flush(self) -> int:
+        """
+        Flush buffered increments to MongoDB in a single bulk write.
+
+        Returns:
+            Number of increments written
+        """
+        with self._lock:
+            if not self._buffer:
+                return 0
+            pending, self._buffer = self._buffer, Counter()
+
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"_id": vector_id},
+                {
+                    "$inc": {"usage_count": count},
+                    "$set": {"subject": subject, "last_used": now}
+                },
+                upsert=True
+            )
+            for (vector_id, subject), count in pending.items()
+        ]
+
+        try:
+            db.get_collection(self.collection_name).bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Put the counts back so they are retried on the next flush
+            with self._lock:
+                self._buffer.update(pending)
+            self.flush_errors += 1
+            logger.warning(f"LLM usage flush failed ({len(operations)} answers): {e}")
+            return 0
+
+        written = sum(pending.values())
+        self.flushed_total += written
+        self.flush_count += 1
+        self.last_flush_at = now
+        logger.debug(f"Flushed {written} usage increments for {len(operations)} stored answers")
+        return written
+
+    def get_usage_counts(self, vector_ids: List[str]) -> Dict[str, int]:
+        """Persisted + still-buffered usage counts for the given answers."""
+        counts = {vector_id: 0 for vector_id in vector_ids}
+        try:
+            for doc in db.get_collection(self.collection_name).find({"_id": {"$in": vector_ids}}):
+                counts[doc["_id"]] = doc.get("usage_count", 0)
+        except Exception as e:
+            logger.warning(f"Failed to read LLM usage counts: {e}")
+
+        with self._lock:
+            for (vector_id, _subject), count in self._buffer.items():
+                if vector_id in counts:
+                    counts[vector_id] += count
+        return counts
+
+    def get_stats(self) -> Dict:
+        """Buffer and flush statistics."""
+        with self._lock:
+            buffered = sum(self._buffer.values())
+        return {
+            "buffered_increments": buffered,
+            "flushed_total": self.flushed_total,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "last_flush_at": self.last_flush_at.isoformat() if self.last_flush_at else None,
+            "flush_interval_seconds": self.flush_interval_seconds
+        }
+
+
+# Global instance
+llm_usage_tracker = LLMUsageTracker(flush_interval_seconds=settings.LLM_USAGE_FLUSH_SECONDS)
@@ -0,0 +1,173 @@
+"""
+Model Registry - Process-wide cache for heavyweight ML models.
+
+LLMStorageService, WebScraperService, PhysicsEmbedder and MultimodalEmbedder used
+to construct their own SentenceTransformer in __init__, so importing the app
+loaded the same ~420MB model several times. Models are now registered here by
+name, loaded at most once per process (lazily on first use or by a background
+warm-up started from the app lifespan), and report their load time and the
+resident memory they added so worker memory can be sized.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process in MB (None if it cannot be read)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _ModelEntry:
+    """One registered model and its load statistics."""
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self.loader = loader
+        self.model = None
+        self.lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.rss_delta_mb: Optional[float] = None
+        self.loaded_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "loaded": self.model is not None,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "rss_delta_mb": round(self.rss_delta_mb, 1) if self.rss_delta_mb is not None else None,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "error": self.error
+        }
+
+
+class ModelRegistry:
+    """Loads each registered model once per process and shares the instance."""
+
+    def __init__(self):
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """Register a zero-argument loader under `name` (no-op if already registered)."""
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _ModelEntry(name, loader)
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry.model is not None
+
+    def get(self, name: str) -> Any:
+        """Get a model, loading it on first use. Concurrent callers wait for one load."""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model '{name}' is not registered")
+
+        if entry.model is not None:
+            return entry.model
+
+        with entry.lock:
+            if entry.model is None:
+                logger.info(f"📦 Loading model {name}...")
+                rss_before = current_rss_mb()
+                started_at = time.perf_counter()
+                try:
+                    model = entry.loader()
+                except Exception as e:
+                    entry.error = str(e)
+                    logger.error(f"❌ Failed to load model {name}: {e}")
+                    raise
+
+                entry.load_seconds = time.perf_counter() - started_at
+                rss_after = current_rss_mb()
+                if rss_before is not None and rss_after is not None:
+                    entry.rss_delta_mb = rss_after - rss_before
+                entry.loaded_at = datetime.now(timezone.utc)
+                entry.error = None
+                entry.model = model
+                logger.info(
+                    f"✅ Model {name} loaded in {entry.load_seconds:.1f}s "
+                    f"(+{entry.rss_delta_mb or 0:.0f}MB RSS)"
+                )
+        return entry.model
+
+    def get_sentence_transformer(self, model_id: str, device: Optional[str] = None):
+        """
+        Get the shared SentenceTransformer for a model ID.
+
+        Args:
+            model_id: e.g. "sentence-transformers/all-mpnet-base-v2"
+            device: 'cuda', 'cpu' or None for auto
+
+        Returns:
+            SentenceTransformer instance (one per model ID and device)
+        """
+        import torch
+        device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        name = f"{model_id}@{device}"
+
+        def load():
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(model_id, device=device)
+
+        self.register(name, load)
+        return self.get(name)
+
+    def warm_up(self, loaders: Iterable[Callable[[], Any]]) -> threading.Thread:
+        """
+        Load models in a background thread so the first request does not pay for it.
+
+        Args:
+            loaders: Callables that each fetch a model through this registry
+                     (e.g. `lambda: model_registry.get_sentence_transformer(...)`)
+
+        Returns:
+            The (daemon) warm-up thread
+        """
+        loaders = list(loaders)
+
+        def run():
+            for loader in loaders:
+                try:
+                    loader()
+                except Exception as e:
+                    logger.warning(f"Model warm-up failed: {e}")
+            logger.info(f"🔥 Model warm-up finished ({len(loaders)} models)")
+
+        self._warm_up_thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def get_stats(self) -> Dict:
+        """Per-model load time / memory plus current process RSS."""
+        with self._lock:
+            entries = dict(self._entries)
+        rss = current_rss_mb()
+        return {
+            "process_rss_mb": round(rss, 1) if rss is not None else None,
+            "warm_up_running": bool(self._warm_up_thread and self._warm_up_thread.is_alive()),
+            "models": {name: entry.to_dict() for name, entry in entries.items()}
+        }
+
+
+# Global instance
+model_registry = ModelRegistry()
@@ -11,11 +11,11 @@ Priority:
 4. Combined → weighted combination
 """
 
-from sentence_transformers import SentenceTransformer
 import numpy as np
 from typing import List, Dict, Optional, Union
 import logging
 from pathlib import Path
+from app.services.model_registry import model_registry
 
 logger = logging.getLogger(__name__)
 
@@ -48,7 +48,7 @@ class MultimodalEmbedder:
         
         # Load text/formula embedder
         try:
-            self.text_model = SentenceTransformer(text_model_name, device=self.device)
+            self.text_model = model_registry.get_sentence_transformer(text_model_name, device=self.device)
             
             # Verify output dimension
             test_emb = self.text_model.encode("test")
@@ -18,6 +18,7 @@ import logging
 from PIL import Image
 import io
 import re
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -290,29 +291,40 @@ class PDFProcessor:
         
         logger.info(f"🔍 Using OCR for scanned PDF: {pdf_path}")
         
-        # Convert PDF to images
-        images = convert_from_path(pdf_path)
+        # Convert PDF to images a few pages at a time (bounded memory for long books)
+        with fitz.open(pdf_path) as doc:
+            total_pages = doc.page_count
+        page_window = max(1, settings.PDF_PAGE_WINDOW)
         
         text_blocks = []
         
-        for page_num, img in enumerate(images):
-            logger.info(f"   OCR page {page_num + 1}/{len(images)}")
+        for first_page in range(1, total_pages + 1, page_window):
+            images = convert_from_path(
+                pdf_path,
+                first_page=first_page,
+                last_page=min(first_page + page_window - 1, total_pages)
+            )
             
-            # Apply OCR
-            text = pytesseract.image_to_string(img, lang='eng')
+            for page_num, img in enumerate(images, start=first_page - 1):
+                logger.info(f"   OCR page {page_num + 1}/{total_pages}")
+                
+                # Apply OCR
+                text = pytesseract.image_to_string(img, lang='eng')
+                
+                if text.strip():
+                    text_blocks.append({
+                        "text": text.strip(),
+                        "page_number": page_num + 1,
+                        "block_index": 0,
+                        "ocr": True,
+                        "metadata": {
+                            "class": str(class_num),
+                            "chapter": str(chapter_num),
+                            "page": page_num + 1
+                        }
+                    })
             
-            if text.strip():
-                text_blocks.append({
-                    "text": text.strip(),
-                    "page_number": page_num + 1,
-                    "block_index": 0,
-                    "ocr": True,
-                    "metadata": {
-                        "class": str(class_num),
-                        "chapter": str(chapter_num),
-                        "page": page_num + 1
-                    }
-                })
+            del images
         
         logger.info(f"✅ OCR extracted {len(text_blocks)} text blocks")
         
@@ -322,7 +334,7 @@ class PDFProcessor:
             "metadata": {
                 "class": class_num,
                 "chapter": chapter_num,
-                "total_pages": len(images),
+                "total_pages": total_pages,
                 "ocr_used": True
             }
         }
@@ -5,11 +5,11 @@ Uploads chunks with 768-dim embeddings to Pinecone mathematics namespace.
 Handles batch uploads with comprehensive metadata.
 
 Features:
-- Batch upsert to Pinecone
+- Concurrent, payload-size-aware batch upsert (shared upsert engine)
 - Automatic namespace routing
 - Metadata validation
 - Progress tracking
-- Error handling and retry logic
+- Error handling, retry with backoff and resumable checkpoints
 """
 
 from typing import List, Dict, Optional, Tuple
@@ -17,7 +17,7 @@ import logging
 from pinecone import Pinecone
 import numpy as np
 from tqdm import tqdm
-import time
+from app.services.upsert_engine import create_upsert_engine
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +35,8 @@ class PineconeUploader:
         self,
         api_key: str,
         index_name: str,
-        index_host: Optional[str] = None
+        index_host: Optional[str] = None,
+        embedding_model: str = "all-mpnet-base-v2"
     ):
         """
         Initialize Pinecone uploader.
@@ -44,7 +45,10 @@ class PineconeUploader:
             api_key: Pinecone API key
             index_name: Pinecone index name
             index_host: Optional index host URL
+            embedding_model: Registry name of the model that produced the embeddings
+                             (tagged on every vector, see embedding_registry.py)
         """
+        self.embedding_model = embedding_model
         logger.info(f"📤 Initializing Pinecone Uploader")
         logger.info(f"   Index: {index_name}")
         
@@ -65,6 +69,7 @@ class PineconeUploader:
             logger.info(f"   Dimension: {stats.get('dimension', 'unknown')}")
             
             self.index_name = index_name
+            self.upsert_engine = create_upsert_engine(self.index)
         
         except Exception as e:
             logger.error(f"❌ Failed to initialize Pinecone: {e}")
@@ -76,7 +81,9 @@ class PineconeUploader:
         embeddings: List[np.ndarray] = None,
         namespace: str = "mathematics",
         batch_size: int = 100,
-        show_progress: bool = True
+        show_progress: bool = True,
+        checkpoint_key: Optional[str] = None,
+        refresh: bool = False
     ) -> Dict:
         """
         Upload chunks with embeddings to Pinecone.
@@ -85,8 +92,11 @@ class PineconeUploader:
             chunks: List of chunk dictionaries (with or without 'embedding' key)
             embeddings: List of 768-dim embeddings (optional if chunks have 'embedding' key)
             namespace: Pinecone namespace
-            batch_size: Batch size for upsert
+            batch_size: Maximum vectors per upsert request (batches are also split by payload size)
             show_progress: Show progress bar
+            checkpoint_key: Identifies this upload across runs (e.g. the PDF name); vectors
+                            already upserted under it are skipped, so a crashed run resumes
+            refresh: Re-upsert every vector even if the checkpoint records it
         
         Returns:
             Upload statistics
@@ -116,42 +126,38 @@ class PineconeUploader:
                 "metadata": metadata
             })
         
-        # Upload in batches
-        total_uploaded = 0
-        failed_uploads = []
+        # Upload (concurrent batches, retried and checkpointed by the upsert engine)
+        progress_bar = tqdm(total=len(vectors), desc="Uploading") if show_progress else None
         
-        iterator = tqdm(range(0, len(vectors), batch_size), desc="Uploading") if show_progress else range(0, len(vectors), batch_size)
+        def on_progress(done: int, total: int, message: str):
+            if progress_bar is not None:
+                progress_bar.update(done - progress_bar.n)
         
-        for i in iterator:
-            batch = vectors[i:i + batch_size]
-            
-            try:
-                # Upsert batch
-                self.index.upsert(
-                    vectors=batch,
-                    namespace=namespace
-                )
-                
-                total_uploaded += len(batch)
-                logger.debug(f"   Uploaded batch {i // batch_size + 1}: {len(batch)} vectors")
-                
-                # Small delay to avoid rate limits
-                time.sleep(0.1)
-            
-            except Exception as e:
-                logger.error(f"❌ Failed to upload batch starting at {i}: {e}")
-                failed_uploads.extend([v['id'] for v in batch])
-                continue
+        try:
+            result = self.upsert_engine.upsert(
+                vectors,
+                namespace,
+                checkpoint_key=checkpoint_key,
+                resume=not refresh,
+                progress_callback=on_progress,
+                max_batch_vectors=batch_size
+            )
+        finally:
+            if progress_bar is not None:
+                progress_bar.close()
         
         logger.info(f"✅ Upload complete!")
-        logger.info(f"   Successful: {total_uploaded}")
-        logger.info(f"   Failed: {len(failed_uploads)}")
+        logger.info(f"   Successful: {result['upserted']}")
+        logger.info(f"   Skipped (already uploaded): {result['skipped']}")
+        logger.info(f"   Failed: {result['failed']}")
         
         return {
             "total": len(chunks),
-            "uploaded": total_uploaded,
-            "failed": len(failed_uploads),
-            "failed_ids": failed_uploads,
+            "uploaded": result['upserted'],
+            "skipped": result['skipped'],
+            "failed": result['failed'],
+            "failed_ids": result['failed_ids'],
+            "retries": result['retries'],
             "namespace": namespace
         }
     
@@ -173,6 +179,7 @@ class PineconeUploader:
             "has_formula": chunk.get('has_formula', False),
             "has_image": chunk.get('has_image', False),
             "content_type": chunk.get('content_type', 'unknown'),
+            "embedding_model": self.embedding_model,
         })
         
         # Add formula if present
@@ -254,6 +261,8 @@ class PineconeUploader:
         
         try:
             self.index.delete(delete_all=True, namespace=namespace)
+            if self.upsert_engine.checkpoint is not None:
+                self.upsert_engine.checkpoint.forget_namespace(namespace)
             logger.info(f"✅ Namespace '{namespace}' cleared")
         
         except Exception as e:
@@ -6,12 +6,12 @@ Generates 768-dim unified embeddings for all physics content types.
 
 import torch
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
 from typing import List, Dict, Optional
 import logging
 from pathlib import Path
+from app.services.model_registry import model_registry
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +24,12 @@ class PhysicsEmbedder:
         self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
         logger.info(f"🔢 Initializing Physics Embedder on device: {self.device}")
         
-        # Text model (768-dim native)
+        # Text model (768-dim native), shared with the rest of the process
         logger.info("   Loading text model...")
-        self.text_model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-        self.text_model.to(self.device)
+        self.text_model = model_registry.get_sentence_transformer(
+            'sentence-transformers/all-mpnet-base-v2',
+            device=self.device
+        )
         logger.info(f"   ✅ Text model loaded: all-mpnet-base-v2 (768-dim)")
         
         # CLIP for diagrams (lazy load)
@@ -1,14 +1,16 @@
 """
 Physics Uploader
 
-Uploads physics chunks to Pinecone 'physics' namespace.
+Uploads physics chunks to Pinecone 'physics' namespace through the shared upsert
+engine (concurrent, payload-size-aware batches with retry and resumable checkpoints).
 """
 
 from pinecone import Pinecone
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import logging
 import os
 from tqdm import tqdm
+from app.services.upsert_engine import create_upsert_engine
 
 logger = logging.getLogger(__name__)
 
@@ -16,16 +18,23 @@ logger = logging.getLogger(__name__)
 class PhysicsUploader:
     """Upload physics chunks to Pinecone"""
     
-    def __init__(self, api_key: str = None, index_name: str = "ncert-all-subjects"):
-        """Initialize Pinecone connection"""
+    def __init__(
+        self,
+        api_key: str = None,
+        index_name: str = "ncert-all-subjects",
+        embedding_model: str = "all-mpnet-base-v2"
+    ):
+        """Initialize Pinecone connection (embedding_model is tagged on every vector)"""
         self.api_key = api_key or os.getenv("PINECONE_API_KEY")
         self.index_name = index_name
+        self.embedding_model = embedding_model
         
         logger.info(f"🌲 Initializing Physics Uploader...")
         
         # Connect to Pinecone
         self.pc = Pinecone(api_key=self.api_key)
         self.index = self.pc.Index(self.index_name)
+        self.upsert_engine = create_upsert_engine(self.index)
         
         logger.info(f"   Connected to index: {self.index_name}")
         logger.info(f"✅ Physics Uploader ready")
@@ -34,7 +43,9 @@ class PhysicsUploader:
         self,
         chunks: List[Dict],
         namespace: str = "physics",
-        batch_size: int = 100
+        batch_size: int = 100,
+        checkpoint_key: Optional[str] = None,
+        refresh: bool = False
     ) -> Dict:
         """
         Upload chunks to Pinecone
@@ -42,7 +53,10 @@ class PhysicsUploader:
         Args:
             chunks: List of chunks with embeddings
             namespace: Pinecone namespace (default: physics)
-            batch_size: Number of vectors per batch
+            batch_size: Maximum vectors per batch (batches are also split by payload size)
+            checkpoint_key: Identifies this upload across runs (e.g. the PDF name); vectors
+                            already upserted under it are skipped, so a crashed run resumes
+            refresh: Re-upsert every vector even if the checkpoint records it
         
         Returns:
             Upload statistics
@@ -52,23 +66,22 @@ class PhysicsUploader:
         # Convert chunks to Pinecone format
         vectors = self._prepare_vectors(chunks)
         
-        # Upload in batches
-        total_uploaded = 0
-        failed = 0
+        # Upload in concurrent batches (retried and checkpointed by the upsert engine)
+        progress_bar = tqdm(total=len(vectors), desc="Uploading vectors")
+        try:
+            upsert_stats = self.upsert_engine.upsert(
+                vectors,
+                namespace,
+                checkpoint_key=checkpoint_key,
+                resume=not refresh,
+                progress_callback=lambda done, total, message: progress_bar.update(done - progress_bar.n),
+                max_batch_vectors=batch_size
+            )
+        finally:
+            progress_bar.close()
         
-        for i in tqdm(range(0, len(vectors), batch_size), desc="Uploading batches"):
-            batch = vectors[i:i+batch_size]
-            
-            try:
-                self.index.upsert(
-                    vectors=batch,
-                    namespace=namespace
-                )
-                total_uploaded += len(batch)
-                
-            except Exception as e:
-                logger.error(f"Failed to upload batch {i//batch_size}: {e}")
-                failed += len(batch)
+        total_uploaded = upsert_stats['upserted']
+        failed = upsert_stats['failed']
         
         # Get final statistics
         stats = self.index.describe_index_stats()
@@ -78,6 +91,7 @@ class PhysicsUploader:
             'total_chunks': len(chunks),
             'uploaded': total_uploaded,
             'failed': failed,
+            'skipped': upsert_stats['skipped'],
             'namespace': namespace,
             'namespace_vector_count': namespace_stats.get('vector_count', 0)
         }
@@ -85,6 +99,7 @@ class PhysicsUploader:
         logger.info(f"✅ Upload complete:")
         logger.info(f"   Total chunks: {result['total_chunks']}")
         logger.info(f"   Uploaded: {result['uploaded']}")
+        logger.info(f"   Skipped (already uploaded): {result['skipped']}")
         logger.info(f"   Failed: {result['failed']}")
         logger.info(f"   Namespace '{namespace}' now has {result['namespace_vector_count']} vectors")
         
@@ -120,6 +135,7 @@ class PhysicsUploader:
                 'has_image': str(chunk.get('has_image', False)),
                 'has_table': str(chunk.get('has_table', False)),
                 'raw_text': chunk.get('raw_text', '')[:500],  # Truncate
+                'embedding_model': self.embedding_model,
             }
             
             # Add optional fields
@@ -164,6 +180,8 @@ class PhysicsUploader:
         
         try:
             self.index.delete(delete_all=True, namespace=namespace)
+            if self.upsert_engine.checkpoint is not None:
+                self.upsert_engine.checkpoint.forget_namespace(namespace)
             logger.info(f"✅ Namespace '{namespace}' cleared")
         except Exception as e:
             logger.error(f"Failed to delete namespace: {e}")
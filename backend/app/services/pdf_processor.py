@@ -11,6 +11,18 @@ Handles:
 - Page-by-page processing without missing any content
 
 This processor ensures every page is captured and properly chunked for embeddings.
+Pages are rasterized in small windows (`page_window` pages per pdf2image call) and
+released once processed, so peak memory does not grow with book length. With
+`page_workers` > 1, pages are distributed over a process pool as (path, page number)
+tasks - each worker rasterizes and OCRs its own page - and reassembled in page order.
+
+Tesseract only runs where it adds something: pages whose PyPDF2 text layer is
+missing or garbled get full-page OCR, pages with a clean text layer only have
+their figure regions OCR'd (labels inside diagrams).
+
+With an IngestionCache, pages whose fingerprint was extracted before (same
+EXTRACTOR_VERSION and parameters) are restored instead of reprocessed, chunk
+embeddings are reused by text hash, and only changed vectors are upserted.
 """
 
 import os
@@ -19,8 +31,12 @@ import io
 import time
 import base64
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Callable
+from typing import Iterator, List, Dict, Tuple, Optional, Callable, Union
 from dataclasses import dataclass, field
 from datetime import datetime
 
@@ -32,16 +48,45 @@ import pytesseract
 import cv2
 import numpy as np
 
-# Google Gemini for embeddings and image understanding
-import google.generativeai as genai
+# Google Gemini for embeddings and image understanding (per-key clients)
+from app.services.gemini_client_pool import gemini_client_pool
+from app.services.embedding_registry import embedding_registry
 
 # Pinecone
 from pinecone import Pinecone
 
 from app.core.config import settings
+from app.services.ingestion_cache import IngestionCache, page_fingerprint
+from app.services.upsert_engine import create_upsert_engine
+from app.services.model_registry import current_rss_mb
 
 logger = logging.getLogger(__name__)
 
+# Bump when page extraction output changes (OCR / vision / formula logic) to invalidate cached pages
+EXTRACTOR_VERSION = "advanced-pdf-2"
+
+# Text-layer quality thresholds (below any of them the page is OCR'd in full)
+TEXT_LAYER_MIN_CHARS = 200
+TEXT_LAYER_MAX_GARBAGE_RATIO = 0.02
+TEXT_LAYER_MIN_WORD_RATIO = 0.75
+TEXT_LAYER_MIN_COMMON_WORD_RATIO = 0.08
+# Largest figure regions OCR'd on pages with a usable text layer
+MAX_OCR_REGIONS = 8
+
+# Replacement / private-use glyphs and control characters left by broken font encodings
+_GARBAGE_CHAR_RE = re.compile(r"[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0c\x0e-\x1f]|\(cid:\d+\)")
+_ALPHA_TOKEN_RE = re.compile(r"[^\W\d_]+")
+_CONSONANT_RUN_RE = re.compile(r"[bcdfghjklmnpqrstvwxz]{5,}")
+_COMMON_WORDS = {
+    "the", "of", "and", "to", "in", "a", "is", "that", "for", "it", "as", "was", "with",
+    "be", "by", "on", "not", "he", "this", "are", "or", "his", "from", "at", "which",
+    "but", "have", "an", "they", "you", "were", "their", "one", "all", "we", "can",
+    "her", "has", "there", "been", "if", "more", "when", "will", "would", "who", "so",
+    "no", "its", "into", "them", "these", "two", "than", "other", "some", "what", "only",
+    "also", "each", "many", "how", "may", "such", "called", "used", "given", "find",
+    "figure", "fig", "example", "chapter", "let", "us", "number", "water", "shown"
+}
+
 
 @dataclass
 class PageContent:
@@ -55,6 +100,9 @@ class PageContent:
     word_count: int = 0
     has_images: bool = False
     has_formulas: bool = False
+    ocr_mode: str = "none"  # "full", "regions", "none" or "cached"
+    ocr_seconds: float = 0.0
+    degraded: bool = False  # OCR or vision step failed; not cached so a re-run retries it
 
 
 @dataclass
@@ -68,6 +116,52 @@ class ProcessingResult:
     errors: List[str] = field(default_factory=list)
     processing_time: float = 0.0
     pages: List[PageContent] = field(default_factory=list)
+    peak_rss_mb: Optional[float] = None
+    ocr_stats: Dict = field(default_factory=dict)
+
+
+class _PeakRSS:
+    """Running maximum of process (tree) resident memory in MB."""
+    
+    def __init__(self):
+        self._peak: Optional[float] = None
+        self.sample()
+    
+    def sample(self, extra_mb: float = 0.0):
+        rss = current_rss_mb()
+        if rss is not None:
+            self._peak = max(self._peak or 0.0, rss + extra_mb)
+    
+    @property
+    def value(self) -> Optional[float]:
+        return round(self._peak, 1) if self._peak is not None else None
+
+
+# Per-worker-process processor, built on the first page task
+_worker_processor: Optional["AdvancedPDFProcessor"] = None
+
+
+def _init_page_worker():
+    # Each worker already owns a core; keep Tesseract's OpenMP threads from oversubscribing
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+
+def _process_page_task(
+    pdf_path: str,
+    page_number: int,
+    book_metadata: Dict,
+    config: Dict
+) -> Tuple[PageContent, int, Optional[float]]:
+    """Page-pool entry point: process one page; returns (page, worker pid, worker RSS MB)."""
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = AdvancedPDFProcessor(**config)
+    page_content = _worker_processor._process_page_from_path(pdf_path, page_number, book_metadata)
+    return page_content, os.getpid(), current_rss_mb()
 
 
 class AdvancedPDFProcessor:
@@ -87,7 +181,11 @@ class AdvancedPDFProcessor:
         chunk_size: int = 800,
         chunk_overlap: int = 150,
         dpi: int = 300,
-        use_gemini_vision: bool = True
+        use_gemini_vision: bool = True,
+        page_window: int = 4,
+        page_workers: int = 1,
+        smart_ocr: bool = True,
+        cache: Optional[IngestionCache] = None
     ):
         """
         Initialize the PDF processor.
@@ -97,18 +195,24 @@ class AdvancedPDFProcessor:
             chunk_overlap: Overlap between consecutive chunks
             dpi: DPI for PDF to image conversion (higher = better OCR but slower)
             use_gemini_vision: Whether to use Gemini Vision for image descriptions
+            page_window: Pages rasterized per pdf2image call (bounds peak memory)
+            page_workers: Worker processes for page extraction (1 = in-process, serial)
+            smart_ocr: Skip full-page OCR on pages with a clean text layer (False = always OCR)
+            cache: Page extraction cache (None disables caching)
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.dpi = dpi
         self.use_gemini_vision = use_gemini_vision
-        
-        # Initialize Gemini
-        genai.configure(api_key=settings.GEMINI_API_KEY)
+        self.page_window = max(1, page_window)
+        self.page_workers = max(1, page_workers)
+        self.smart_ocr = smart_ocr
+        self.cache = cache if cache is not None and cache.enabled else None
         
         # Gemini models - Updated to use latest available models
+        # (bound to a per-key client, so concurrent processors don't race on genai.configure)
         self.embedding_model = "models/text-embedding-004"
-        self.vision_model = genai.GenerativeModel("gemini-2.5-flash")  
+        self.vision_model = gemini_client_pool.get_model(settings.GEMINI_API_KEY, "gemini-2.5-flash")
         
         logger.info("✓ AdvancedPDFProcessor initialized")
     
@@ -116,7 +220,8 @@ class AdvancedPDFProcessor:
         self,
         pdf_path: str,
         book_metadata: Dict,
-        progress_callback: Optional[Callable[[int, int, str], None]] = None
+        progress_callback: Optional[Callable[[int, int, str], None]] = None,
+        refresh: bool = False
     ) -> ProcessingResult:
         """
         Process a PDF file and extract all content.
@@ -125,6 +230,7 @@ class AdvancedPDFProcessor:
             pdf_path: Path to the PDF file
             book_metadata: Metadata about the book (title, subject, class, etc.)
             progress_callback: Optional callback for progress updates (current, total, message)
+            refresh: Reprocess every page even if cached (results still overwrite the cache)
             
         Returns:
             ProcessingResult with all extracted content and statistics
@@ -141,36 +247,50 @@ class AdvancedPDFProcessor:
         try:
             logger.info(f"📄 Processing: {Path(pdf_path).name}")
             
-            # Step 1: Get page count
+            # Step 1: Get page count (and page fingerprints for the cache)
+            page_keys: List[Optional[str]] = []
             with open(pdf_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
                 result.total_pages = len(pdf_reader.pages)
+                if self.cache:
+                    params = self._cache_params(book_metadata)
+                    for page in pdf_reader.pages:
+                        fingerprint = page_fingerprint(page)
+                        page_keys.append(
+                            self.cache.page_key(EXTRACTOR_VERSION, params, fingerprint) if fingerprint else None
+                        )
             
             logger.info(f"📄 Total pages: {result.total_pages}")
             
             if progress_callback:
                 progress_callback(0, result.total_pages, "Starting PDF processing...")
             
-            # Step 2: Convert PDF to images for OCR
-            logger.info("🖼️ Converting PDF to images...")
-            images = convert_from_path(
-                pdf_path,
-                dpi=self.dpi,
-                fmt='png',
-                thread_count=4  # Parallel conversion
-            )
+            # Step 2: Restore unchanged pages from the cache
+            cached: Dict[int, PageContent] = {}
+            if self.cache and not refresh:
+                for page_num, key in enumerate(page_keys):
+                    data = self.cache.get_page(key) if key else None
+                    if data is not None:
+                        cached[page_num] = self._restore_page(data, page_num + 1, book_metadata)
+            to_process = [page_num for page_num in range(result.total_pages) if page_num not in cached]
+            if self.cache:
+                logger.info(f"♻️  {len(cached)} pages from cache, {len(to_process)} to process")
             
-            # Step 3: Process each page
-            for page_num in range(result.total_pages):
-                try:
-                    page_content = self._process_single_page(
-                        pdf_path=pdf_path,
-                        page_number=page_num + 1,
-                        page_image=images[page_num] if page_num < len(images) else None,
-                        book_metadata=book_metadata
-                    )
-                    
-                    result.pages.append(page_content)
+            # Step 3: Extract the remaining pages (streamed windows in-process, or a page process pool)
+            peak = _PeakRSS()
+            if self.page_workers > 1 and len(to_process) > 1:
+                logger.info(f"🖼️ Processing pages on {self.page_workers} worker processes at {self.dpi} DPI...")
+                fresh = self._iter_pages_parallel(pdf_path, to_process, book_metadata, peak)
+            else:
+                logger.info(f"🖼️ Rasterizing {self.page_window} pages at a time at {self.dpi} DPI...")
+                fresh = self._iter_pages_serial(pdf_path, to_process, book_metadata, peak)
+            
+            # Pages arrive in page order
+            for page_num, outcome in self._merge_pages(result.total_pages, cached, fresh):
+                if isinstance(outcome, PageContent):
+                    if self.cache and page_num not in cached and page_keys[page_num] and not outcome.degraded:
+                        self.cache.put_page(page_keys[page_num], self._cacheable_page(outcome))
+                    result.pages.append(outcome)
                     result.processed_pages += 1
                     
                     if progress_callback:
@@ -180,10 +300,10 @@ class AdvancedPDFProcessor:
                             f"Processed page {page_num + 1}/{result.total_pages}"
                         )
                     
-                    logger.info(f"  ✓ Page {page_num + 1}: {page_content.word_count} words")
-                    
-                except Exception as e:
-                    error_msg = f"Error on page {page_num + 1}: {str(e)}"
+                    logger.info(f"  ✓ Page {page_num + 1}: {outcome.word_count} words")
+                
+                else:
+                    error_msg = f"Error on page {page_num + 1}: {str(outcome)}"
                     result.errors.append(error_msg)
                     logger.error(f"  ✗ {error_msg}")
                     
@@ -197,8 +317,21 @@ class AdvancedPDFProcessor:
             
             result.success = result.processed_pages > 0
             result.processing_time = time.time() - start_time
+            result.peak_rss_mb = peak.value
+            result.ocr_stats = self._summarize_ocr(result.pages)
             
             logger.info(f"✅ PDF processing complete: {result.processed_pages}/{result.total_pages} pages in {result.processing_time:.2f}s")
+            logger.info(
+                f"📈 Peak RSS: {result.peak_rss_mb} MB "
+                f"({self.page_workers} page workers, {self.page_window}-page window)"
+            )
+            ocr = result.ocr_stats
+            saved = f"~{ocr['estimated_seconds_saved']:.1f}s" if ocr["estimated_seconds_saved"] is not None \
+                else "n/a (no full-OCR page to time)"
+            logger.info(
+                f"🔤 OCR: {ocr['full_pages']} full, {ocr['region_pages']} regions only, "
+                f"{ocr['skipped_pages']} skipped, {ocr['cached_pages']} cached; OCR time {ocr['ocr_seconds']:.1f}s, saved {saved}"
+            )
             
             return result
             
@@ -208,6 +341,220 @@ class AdvancedPDFProcessor:
             logger.error(f"❌ PDF processing failed: {e}")
             return result
     
+    def _cache_params(self, book_metadata: Dict) -> Dict:
+        """Everything besides the page itself that changes a page's extraction."""
+        return {
+            "dpi": self.dpi,
+            "smart_ocr": self.smart_ocr,
+            "vision": self.use_gemini_vision,
+            "subject": book_metadata.get('subject', 'General')  # Part of the vision prompt
+        }
+    
+    def _cacheable_page(self, page: PageContent) -> Dict:
+        return {
+            "text_content": page.text_content,
+            "ocr_content": page.ocr_content,
+            "image_descriptions": page.image_descriptions,
+            "formulas": page.formulas,
+            "has_images": page.has_images,
+            "has_formulas": page.has_formulas
+        }
+    
+    def _restore_page(self, data: Dict, page_number: int, book_metadata: Dict) -> PageContent:
+        """Rebuild a cached page at its (possibly new) position in the book."""
+        page = PageContent(page_number=page_number, ocr_mode="cached", **data)
+        page.combined_content = self._combine_page_content(page, book_metadata)
+        page.word_count = len(page.combined_content.split())
+        return page
+    
+    def _merge_pages(
+        self,
+        total_pages: int,
+        cached: Dict[int, PageContent],
+        fresh: Iterator[Tuple[int, Union[PageContent, Exception]]]
+    ) -> Iterator[Tuple[int, Union[PageContent, Exception]]]:
+        """Interleave cached pages with freshly processed ones (both ascending) in page order."""
+        for page_num in range(total_pages):
+            if page_num in cached:
+                yield page_num, cached[page_num]
+            else:
+                yield next(fresh)
+    
+    def _iter_pages_serial(
+        self,
+        pdf_path: str,
+        page_indices: List[int],
+        book_metadata: Dict,
+        peak: "_PeakRSS"
+    ) -> Iterator[Tuple[int, Union[PageContent, Exception]]]:
+        """Yield (page_index, PageContent or the error) for the given pages, in-process."""
+        for page_num, page_image in self._iter_page_images(pdf_path, page_indices):
+            peak.sample()
+            try:
+                outcome = self._process_single_page(
+                    pdf_path=pdf_path,
+                    page_number=page_num + 1,
+                    page_image=page_image,
+                    book_metadata=book_metadata
+                )
+            except Exception as e:
+                outcome = e
+            finally:
+                if page_image is not None:
+                    page_image.close()
+            yield page_num, outcome
+    
+    def _iter_pages_parallel(
+        self,
+        pdf_path: str,
+        page_indices: List[int],
+        book_metadata: Dict,
+        peak: "_PeakRSS"
+    ) -> Iterator[Tuple[int, Union[PageContent, Exception]]]:
+        """
+        Yield (page_index, PageContent or the error) for the given pages, in page
+        order, from a pool of worker processes.
+        
+        Workers receive only the PDF path and page number and rasterize the page
+        themselves, so no images cross process boundaries. At most two pages per
+        worker are in flight. If a worker dies (e.g. OOM-killed) the affected and
+        remaining pages are processed in this process instead.
+        """
+        config = {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "dpi": self.dpi,
+            "use_gemini_vision": self.use_gemini_vision,
+            "page_window": 1,
+            "smart_ocr": self.smart_ocr
+        }
+        workers = min(self.page_workers, len(page_indices))
+        max_in_flight = workers * 2
+        worker_rss: Dict[int, float] = {}
+        finished: Dict[int, Union[PageContent, Exception]] = {}
+        pending = {}
+        next_submit = 0  # Positions in page_indices
+        next_yield = 0
+        broken = False
+        
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_page_worker
+        )
+        try:
+            while next_yield < len(page_indices):
+                while next_submit < len(page_indices) and len(pending) < max_in_flight:
+                    page_num = page_indices[next_submit]
+                    if broken:
+                        finished[page_num] = self._process_page_safely(pdf_path, page_num + 1, book_metadata)
+                    else:
+                        try:
+                            future = pool.submit(_process_page_task, pdf_path, page_num + 1, book_metadata, config)
+                            pending[future] = page_num
+                        except BrokenProcessPool:
+                            broken = True
+                            continue
+                    next_submit += 1
+                    if broken:
+                        break
+                
+                if pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page_num = pending.pop(future)
+                        try:
+                            page_content, pid, rss = future.result()
+                            finished[page_num] = page_content
+                            if rss is not None:
+                                worker_rss[pid] = rss
+                        except BrokenProcessPool:
+                            if not broken:
+                                logger.warning("⚠️  Page worker died, processing remaining pages in-process")
+                            broken = True
+                            finished[page_num] = self._process_page_safely(pdf_path, page_num + 1, book_metadata)
+                        except Exception as e:
+                            finished[page_num] = e
+                
+                # Whole process tree: this process plus the last RSS reported by each worker
+                peak.sample(sum(worker_rss.values()))
+                
+                while next_yield < len(page_indices) and page_indices[next_yield] in finished:
+                    page_num = page_indices[next_yield]
+                    yield page_num, finished.pop(page_num)
+                    next_yield += 1
+        finally:
+            pool.shutdown(wait=not broken, cancel_futures=True)
+    
+    def _process_page_from_path(self, pdf_path: str, page_number: int, book_metadata: Dict) -> PageContent:
+        """Rasterize and process one page (1-based) on its own."""
+        images = convert_from_path(
+            pdf_path,
+            dpi=self.dpi,
+            fmt='png',
+            first_page=page_number,
+            last_page=page_number
+        )
+        page_image = images[0] if images else None
+        try:
+            return self._process_single_page(
+                pdf_path=pdf_path,
+                page_number=page_number,
+                page_image=page_image,
+                book_metadata=book_metadata
+            )
+        finally:
+            if page_image is not None:
+                page_image.close()
+    
+    def _process_page_safely(
+        self,
+        pdf_path: str,
+        page_number: int,
+        book_metadata: Dict
+    ) -> Union[PageContent, Exception]:
+        try:
+            return self._process_page_from_path(pdf_path, page_number, book_metadata)
+        except Exception as e:
+            return e
+    
+    def _iter_page_images(self, pdf_path: str, page_indices: List[int]) -> Iterator[Tuple[int, Optional[Image.Image]]]:
+        """
+        Yield (page_index, image) for the given pages (ascending), rasterizing up to
+        `page_window` consecutive pages per call.
+        
+        Only one window of images is alive at a time; a window that fails to
+        rasterize yields None images so its pages still get text extraction.
+        """
+        windows: List[List[int]] = []
+        for page_num in page_indices:
+            if windows and page_num == windows[-1][-1] + 1 and len(windows[-1]) < self.page_window:
+                windows[-1].append(page_num)
+            else:
+                windows.append([page_num])
+        
+        for window in windows:
+            first_page, last_page = window[0] + 1, window[-1] + 1
+            try:
+                images = convert_from_path(
+                    pdf_path,
+                    dpi=self.dpi,
+                    fmt='png',
+                    first_page=first_page,
+                    last_page=last_page,
+                    thread_count=min(4, len(window))  # Parallel conversion within the window
+                )
+            except Exception as e:
+                logger.warning(f"Rasterizing pages {first_page}-{last_page} failed: {e}")
+                images = []
+            
+            for offset, page_num in enumerate(window):
+                image = images[offset] if offset < len(images) else None
+                if offset < len(images):
+                    images[offset] = None  # Drop the window's reference once handed out
+                yield page_num, image
+            del images
+    
     def _process_single_page(
         self,
         pdf_path: str,
@@ -240,30 +587,42 @@ class AdvancedPDFProcessor:
         except Exception as e:
             logger.warning(f"PyPDF2 extraction failed for page {page_number}: {e}")
         
-        # 2. OCR extraction from page image
+        # 2. OCR extraction from page image - full page only if the text layer is missing or garbled
         if page_image:
             try:
                 # Convert to numpy array for OpenCV processing
                 img_array = np.array(page_image)
+                image_regions = self._find_image_regions(img_array)
+                quality = self._assess_text_layer(page_content.text_content)
+                ocr_started = time.perf_counter()
                 
-                # Preprocess image for better OCR
-                processed_img = self._preprocess_for_ocr(img_array)
+                if not self.smart_ocr or not quality["usable"]:
+                    # Preprocess image for better OCR
+                    processed_img = self._preprocess_for_ocr(img_array)
+                    
+                    # Run Tesseract OCR with configuration for math/science content
+                    ocr_config = '--psm 6 --oem 3'  # Assume uniform text block, use LSTM OCR engine
+                    page_content.ocr_content = pytesseract.image_to_string(
+                        processed_img,
+                        lang='eng',
+                        config=ocr_config
+                    )
+                    page_content.ocr_mode = "full"
+                elif image_regions:
+                    # Clean text layer: only figures can hold text it misses
+                    page_content.ocr_content = self._ocr_regions(img_array, image_regions)
+                    page_content.ocr_mode = "regions"
                 
-                # Run Tesseract OCR with configuration for math/science content
-                ocr_config = '--psm 6 --oem 3'  # Assume uniform text block, use LSTM OCR engine
-                page_content.ocr_content = pytesseract.image_to_string(
-                    processed_img,
-                    lang='eng',
-                    config=ocr_config
-                )
+                page_content.ocr_seconds = time.perf_counter() - ocr_started
                 
                 # Detect if page has significant visual content
-                page_content.has_images = self._detect_images_in_page(img_array)
+                page_content.has_images = len(image_regions) > 2  # More than 2 significant shapes
                 page_content.has_formulas = self._detect_formulas(
                     page_content.text_content + " " + page_content.ocr_content
                 )
                 
             except Exception as e:
+                page_content.degraded = True
                 logger.warning(f"OCR extraction failed for page {page_number}: {e}")
         
         # 3. If page has images/diagrams and Gemini Vision is enabled, get descriptions
@@ -275,6 +634,7 @@ class AdvancedPDFProcessor:
                 )
                 page_content.image_descriptions = descriptions
             except Exception as e:
+                page_content.degraded = True
                 logger.warning(f"Vision analysis failed for page {page_number}: {e}")
         
         # 4. Detect and preserve formulas
@@ -318,9 +678,51 @@ class AdvancedPDFProcessor:
         
         return denoised
     
-    def _detect_images_in_page(self, image: np.ndarray) -> bool:
+    def _assess_text_layer(self, text: str) -> Dict:
         """
-        Detect if page contains significant visual content (diagrams, figures, etc.)
+        Judge whether a page's extracted text layer can stand in for OCR.
+        
+        Signals:
+        - char_count: scanned pages have little or no text layer
+        - garbage_ratio: replacement / private-use glyphs, control chars, "(cid:N)" escapes
+        - word_ratio: share of alphabetic tokens that look like words (have a vowel,
+          no long consonant runs) - broken font maps produce letter soup
+        - common_word_ratio: share of very common English words, which every real
+          paragraph has (catches shifted-glyph encodings that still look pronounceable)
+        """
+        stripped = text.strip()
+        char_count = len(stripped)
+        non_space = sum(1 for c in stripped if not c.isspace()) or 1
+        garbage_chars = sum(len(match) for match in _GARBAGE_CHAR_RE.findall(stripped))
+        
+        tokens = [token.lower() for token in _ALPHA_TOKEN_RE.findall(stripped)]
+        wordlike = sum(
+            1 for token in tokens
+            if token in _COMMON_WORDS or (
+                len(token) <= 20
+                and re.search(r"[aeiouy]", token)
+                and not _CONSONANT_RUN_RE.search(token)
+            )
+        )
+        common = sum(1 for token in tokens if token in _COMMON_WORDS)
+        
+        quality = {
+            "char_count": char_count,
+            "garbage_ratio": round(garbage_chars / non_space, 3),
+            "word_ratio": round(wordlike / len(tokens), 3) if tokens else 0.0,
+            "common_word_ratio": round(common / len(tokens), 3) if tokens else 0.0
+        }
+        quality["usable"] = (
+            char_count >= TEXT_LAYER_MIN_CHARS
+            and quality["garbage_ratio"] <= TEXT_LAYER_MAX_GARBAGE_RATIO
+            and quality["word_ratio"] >= TEXT_LAYER_MIN_WORD_RATIO
+            and quality["common_word_ratio"] >= TEXT_LAYER_MIN_COMMON_WORD_RATIO
+        )
+        return quality
+    
+    def _find_image_regions(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """
+        Bounding boxes (x, y, w, h) of significant visual content (diagrams, figures, etc.)
         
         Uses edge detection and contour analysis.
         """
@@ -337,17 +739,59 @@ class AdvancedPDFProcessor:
             # Find contours
             contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
-            # Count significant contours (likely diagrams/images)
-            significant_contours = 0
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                if area > 5000:  # Minimum area threshold
-                    significant_contours += 1
-            
-            return significant_contours > 2  # More than 2 significant shapes
+            # Significant contours (likely diagrams/images)
+            return [
+                cv2.boundingRect(contour) for contour in contours
+                if cv2.contourArea(contour) > 5000  # Minimum area threshold
+            ]
             
         except Exception:
-            return False
+            return []
+    
+    def _detect_images_in_page(self, image: np.ndarray) -> bool:
+        """
+        Detect if page contains significant visual content (diagrams, figures, etc.)
+        """
+        return len(self._find_image_regions(image)) > 2  # More than 2 significant shapes
+    
+    def _ocr_regions(self, image: np.ndarray, regions: List[Tuple[int, int, int, int]]) -> str:
+        """OCR the largest figure regions of a page, in reading order."""
+        height, width = image.shape[:2]
+        # A box spanning most of the page is a frame around the text layer, not a figure
+        figures = [region for region in regions if region[2] * region[3] < 0.5 * width * height]
+        figures = sorted(figures, key=lambda region: -region[2] * region[3])[:MAX_OCR_REGIONS]
+        
+        texts = []
+        for x, y, w, h in sorted(figures, key=lambda region: (region[1], region[0])):
+            crop = image[y:y + h, x:x + w]
+            text = pytesseract.image_to_string(
+                self._preprocess_for_ocr(crop),
+                lang='eng',
+                config='--psm 11 --oem 3'  # Sparse text: labels scattered over a figure
+            )
+            if text.strip():
+                texts.append(text.strip())
+        return "\n".join(texts)
+    
+    def _summarize_ocr(self, pages: List[PageContent]) -> Dict:
+        """OCR work per mode for one book, with the full-page OCR time skipped pages would have cost."""
+        full = [page for page in pages if page.ocr_mode == "full"]
+        region_pages = sum(1 for page in pages if page.ocr_mode == "regions")
+        cached_pages = sum(1 for page in pages if page.ocr_mode == "cached")
+        skipped_pages = len(pages) - len(full) - cached_pages
+        # Estimated from the full-page OCR actually run on this book (same DPI and layout)
+        avg_full = sum(page.ocr_seconds for page in full) / len(full) if full else None
+        region_seconds = sum(page.ocr_seconds for page in pages if page.ocr_mode == "regions")
+        saved = skipped_pages * avg_full - region_seconds if avg_full is not None else None
+        return {
+            "full_pages": len(full),
+            "region_pages": region_pages,
+            "skipped_pages": skipped_pages - region_pages,
+            "cached_pages": cached_pages,
+            "ocr_seconds": round(sum(page.ocr_seconds for page in pages), 2),
+            "avg_full_page_seconds": round(avg_full, 2) if avg_full is not None else None,
+            "estimated_seconds_saved": round(max(saved, 0.0), 1) if saved is not None else None
+        }
     
     def _detect_formulas(self, text: str) -> bool:
         """
@@ -428,7 +872,7 @@ class AdvancedPDFProcessor:
             
         except Exception as e:
             logger.warning(f"Vision API error: {e}")
-            return []
+            raise
     
     def _combine_page_content(self, page: PageContent, metadata: Dict) -> str:
         """
@@ -511,9 +955,11 @@ class AdvancedPDFProcessor:
         - Text content
         - Metadata (page number, book info, etc.)
         - Unique ID for Pinecone
+        
+        Chunks are numbered within their page, so adding or removing text on one
+        page leaves the IDs (and cached vector hashes) of every other page intact.
         """
         chunks = []
-        chunk_id = 1
         
         book_id = book_metadata.get('book_id', 'unknown')
         subject = book_metadata.get('subject', 'Unknown')
@@ -531,6 +977,7 @@ class AdvancedPDFProcessor:
                 page_number=page.page_number
             )
             
+            chunk_id = 1
             for chunk_text in page_chunks:
                 if len(chunk_text.strip()) < 50:  # Skip very short chunks
                     continue
@@ -545,7 +992,7 @@ class AdvancedPDFProcessor:
                         'class_level': class_level,
                         'chapter_number': chapter_number,
                         'page_number': page.page_number,
-                        'chunk_id': chunk_id,
+                        'chunk_id': chunk_id,  # Position within the page
                         'has_images': page.has_images,
                         'has_formulas': page.has_formulas,
                         'word_count': len(chunk_text.split()),
@@ -603,34 +1050,54 @@ class AdvancedPDFProcessor:
 class PineconeEmbeddingUploader:
     """
     Uploads embeddings to Pinecone with proper error handling and batching.
+    
+    Chunks are embedded in batches (many texts per embedding request) on a small
+    thread pool while the shared upsert engine (upsert_engine.py) upserts finished
+    vectors concurrently, so throughput is
+    bounded by embedding quota rather than request latency. Rate limiting is left to
+    the embedder (the Gemini embedding scheduler's per-key RPM/TPM buckets and 429
+    backoff); local models batch on the worker's CPU/GPU.
     """
     
-    def __init__(self):
-        """Initialize Pinecone connection."""
-        genai.configure(api_key=settings.GEMINI_API_KEY)
+    def __init__(
+        self,
+        cache: Optional[IngestionCache] = None,
+        embed_batch_size: int = 100,
+        embed_workers: int = 4
+    ):
+        """
+        Initialize Pinecone connection.
+        
+        Args:
+            cache: Chunk embedding / upserted vector cache (None disables incremental uploads)
+            embed_batch_size: Texts per embedding request
+            embed_workers: Embedding batches in flight at once
+        """
+        self.cache = cache if cache is not None and cache.enabled else None
+        
+        # Book chunks are read back by textbook retrieval, so embed them with its model
+        self.embedder = embedding_registry.get_embedder("textbook")
+        self.embedding_model = self.embedder.spec.model_id
+        self.embedding_task = self.embedder.spec.document_task_type or "document"
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.embed_workers = max(1, embed_workers)
         
         self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
         self.index = self.pc.Index(host=settings.PINECONE_HOST)
         
-        self.batch_size = 50  # Pinecone recommends 100, but smaller is safer
-        self.retry_count = 3
-        self.retry_delay = 2  # seconds
+        # Concurrent, size-bounded upserts with retry (checkpoints go to the same cache)
+        self.upsert_engine = create_upsert_engine(self.index, checkpoint=self.cache)
         
-        logger.info("✓ Connected to Pinecone")
+        self._stats_lock = threading.Lock()
+        
+        logger.info(f"✓ Connected to Pinecone (embeddings: {self.embedder.spec.name})")
     
     def generate_embedding(self, text: str) -> List[float]:
         """
-        Generate embedding using Gemini text-embedding-004.
-        
-        Returns 768-dimensional embedding vector.
+        Generate a document embedding for one text with the textbook embedding model.
         """
         try:
-            result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=text,
-                task_type="retrieval_document"
-            )
-            return result['embedding']
+            return self.embedder.embed_documents([text])[0]
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
             raise
@@ -639,15 +1106,34 @@ class PineconeEmbeddingUploader:
         self,
         chunks: List[Dict],
         namespace: str,
-        progress_callback: Optional[Callable[[int, int, str], None]] = None
+        progress_callback: Optional[Callable[[int, int, str], None]] = None,
+        source_id: Optional[str] = None,
+        refresh: bool = False,
+        complete: bool = True,
+        purge_filter: Optional[Dict] = None
     ) -> Dict:
         """
         Upload chunks to Pinecone with embeddings.
         
+        With a cache and a `source_id` (the book), only chunks whose vector changed
+        since the last upload are embedded and upserted, and vectors of chunks that
+        no longer exist are deleted. If `chunks` is not the whole source (some pages
+        failed to extract), nothing is deleted: the missing chunks may still be valid.
+        
+        A source with nothing recorded in the cache may still have vectors from an
+        upload that predates the cache or the current chunk ID scheme; with a
+        `purge_filter` those are deleted before the new vectors go in.
+        
         Args:
             chunks: List of text chunks with metadata
             namespace: Pinecone namespace (e.g., "mathematics_class10")
             progress_callback: Optional callback for progress updates
+            source_id: Identifies the chunk set across runs (e.g. book_id)
+            refresh: Re-embed and re-upsert every chunk (stale vectors are still deleted)
+            complete: False if some of the source's content could not be chunked
+                      (skips stale-vector deletion)
+            purge_filter: Metadata filter matching every vector of the source
+                          (e.g. {"book_id": ...}), used when the cache has no record of it
             
         Returns:
             Upload statistics
@@ -656,81 +1142,172 @@ class PineconeEmbeddingUploader:
             'total_chunks': len(chunks),
             'successful': 0,
             'failed': 0,
+            'unchanged': 0,
+            'deleted': 0,
+            'embedding_cache_hits': 0,
+            'embedding_requests': 0,
             'errors': []
         }
         
-        logger.info(f"🚀 Uploading {len(chunks)} chunks to namespace '{namespace}'")
+        # Work out what changed since the last upload of this source
+        incremental = self.cache is not None and source_id is not None
+        previous = {}
+        hashes = {}
+        stale_ids = []
+        if incremental:
+            previous = self.cache.get_vectors(namespace, source_id)
+            hashes = {
+                chunk['id']: self.cache.vector_hash(chunk['text'], chunk['metadata'], self.embedding_model)
+                for chunk in chunks
+            }
+            stale_ids = [vector_id for vector_id in previous if vector_id not in hashes]
+            if not refresh:
+                changed = [chunk for chunk in chunks if previous.get(chunk['id']) != hashes[chunk['id']]]
+                stats['unchanged'] = len(chunks) - len(changed)
+                self.cache.stats["vectors_unchanged"] += stats['unchanged']
+                chunks = changed
         
-        vectors = []
+        # Untracked vectors of this source (older uploads, older ID scheme) would sit
+        # next to the new ones and come back as duplicates
+        if purge_filter and complete and not previous:
+            self._purge_untracked(purge_filter, namespace)
         
-        for i, chunk in enumerate(chunks):
-            try:
-                # Generate embedding
-                embedding = self.generate_embedding(chunk['text'])
-                
-                # Prepare vector
-                vector = {
-                    'id': chunk['id'],
-                    'values': embedding,
-                    'metadata': {
-                        **chunk['metadata'],
-                        'text': chunk['text'][:2000]  # Store truncated text for retrieval
-                    }
-                }
-                vectors.append(vector)
-                
-                # Upload in batches
-                if len(vectors) >= self.batch_size:
-                    success = self._upload_batch(vectors, namespace)
-                    if success:
-                        stats['successful'] += len(vectors)
-                    else:
-                        stats['failed'] += len(vectors)
-                    vectors = []
-                    
-                    if progress_callback:
-                        progress_callback(
-                            i + 1,
-                            len(chunks),
-                            f"Uploaded {i + 1}/{len(chunks)} embeddings"
-                        )
-                
-                # Rate limiting - Gemini has rate limits
-                if (i + 1) % 10 == 0:
-                    time.sleep(0.5)  # Small delay every 10 embeddings
-                    
-            except Exception as e:
-                stats['failed'] += 1
-                stats['errors'].append(f"Chunk {i}: {str(e)}")
-                logger.error(f"Failed to process chunk {i}: {e}")
-        
-        # Upload remaining vectors
-        if vectors:
-            success = self._upload_batch(vectors, namespace)
-            if success:
-                stats['successful'] += len(vectors)
+        # Embeddings are reused by exact text unless refreshing
+        cached_vectors = []
+        to_embed = []
+        for chunk in chunks:
+            embedding = None
+            if self.cache and not refresh:
+                embedding = self.cache.get_embedding(self.embedding_model, self.embedding_task, chunk['text'])
+            if embedding is not None:
+                stats['embedding_cache_hits'] += 1
+                cached_vectors.append(self._to_vector(chunk, embedding))
             else:
-                stats['failed'] += len(vectors)
+                to_embed.append(chunk)
         
-        logger.info(f"✅ Upload complete: {stats['successful']} successful, {stats['failed']} failed")
+        logger.info(
+            f"🚀 Uploading {len(chunks)} chunks to namespace '{namespace}' "
+            f"({len(to_embed)} to embed in batches of {self.embed_batch_size})"
+            + (f" ({stats['unchanged']} unchanged, {len(stale_ids)} stale)" if incremental else "")
+        )
+        
+        # Upserts run on the engine's pool while later embedding requests are in flight;
+        # with a source, each upserted batch is recorded so a crashed upload resumes
+        with self.upsert_engine.session(
+            namespace,
+            checkpoint_key=source_id if incremental else None,
+            hashes=hashes,
+            resume=False,  # unchanged vectors were already filtered out above
+            total=len(chunks),
+            progress_callback=progress_callback
+        ) as upserts:
+            upserts.add(cached_vectors)
+            
+            # Embedding batches, at most embed_workers requests in flight
+            batches = [
+                to_embed[start:start + self.embed_batch_size]
+                for start in range(0, len(to_embed), self.embed_batch_size)
+            ]
+            with ThreadPoolExecutor(max_workers=self.embed_workers, thread_name_prefix="embed-batch") as pool:
+                in_flight = set()
+                for batch in batches:
+                    if len(in_flight) >= self.embed_workers:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            upserts.add(future.result())
+                    in_flight.add(pool.submit(self._embed_chunks, batch, refresh, stats))
+                for future in as_completed(in_flight):
+                    upserts.add(future.result())
+        
+        with self._stats_lock:
+            stats['successful'] = upserts.stats['upserted']
+            stats['failed'] += upserts.stats['failed']
+            stats['errors'].extend(upserts.stats['errors'])
+        
+        # Remove vectors whose chunks no longer exist
+        if stale_ids and not complete:
+            logger.warning(f"  Keeping {len(stale_ids)} possibly stale vectors: some pages failed to extract")
+        elif stale_ids:
+            stats['deleted'] = self._delete_vectors(stale_ids, namespace, source_id)
+        
+        logger.info(
+            f"✅ Upload complete: {stats['successful']} successful, {stats['failed']} failed, "
+            f"{stats['unchanged']} unchanged, {stats['deleted']} deleted, "
+            f"{stats['embedding_cache_hits']} cached embeddings, {stats['embedding_requests']} embedding requests"
+        )
         return stats
     
-    def _upload_batch(self, vectors: List[Dict], namespace: str) -> bool:
+    def _to_vector(self, chunk: Dict, embedding: List[float]) -> Dict:
+        return {
+            'id': chunk['id'],
+            'values': embedding,
+            'metadata': {
+                **chunk['metadata'],
+                'text': chunk['text'][:2000],  # Store truncated text for retrieval
+                'embedding_model': self.embedder.spec.name
+            }
+        }
+    
+    def _embed_chunks(self, chunks: List[Dict], refresh: bool, stats: Dict) -> List[Dict]:
         """
-        Upload a batch of vectors to Pinecone with retry logic.
+        Embed one batch of chunks (runs on the embedding pool).
+        
+        If the batch request fails, its chunks are retried one by one so a single
+        bad text only loses itself. Returns the vectors that were embedded.
         """
-        for attempt in range(self.retry_count):
+        texts = [chunk['text'] for chunk in chunks]
+        try:
+            embeddings = self.embedder.embed_documents(texts)
+            with self._stats_lock:
+                stats['embedding_requests'] += 1
+        except Exception as e:
+            logger.warning(f"  Embedding batch of {len(texts)} failed, retrying texts individually: {e}")
+            embeddings = []
+            for chunk in chunks:
+                try:
+                    embeddings.append(self.generate_embedding(chunk['text']))
+                    with self._stats_lock:
+                        stats['embedding_requests'] += 1
+                except Exception as chunk_error:
+                    embeddings.append(None)
+                    with self._stats_lock:
+                        stats['failed'] += 1
+                        stats['errors'].append(f"Chunk {chunk['id']}: {str(chunk_error)}")
+                    logger.error(f"Failed to embed chunk {chunk['id']}: {chunk_error}")
+        
+        vectors = []
+        for chunk, embedding in zip(chunks, embeddings):
+            if embedding is None:
+                continue
+            if self.cache:
+                self.cache.put_embedding(self.embedding_model, self.embedding_task, chunk['text'], embedding)
+            vectors.append(self._to_vector(chunk, embedding))
+        return vectors
+    
+    def _purge_untracked(self, purge_filter: Dict, namespace: str):
+        """Delete every vector matching a metadata filter (source not recorded in the cache)."""
+        try:
+            self.index.delete(filter=purge_filter, namespace=namespace)
+            logger.info(f"  🗑️  Deleted untracked vectors matching {purge_filter}")
+        except Exception as e:
+            logger.warning(f"  Could not delete untracked vectors matching {purge_filter}: {e}")
+    
+    def _delete_vectors(self, vector_ids: List[str], namespace: str, source_id: Optional[str]) -> int:
+        """Delete vectors by ID (in batches of 1000); returns how many were deleted."""
+        deleted = 0
+        for start in range(0, len(vector_ids), 1000):
+            batch = vector_ids[start:start + 1000]
             try:
-                self.index.upsert(vectors=vectors, namespace=namespace)
-                logger.info(f"  ✓ Uploaded batch of {len(vectors)} vectors")
-                return True
+                self.index.delete(ids=batch, namespace=namespace)
+                deleted += len(batch)
+                if self.cache and source_id is not None:
+                    self.cache.forget_vectors(namespace, source_id, batch)
             except Exception as e:
-                logger.warning(f"  Upload attempt {attempt + 1} failed: {e}")
-                if attempt < self.retry_count - 1:
-                    time.sleep(self.retry_delay * (attempt + 1))
-        
-        logger.error(f"  ✗ Failed to upload batch after {self.retry_count} attempts")
-        return False
+                logger.warning(f"  Deleting {len(batch)} stale vectors failed: {e}")
+        if deleted and self.cache:
+            self.cache.stats["vectors_deleted"] += deleted
+            logger.info(f"  🗑️  Deleted {deleted} stale vectors")
+        return deleted
     
     def get_namespace_stats(self, namespace: str) -> Dict:
         """Get statistics for a specific namespace."""
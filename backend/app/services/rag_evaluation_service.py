@@ -5,12 +5,16 @@ Evaluates student answers using Pinecone context retrieval and Gemini.
 
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
+import asyncio
 import logging
 import json
 import re
 
+from app.core.config import settings
 from app.db.mongo import mongodb
 from app.services.gemini_service import gemini_service
+from app.services.answer_pregrader import AnswerPreGrader, answer_pregrader
+from app.services.rag_executor import rag_executor
 from app.services.rag_service import rag_service
 from app.services.topic_question_bank_service import topic_question_bank_service
 
@@ -23,13 +27,38 @@ class RAGEvaluationService:
     
     Process:
     1. Retrieve relevant context from Pinecone for each question
-    2. Use Gemini to evaluate answer against context
+    2. Use Gemini to evaluate answer against context (all answers and the overall
+       feedback in one batched call; per-answer calls under a semaphore as fallback)
     3. Generate feedback and identify weak areas
     4. Update student performance tracking
     """
     
     SESSIONS_COLLECTION = "test_sessions"
     
+    def __init__(
+        self,
+        mode: str = "batched",
+        concurrency: int = 4,
+        pregrader: Optional[AnswerPreGrader] = None
+    ):
+        """
+        Args:
+            mode: "batched" (one Gemini call per test) or "concurrent" (one call per answer)
+            concurrency: Max in-flight per-answer Gemini calls
+            pregrader: Local grader for clear-cut answers (None sends every answer to Gemini)
+        """
+        self.mode = mode
+        self.concurrency = concurrency
+        self.pregrader = pregrader
+        self.stats = {
+            "sessions": 0,
+            "answers": 0,
+            "batched_calls": 0,
+            "batch_fallbacks": 0,
+            "per_answer_calls": 0,
+            "feedback_calls": 0
+        }
+    
     async def evaluate_test_session(
         self,
         session_id: str,
@@ -70,23 +99,21 @@ class RAGEvaluationService:
         # Retrieve context from Pinecone for this topic
         context = await self._get_topic_context(class_level, subject, chapter_number, topic_name)
         
-        # Evaluate each answer
+        # Evaluate all answers (plus overall feedback when batched)
+        eval_results, overall_feedback = await self._evaluate_answers(
+            qa_pairs=qa_pairs,
+            context=context,
+            class_level=class_level,
+            subject=subject,
+            topic_name=topic_name
+        )
+        
         evaluations = []
         total_score = 0
         correct_count = 0
         max_possible = 0
         
-        for qa in qa_pairs:
-            eval_result = await self._evaluate_single_answer(
-                question=qa["question"],
-                answer=qa["answer"],
-                expected_answer=qa.get("expected_answer"),
-                keywords=qa.get("keywords", []),
-                context=context,
-                class_level=class_level,
-                subject=subject
-            )
-            
+        for qa, eval_result in zip(qa_pairs, eval_results):
             evaluations.append({
                 "question_id": qa["question_id"],
                 "question_text": qa["question"],
@@ -95,7 +122,8 @@ class RAGEvaluationService:
                 "score": eval_result["score"],
                 "max_score": qa.get("marks", 10),
                 "feedback": eval_result["feedback"],
-                "correct_answer": eval_result.get("correct_answer", "")
+                "correct_answer": eval_result.get("correct_answer", ""),
+                "graded_by": eval_result.get("graded_by", "gemini")
             })
             
             total_score += eval_result["score"]
@@ -106,15 +134,16 @@ class RAGEvaluationService:
         # Calculate percentage score
         percentage_score = round((total_score / max_possible) * 100, 1) if max_possible > 0 else 0
         
-        # Generate overall feedback
-        overall_feedback = await self._generate_overall_feedback(
-            evaluations=evaluations,
-            percentage_score=percentage_score,
-            correct_count=correct_count,
-            total_questions=len(questions),
-            topic_name=topic_name,
-            context=context
-        )
+        # Generate overall feedback (already part of the batched response)
+        if overall_feedback is None:
+            overall_feedback = await self._generate_overall_feedback(
+                evaluations=evaluations,
+                percentage_score=percentage_score,
+                correct_count=correct_count,
+                total_questions=len(questions),
+                topic_name=topic_name,
+                context=context
+            )
         
         # Identify weak areas
         weak_areas = self._identify_weak_areas(evaluations)
@@ -203,6 +232,213 @@ class RAGEvaluationService:
             logger.error(f"Error retrieving context: {e}")
             return ""
     
+    async def _evaluate_answers(
+        self,
+        qa_pairs: List[Dict],
+        context: str,
+        class_level: int,
+        subject: str,
+        topic_name: str
+    ) -> Tuple[List[Dict], Optional[Dict]]:
+        """
+        Evaluate every answer of a test.
+        
+        Blank and clear-cut answers are scored locally (see AnswerPreGrader).
+        In "batched" mode the rest are graded in
+        one Gemini call that also returns the overall feedback; any answer the
+        batch did not cover is graded with concurrent per-answer calls.
+        
+        The batched overall feedback is only kept when the batch graded every
+        answer; otherwise the caller generates it from the full results.
+        
+        Returns:
+            Tuple of (evaluation per qa pair, overall feedback or None if not generated)
+        """
+        self.stats["sessions"] += 1
+        self.stats["answers"] += len(qa_pairs)
+        
+        results: List[Optional[Dict]] = [None] * len(qa_pairs)
+        if self.pregrader is not None:
+            # May run the local embedding model, so keep it off the event loop
+            results = await rag_executor.run(self.pregrader.grade_many, qa_pairs)
+            short_circuited = sum(result is not None for result in results)
+            if short_circuited:
+                logger.info(f"⚡ Pre-grader scored {short_circuited}/{len(qa_pairs)} answers without Gemini")
+        
+        pending = []
+        for i, qa in enumerate(qa_pairs):
+            if results[i] is not None:
+                continue
+            if not qa["answer"] or not qa["answer"].strip():
+                results[i] = self._no_answer_result(qa.get("expected_answer"))
+            else:
+                pending.append(i)
+        
+        overall_feedback = None
+        if pending and self.mode == "batched":
+            batch_results, overall_feedback = await self._evaluate_batch(
+                qa_pairs=[qa_pairs[i] for i in pending],
+                context=context,
+                class_level=class_level,
+                subject=subject,
+                topic_name=topic_name
+            )
+            for i, result in zip(pending, batch_results):
+                results[i] = result
+            
+            missing = [i for i in pending if results[i] is None]
+            if missing:
+                self.stats["batch_fallbacks"] += 1
+                logger.warning(f"⚠️  Batched evaluation missed {len(missing)}/{len(pending)} answers, grading them individually")
+            
+            # The batch only saw its own answers: its overall feedback is only valid
+            # when it graded the whole test (blank / pre-graded / fallback answers
+            # would otherwise be missing from strengths and improvements)
+            if overall_feedback is not None and (missing or len(pending) < len(qa_pairs)):
+                overall_feedback = None
+            pending = missing
+        
+        if pending:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            
+            async def evaluate(qa: Dict) -> Dict:
+                async with semaphore:
+                    return await self._evaluate_single_answer(
+                        question=qa["question"],
+                        answer=qa["answer"],
+                        expected_answer=qa.get("expected_answer"),
+                        keywords=qa.get("keywords", []),
+                        context=context,
+                        class_level=class_level,
+                        subject=subject
+                    )
+            
+            single_results = await asyncio.gather(*(evaluate(qa_pairs[i]) for i in pending))
+            for i, result in zip(pending, single_results):
+                results[i] = result
+        
+        return results, overall_feedback
+    
+    async def _evaluate_batch(
+        self,
+        qa_pairs: List[Dict],
+        context: str,
+        class_level: int,
+        subject: str,
+        topic_name: str
+    ) -> Tuple[List[Optional[Dict]], Optional[Dict]]:
+        """
+        Grade several answers and write the overall feedback in one Gemini call.
+        
+        Returns:
+            Tuple of (evaluation per qa pair, None where the response had no valid
+            entry; overall feedback or None)
+        """
+        questions_block = []
+        for number, qa in enumerate(qa_pairs, start=1):
+            keywords = qa.get("keywords", [])
+            questions_block.append(f"""### Question {number}
+**QUESTION:** {qa["question"]}
+**STUDENT'S ANSWER:** {qa["answer"]}
+**EXPECTED ANSWER (Reference):** {qa.get("expected_answer") or "Not provided"}
+**KEY CONCEPTS/KEYWORDS:** {', '.join(keywords) if keywords else "Not specified"}""")
+        
+        prompt = f"""You are evaluating a Class {class_level} {subject} student's test on "{topic_name}".
+
+**TEXTBOOK CONTEXT:**
+{context[:5000]}
+
+**QUESTIONS AND STUDENT ANSWERS:**
+{chr(10).join(questions_block)}
+
+**EVALUATION TASK:**
+For EACH question:
+1. Check if the student's answer is correct based on the textbook content
+2. Identify key points covered and missed
+3. Assign a score out of 10
+4. Provide constructive feedback
+
+Then write overall feedback for the whole test: a brief summary (2-3 sentences),
+2-3 strengths, 2-3 areas for improvement and an encouragement message.
+
+**OUTPUT FORMAT (JSON):**
+{{
+    "evaluations": [
+        {{
+            "question_number": 1,
+            "is_correct": true/false (true if score >= 6),
+            "score": number (0-10),
+            "feedback": "Constructive feedback for the student",
+            "correct_answer": "The correct/complete answer from textbook"
+        }}
+    ],
+    "overall": {{
+        "summary": "Overall feedback summary...",
+        "strengths": ["strength 1", "strength 2"],
+        "improvements": ["area 1", "area 2"],
+        "encouragement": "Keep up the good work!"
+    }}
+}}
+
+Include one entry in "evaluations" for every question ({len(qa_pairs)} in total).
+Be fair but encouraging. Consider partial credit for partially correct answers.
+Output ONLY the JSON."""
+
+        results: List[Optional[Dict]] = [None] * len(qa_pairs)
+        try:
+            self.stats["batched_calls"] += 1
+            response = await gemini_service.generate_text(prompt)
+            parsed = self._parse_json(response)
+        except Exception as e:
+            logger.error(f"Batched evaluation error: {e}")
+            return results, None
+        
+        if not isinstance(parsed, dict):
+            return results, None
+        
+        for entry in parsed.get("evaluations") or []:
+            try:
+                index = int(entry.get("question_number")) - 1
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(qa_pairs) and "score" in entry:
+                results[index] = self._normalize_result(entry)
+        
+        overall = parsed.get("overall")
+        if not (isinstance(overall, dict) and all(key in overall for key in ("summary", "strengths", "improvements"))):
+            overall = None
+        
+        logger.info(f"🧮 Batched evaluation: {sum(r is not None for r in results)}/{len(qa_pairs)} answers graded in one call")
+        return results, overall
+    
+    def _parse_json(self, response: str) -> Optional[Dict]:
+        """Extract the JSON object from a Gemini response (None if there is none)."""
+        json_match = re.search(r'\{.*\}', response, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group())
+        return None
+    
+    def _normalize_result(self, result: Dict) -> Dict:
+        """Clamp a Gemini evaluation to the response schema."""
+        try:
+            score = min(10, max(0, float(result.get("score", 0))))
+        except (TypeError, ValueError):
+            score = 0
+        return {
+            "is_correct": bool(result.get("is_correct", False)),
+            "score": score,
+            "feedback": result.get("feedback", ""),
+            "correct_answer": result.get("correct_answer", "")
+        }
+    
+    def _no_answer_result(self, expected_answer: Optional[str]) -> Dict:
+        return {
+            "is_correct": False,
+            "score": 0,
+            "feedback": "No answer provided.",
+            "correct_answer": expected_answer or "Please refer to the textbook."
+        }
+    
     async def _evaluate_single_answer(
         self,
         question: str,
@@ -216,12 +452,7 @@ class RAGEvaluationService:
         """Evaluate a single student answer."""
         
         if not answer or not answer.strip():
-            return {
-                "is_correct": False,
-                "score": 0,
-                "feedback": "No answer provided.",
-                "correct_answer": expected_answer or "Please refer to the textbook."
-            }
+            return self._no_answer_result(expected_answer)
         
         prompt = f"""You are evaluating a Class {class_level} {subject} student's answer.
 
@@ -254,18 +485,13 @@ Be fair but encouraging. Consider partial credit for partially correct answers.
 Output ONLY the JSON."""
 
         try:
+            self.stats["per_answer_calls"] += 1
             response = await gemini_service.generate_text(prompt)
             
             # Parse JSON
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group())
-                return {
-                    "is_correct": result.get("is_correct", False),
-                    "score": min(10, max(0, result.get("score", 0))),
-                    "feedback": result.get("feedback", ""),
-                    "correct_answer": result.get("correct_answer", "")
-                }
+            result = self._parse_json(response)
+            if result:
+                return self._normalize_result(result)
             
             # Fallback if JSON parsing fails
             return {
@@ -328,11 +554,12 @@ Output ONLY the JSON."""
 Be encouraging and constructive. Output ONLY the JSON."""
 
         try:
+            self.stats["feedback_calls"] += 1
             response = await gemini_service.generate_text(prompt)
             
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            feedback = self._parse_json(response)
+            if feedback:
+                return feedback
             
         except Exception as e:
             logger.error(f"Feedback generation error: {e}")
@@ -422,7 +649,24 @@ Be encouraging and constructive. Output ONLY the JSON."""
             "topics_to_review": [],
             "completed_at": datetime.utcnow().isoformat()
         }
+    
+    def get_stats(self) -> Dict:
+        """Gemini calls per evaluated test (batched vs per-answer)."""
+        sessions = self.stats["sessions"]
+        calls = self.stats["batched_calls"] + self.stats["per_answer_calls"] + self.stats["feedback_calls"]
+        return {
+            **self.stats,
+            "mode": self.mode,
+            "concurrency": self.concurrency,
+            "gemini_calls": calls,
+            "avg_calls_per_session": round(calls / sessions, 2) if sessions else 0.0,
+            "pregrader": self.pregrader.get_stats() if self.pregrader else None
+        }
 
 
 # Global instance
-rag_evaluation_service = RAGEvaluationService()
+rag_evaluation_service = RAGEvaluationService(
+    mode=settings.TEST_EVALUATION_MODE,
+    concurrency=settings.TEST_EVALUATION_CONCURRENCY,
+    pregrader=answer_pregrader if settings.TEST_PREGRADER_ENABLED else None
+)
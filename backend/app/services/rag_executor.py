@@ -0,0 +1,158 @@
+"""
+RAG Executor - Async execution layer for the synchronous RAG services.
+
+The RAG and Gemini services do blocking network and CPU work (Gemini, Pinecone,
+sentence-transformers). Calling them directly from `async def` handlers stalls
+the event loop, so one slow question blocks every other request on the worker.
+
+This module offloads those calls to a dedicated, sized thread pool:
+- `RAG_EXECUTOR_WORKERS` threads run the blocking work
+- `RAG_MAX_CONCURRENCY` caps how many questions are processed at once
+- Requests above the limit wait in a queue whose depth is tracked for monitoring
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+from app.core.config import settings
+import asyncio
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RAGExecutor:
+    """Runs blocking RAG calls off the event loop with a concurrency limit."""
+
+    def __init__(self, max_workers: int = 16, max_concurrency: int = 16):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="rag-exec"
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Queue / throughput metrics (only touched from the event loop thread)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+        logger.info(f"✅ RAG Executor: {max_workers} workers, max {max_concurrency} concurrent requests")
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking function in the RAG thread pool and await its result.
+
+        Args:
+            func: Synchronous callable (e.g. enhanced_rag_service.answer_question_basic)
+            *args, **kwargs: Arguments for `func`
+
+        Returns:
+            Whatever `func` returns (exceptions are re-raised in the caller)
+        """
+        queued_at = time.perf_counter()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        started_at = time.perf_counter()
+        self.total_wait_seconds += started_at - queued_at
+        self.active += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor,
+                functools.partial(func, *args, **kwargs)
+            )
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self.total_run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    async def stream(self, func: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        Iterate a blocking generator in the RAG thread pool.
+
+        The stream holds one concurrency slot until it finishes; each item is
+        produced on a pool thread so the event loop never blocks.
+
+        Args:
+            func: Synchronous generator function (e.g. enhanced_rag_service.stream_answer)
+            *args, **kwargs: Arguments for `func`
+
+        Yields:
+            Items produced by the generator
+        """
+        queued_at = time.perf_counter()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        started_at = time.perf_counter()
+        self.total_wait_seconds += started_at - queued_at
+        self.active += 1
+
+        iterator = func(*args, **kwargs)
+        sentinel = object()
+        try:
+            loop = asyncio.get_running_loop()
+            while True:
+                item = await loop.run_in_executor(self._executor, next, iterator, sentinel)
+                if item is sentinel:
+                    break
+                yield item
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            # Client went away mid-stream: run the generator's cleanup (releases its Gemini key)
+            try:
+                iterator.close()
+            except ValueError:
+                pass  # Still running on a pool thread; it finishes on its own
+            self.active -= 1
+            self.total_run_seconds += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict:
+        """Concurrency and queue-depth metrics."""
+        finished = self.completed + self.failed
+        return {
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait_seconds / finished * 1000, 1) if finished else 0.0,
+            "avg_run_ms": round(self.total_run_seconds / finished * 1000, 1) if finished else 0.0
+        }
+
+
+# Global instance
+rag_executor = RAGExecutor(
+    max_workers=settings.RAG_EXECUTOR_WORKERS,
+    max_concurrency=settings.RAG_MAX_CONCURRENCY
+)
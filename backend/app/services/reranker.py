@@ -0,0 +1,266 @@
+"""
+Reranker - Post-retrieval rerank stage for textbook chunks.
+
+query_multi_class keeps every match above a fixed score threshold, so neighbouring
+or repeated passages (the same paragraph in several class books, overlapping
+chunks of one page) all reach the prompt. A reranker picks a smaller, more
+diverse top-k from the candidate set before it goes to Gemini.
+
+Strategies (RAG_RERANK_STRATEGY):
+- "none": keep the top-k by vector score
+- "mmr": Maximal Marginal Relevance over the candidate vectors Pinecone returned
+- "cross_encoder": rescore (question, chunk) pairs with a local cross-encoder
+- "cross_encoder_mmr": cross-encoder relevance, then MMR for diversity
+
+All scoring is vectorised with NumPy over the candidate set. If a stage cannot
+run (vectors missing, model failed to load) it falls back to score order.
+"""
+
+from typing import Dict, List, Optional, Sequence
+from app.core.config import settings
+from app.services.model_registry import model_registry
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RERANK_STRATEGIES = ("none", "mmr", "cross_encoder", "cross_encoder_mmr")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def mmr_select(
+    relevance: np.ndarray,
+    vectors: np.ndarray,
+    top_k: int,
+    lambda_mult: float = 0.7
+) -> List[int]:
+    """
+    Greedy Maximal Marginal Relevance.
+
+    Args:
+        relevance: (n,) relevance of each candidate to the query
+        vectors: (n, d) unit-normalised candidate vectors
+        top_k: Number of candidates to pick
+        lambda_mult: 1.0 = pure relevance, 0.0 = pure diversity
+
+    Returns:
+        Indices of the picked candidates, in pick order
+    """
+    n = len(relevance)
+    top_k = min(top_k, n)
+    if top_k <= 0:
+        return []
+
+    similarity = vectors @ vectors.T
+    max_similarity = np.full(n, -np.inf)
+    available = np.ones(n, dtype=bool)
+    picked = []
+
+    for _ in range(top_k):
+        if picked:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        else:
+            scores = relevance.astype(float)
+        scores = np.where(available, scores, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+
+    return picked
+
+
+class Reranker:
+    """Base reranker: top-k by vector score. Subclasses override `_rerank`."""
+
+    name = "none"
+    needs_vectors = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "candidates_in": 0,
+            "chunks_out": 0,
+            "fallbacks": 0,
+            "total_ms": 0.0
+        }
+
+    def _by_score(self, chunks: List[Dict], top_k: int) -> List[int]:
+        order = sorted(range(len(chunks)), key=lambda i: -chunks[i].get('score', 0))
+        return order[:top_k]
+
+    def _rerank(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        chunks: List[Dict],
+        vectors: List[Optional[Sequence[float]]],
+        top_k: int
+    ) -> List[int]:
+        return self._by_score(chunks, top_k)
+
+    def rerank(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        chunks: List[Dict],
+        vectors: Optional[List[Optional[Sequence[float]]]],
+        top_k: int
+    ) -> List[Dict]:
+        """
+        Pick the best `top_k` chunks.
+
+        Args:
+            query_text: Student's question (for the cross-encoder)
+            query_embedding: Question embedding (for MMR relevance)
+            chunks: Candidate chunks with 'text' and 'score'
+            vectors: Candidate embeddings aligned with `chunks` (None entries if not fetched)
+            top_k: Number of chunks to keep
+
+        Returns:
+            The kept chunks, best first
+        """
+        started_at = time.perf_counter()
+        vectors = vectors or [None] * len(chunks)
+        fallback = False
+
+        if len(chunks) <= top_k:
+            # Nothing to drop; the caller re-sorts the kept chunks anyway
+            indices = self._by_score(chunks, top_k)
+        else:
+            try:
+                indices = self._rerank(query_text, query_embedding, chunks, vectors, top_k)
+            except Exception as e:
+                logger.warning(f"⚠️  {self.name} rerank failed, keeping score order: {e}")
+                indices = self._by_score(chunks, top_k)
+                fallback = True
+
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["candidates_in"] += len(chunks)
+            self.stats["chunks_out"] += len(indices)
+            self.stats["fallbacks"] += int(fallback)
+            self.stats["total_ms"] += elapsed_ms
+
+        return [chunks[i] for i in indices]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        calls = stats["calls"]
+        return {
+            "strategy": self.name,
+            **stats,
+            "total_ms": round(stats["total_ms"], 1),
+            "avg_ms": round(stats["total_ms"] / calls, 2) if calls else 0.0,
+            "avg_candidates": round(stats["candidates_in"] / calls, 1) if calls else 0.0,
+            "avg_kept": round(stats["chunks_out"] / calls, 1) if calls else 0.0
+        }
+
+
+class MMRReranker(Reranker):
+    """Diversify the candidates with MMR over their stored vectors."""
+
+    name = "mmr"
+    needs_vectors = True
+
+    def __init__(self, lambda_mult: float = 0.7):
+        super().__init__()
+        self.lambda_mult = lambda_mult
+
+    def _candidate_matrix(self, vectors: List[Optional[Sequence[float]]]) -> np.ndarray:
+        if any(vector is None for vector in vectors):
+            raise ValueError("candidate vectors missing (query without include_values?)")
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+    def _rerank(self, query_text, query_embedding, chunks, vectors, top_k) -> List[int]:
+        matrix = self._candidate_matrix(vectors)
+        query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        return mmr_select(matrix @ query, matrix, top_k, self.lambda_mult)
+
+
+class CrossEncoderReranker(MMRReranker):
+    """Rescore candidates with a local cross-encoder, optionally followed by MMR."""
+
+    name = "cross_encoder"
+    needs_vectors = False
+
+    def __init__(
+        self,
+        model_id: str,
+        mmr_lambda: Optional[float] = None,
+        batch_size: int = 32,
+        device: Optional[str] = None
+    ):
+        super().__init__(lambda_mult=mmr_lambda if mmr_lambda is not None else 1.0)
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.device = device
+        self.use_mmr = mmr_lambda is not None
+        if self.use_mmr:
+            self.name = "cross_encoder_mmr"
+            self.needs_vectors = True
+
+    @property
+    def model(self):
+        """The shared CrossEncoder (loaded once per process via model_registry)."""
+        name = f"cross-encoder:{self.model_id}"
+
+        def load():
+            from sentence_transformers import CrossEncoder
+            return CrossEncoder(self.model_id, device=self.device)
+
+        model_registry.register(name, load)
+        return model_registry.get(name)
+
+    def _rerank(self, query_text, query_embedding, chunks, vectors, top_k) -> List[int]:
+        scores = np.asarray(
+            self.model.predict(
+                [(query_text, chunk.get('text', '')) for chunk in chunks],
+                batch_size=self.batch_size
+            ),
+            dtype=np.float32
+        )
+        for chunk, score in zip(chunks, scores):
+            chunk['rerank_score'] = round(float(score), 4)
+
+        if not self.use_mmr:
+            return [int(i) for i in np.argsort(-scores)[:top_k]]
+
+        # Cross-encoder logits are unbounded; scale to [0, 1] so they trade off against cosine similarity
+        spread = scores.max() - scores.min()
+        relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        return mmr_select(relevance, self._candidate_matrix(vectors), top_k, self.lambda_mult)
+
+
+def build_reranker(
+    strategy: str,
+    mmr_lambda: float = 0.7,
+    cross_encoder_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+) -> Reranker:
+    """Create the reranker for one of RERANK_STRATEGIES."""
+    if strategy == "none":
+        return Reranker()
+    if strategy == "mmr":
+        return MMRReranker(lambda_mult=mmr_lambda)
+    if strategy == "cross_encoder":
+        return CrossEncoderReranker(cross_encoder_model)
+    if strategy == "cross_encoder_mmr":
+        return CrossEncoderReranker(cross_encoder_model, mmr_lambda=mmr_lambda)
+    raise ValueError(f"Unknown rerank strategy '{strategy}' (expected one of {RERANK_STRATEGIES})")
+
+
+# Global instance
+reranker = build_reranker(
+    settings.RAG_RERANK_STRATEGY,
+    mmr_lambda=settings.RAG_RERANK_MMR_LAMBDA,
+    cross_encoder_model=settings.RAG_RERANK_CROSS_ENCODER_MODEL
+)
@@ -0,0 +1,167 @@
+"""
+Retrieval Orchestrator
+Runs independent retrieval branches (textbook, LLM cache, web) concurrently.
+
+- All branches are submitted at once, so retrieval costs max(branch) instead of sum(branch)
+- A short-circuit branch (the LLM answer cache) can cancel or ignore slower branches
+- Per-branch timings are kept to show which index dominates tail latency
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from app.core.config import settings
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalResult:
+    """Outcome of one orchestrated retrieval."""
+
+    def __init__(self):
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}  # Branch name -> milliseconds
+        self.short_circuited = False
+        self.skipped: List[str] = []
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+
+class RetrievalOrchestrator:
+    """
+    Concurrent executor for retrieval branches with per-branch latency stats.
+    """
+
+    def __init__(self, max_workers: int = 12, history_size: int = 500):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="rag-retrieval"
+        )
+        self._history_size = history_size
+        self._timings: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.total_runs = 0
+        self.short_circuits = 0
+
+    def _record_timing(self, name: str, elapsed_ms: float):
+        with self._lock:
+            if name not in self._timings:
+                self._timings[name] = deque(maxlen=self._history_size)
+            self._timings[name].append(elapsed_ms)
+
+    def _timed(self, name: str, fn: Callable[[], Any], result: RetrievalResult) -> Callable[[], Any]:
+        """Wrap a branch so its own execution time is recorded (even if it ends up ignored)."""
+        def runner():
+            start = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                result.timings[name] = round(elapsed_ms, 1)
+                self._record_timing(name, elapsed_ms)
+        return runner
+
+    def run(
+        self,
+        branches: Dict[str, Callable[[], Any]],
+        defaults: Optional[Dict[str, Any]] = None,
+        short_circuit_branch: Optional[str] = None,
+        short_circuit_when: Optional[Callable[[Any], bool]] = None,
+        skip_on_short_circuit: Iterable[str] = ()
+    ) -> RetrievalResult:
+        """
+        Run all branches concurrently and collect their results.
+
+        Args:
+            branches: Branch name -> zero-argument callable
+            defaults: Result to use for a branch that failed or was skipped
+            short_circuit_branch: Branch whose result may end retrieval early
+            short_circuit_when: Predicate on that branch's result
+            skip_on_short_circuit: Branches to cancel/ignore once the predicate is true
+
+        Returns:
+            RetrievalResult with results, per-branch timings and skipped branches
+        """
+        defaults = defaults or {}
+        skip_on_short_circuit = set(skip_on_short_circuit)
+        result = RetrievalResult()
+
+        futures = {
+            self._executor.submit(self._timed(name, fn, result)): name
+            for name, fn in branches.items()
+        }
+        pending = set(futures)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = futures[future]
+                try:
+                    result.results[name] = future.result()
+                except Exception as e:
+                    logger.warning(f"Retrieval branch '{name}' failed: {e}")
+                    result.results[name] = defaults.get(name)
+
+                if (
+                    name == short_circuit_branch
+                    and short_circuit_when is not None
+                    and short_circuit_when(result.results[name])
+                ):
+                    result.short_circuited = True
+                    for other in list(pending):
+                        other_name = futures[other]
+                        if other_name in skip_on_short_circuit:
+                            # Cancel if not started yet, otherwise just stop waiting for it
+                            other.cancel()
+                            pending.discard(other)
+                            result.skipped.append(other_name)
+                            result.results[other_name] = defaults.get(other_name)
+
+        with self._lock:
+            self.total_runs += 1
+            if result.short_circuited:
+                self.short_circuits += 1
+
+        timings_str = ", ".join(f"{name}={ms:.0f}ms" for name, ms in result.timings.items())
+        skipped_str = f" (skipped: {', '.join(result.skipped)})" if result.skipped else ""
+        logger.info(f"⏱️ Retrieval timings: {timings_str}{skipped_str}")
+
+        return result
+
+    def get_stats(self) -> Dict:
+        """Per-branch latency percentiles over the most recent runs."""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._timings.items()}
+            total_runs = self.total_runs
+            short_circuits = self.short_circuits
+
+        def percentile(values: List[float], pct: float) -> float:
+            index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+            return round(values[index], 1)
+
+        branches = {}
+        for name, values in snapshot.items():
+            if not values:
+                continue
+            branches[name] = {
+                "samples": len(values),
+                "avg_ms": round(sum(values) / len(values), 1),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "max_ms": round(values[-1], 1)
+            }
+
+        return {
+            "total_runs": total_runs,
+            "short_circuits": short_circuits,
+            "branches": branches
+        }
+
+
+# Global instance
+retrieval_orchestrator = RetrievalOrchestrator(max_workers=settings.RAG_RETRIEVAL_WORKERS)
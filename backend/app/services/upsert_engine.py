@@ -0,0 +1,404 @@
+"""
+Pinecone Upsert Engine - Shared concurrent upserts for every ingestion path.
+
+The book uploader, the math uploader and the physics uploader each upserted
+fixed-count batches one at a time and failed a batch as a whole. This engine:
+
+- packs vectors into batches bounded by count AND estimated request size (metadata
+  text of up to 2,000 chars makes payloads vary a lot; Pinecone rejects requests
+  over 2 MB)
+- keeps several batches in flight on a thread pool
+- retries throttling / server / network errors with exponential backoff and jitter
+  (upserts by ID are idempotent, so a retry never duplicates vectors), halves
+  batches rejected as too large, and bisects batches rejected because of one of
+  their vectors so a bad vector only fails itself; errors that apply to the whole
+  request (bad key, wrong dimension, unknown host/namespace) fail the batch at once
+- records each upserted batch in the ingestion cache's `vectors` table under a
+  checkpoint key, so a crashed ingest resumes by skipping what already landed
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.ingestion_cache import IngestionCache, ingestion_cache
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Pinecone's hard limits per upsert request
+PINECONE_MAX_VECTORS_PER_REQUEST = 1000
+PINECONE_MAX_REQUEST_BYTES = 2 * 1024 * 1024
+
+# JSON bytes per float in the request body (sign, digits, exponent, separator)
+_BYTES_PER_VALUE = 20
+_VECTOR_OVERHEAD_BYTES = 64
+
+
+def _as_dict(vector) -> Dict:
+    """Normalize (id, values[, metadata]) tuples and numpy values to Pinecone's dict form."""
+    if isinstance(vector, dict):
+        values = vector['values']
+        vector_id, metadata = vector['id'], vector.get('metadata')
+    else:
+        vector_id, values = vector[0], vector[1]
+        metadata = vector[2] if len(vector) > 2 else None
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    result = {'id': vector_id, 'values': values}
+    if metadata:
+        result['metadata'] = metadata
+    return result
+
+
+def estimate_vector_bytes(vector: Dict) -> int:
+    """Approximate size of one vector in an upsert request body."""
+    metadata = vector.get('metadata')
+    metadata_bytes = len(json.dumps(metadata, default=str).encode("utf-8")) if metadata else 0
+    return (
+        _VECTOR_OVERHEAD_BYTES
+        + len(str(vector['id']))
+        + len(vector['values']) * _BYTES_PER_VALUE
+        + metadata_bytes
+    )
+
+
+def checkpoint_hash(vector: Dict) -> str:
+    """
+    Default checkpoint hash: ID, dimension and metadata (which carries the chunk text).
+
+    Embedding values are left out so re-computed embeddings with float noise still
+    count as already upserted; upsert with resume=False (or explicit hashes) after a model change.
+    """
+    raw = f"{vector['id']}|{len(vector['values'])}|{json.dumps(vector.get('metadata'), sort_keys=True, default=str)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    """HTTP status of a Pinecone client error, if it carries one."""
+    for attr in ("status", "status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _is_too_large(error: Exception, status: Optional[int]) -> bool:
+    message = str(error).lower()
+    return status == 413 or "too large" in message or "message length" in message or "payload size" in message
+
+
+def _names_vector(error: Exception, status: Optional[int], batch: List[Dict]) -> bool:
+    """
+    A 400 caused by particular vectors (metadata too large / bad type, or an error
+    naming a vector ID) rather than by the request as a whole.
+    """
+    if status != 400:
+        return False
+    message = str(error)
+    if "dimension" in message.lower():
+        return False
+    return "metadata" in message.lower() or any(str(vector['id']) in message for vector in batch)
+
+
+def _is_retryable(status: Optional[int]) -> bool:
+    """Throttling, server errors and errors without a status (network / timeouts)."""
+    return status is None or status == 429 or status >= 500
+
+
+class UpsertSession:
+    """
+    One streaming upsert into a namespace.
+
+    `add` packs vectors into size-bounded batches and submits them (blocking while
+    `concurrency` batches are already in flight); `close` flushes the rest, waits
+    for every batch and returns the session statistics.
+    """
+
+    def __init__(
+        self,
+        engine: "PineconeUpsertEngine",
+        namespace: str,
+        checkpoint_key: Optional[str] = None,
+        hashes: Optional[Dict[str, str]] = None,
+        resume: bool = True,
+        total: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int, str], None]] = None,
+        max_batch_vectors: Optional[int] = None
+    ):
+        self.engine = engine
+        self.namespace = namespace
+        self.checkpoint_key = checkpoint_key if engine.checkpoint is not None else None
+        self.hashes = hashes
+        self.total = total
+        self.progress_callback = progress_callback
+        self.max_batch_vectors = max(1, min(
+            max_batch_vectors or engine.max_batch_vectors, PINECONE_MAX_VECTORS_PER_REQUEST
+        ))
+
+        self._recorded: Dict[str, str] = {}
+        if self.checkpoint_key is not None and resume:
+            self._recorded = engine.checkpoint.get_vectors(namespace, self.checkpoint_key)
+
+        self._pending: List[Dict] = []
+        self._pending_bytes = 0
+        self._in_flight: Set[Future] = set()
+        self._lock = threading.Lock()
+        self._done = 0
+
+        self.stats = {
+            'upserted': 0,
+            'failed': 0,
+            'skipped': 0,
+            'batches': 0,
+            'retries': 0,
+            'splits': 0,
+            'failed_ids': [],
+            'errors': []
+        }
+
+    def __enter__(self) -> "UpsertSession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _hash(self, vector: Dict) -> str:
+        if self.hashes is not None and vector['id'] in self.hashes:
+            return self.hashes[vector['id']]
+        return checkpoint_hash(vector)
+
+    def add(self, vectors: Iterable):
+        """Queue vectors for upsert; full batches are sent as soon as they are packed."""
+        for vector in vectors:
+            vector = _as_dict(vector)
+            if self._recorded and self._recorded.get(vector['id']) == self._hash(vector):
+                self.stats['skipped'] += 1
+                self._advance(1)
+                continue
+
+            size = estimate_vector_bytes(vector)
+            if self._pending and (
+                len(self._pending) >= self.max_batch_vectors
+                or self._pending_bytes + size > self.engine.max_batch_bytes
+            ):
+                self._submit()
+            self._pending.append(vector)
+            self._pending_bytes += size
+
+    def _submit(self):
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        while len(self._in_flight) >= self.engine.concurrency:
+            finished, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                self._collect(future)
+        self._in_flight.add(self.engine._pool().submit(self.engine._send, batch, self.namespace))
+
+    def _collect(self, future: Future):
+        """Account for one finished batch and checkpoint its upserted vectors."""
+        upserted, failed, counters = future.result()
+        if upserted and self.checkpoint_key is not None:
+            self.engine.checkpoint.record_vectors(
+                self.namespace, self.checkpoint_key, {vector['id']: self._hash(vector) for vector in upserted}
+            )
+        with self._lock:
+            self.stats['upserted'] += len(upserted)
+            self.stats['failed'] += len(failed)
+            self.stats['batches'] += counters['batches']
+            self.stats['retries'] += counters['retries']
+            self.stats['splits'] += counters['splits']
+            for vector_id, error in failed:
+                self.stats['failed_ids'].append(vector_id)
+                self.stats['errors'].append(f"Vector {vector_id}: {error}")
+        self._advance(len(upserted) + len(failed))
+
+    def _advance(self, count: int):
+        self._done += count
+        if self.progress_callback and count:
+            total = self.total or self._done
+            try:
+                self.progress_callback(self._done, total, f"Upserted {self._done}/{total} vectors")
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+
+    def close(self) -> Dict:
+        """Send the last partial batch and wait for every batch in flight."""
+        if self._pending:
+            self._submit()
+        for future in list(self._in_flight):
+            self._collect(future)
+        self._in_flight = set()
+        self.engine._record(self.stats)
+        return self.stats
+
+
+class PineconeUpsertEngine:
+    """Concurrent, size-aware, retrying upserts into one Pinecone index."""
+
+    def __init__(
+        self,
+        index,
+        concurrency: int = 4,
+        max_batch_vectors: int = 100,
+        max_batch_bytes: int = 1_800_000,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        checkpoint: Optional[IngestionCache] = None
+    ):
+        """
+        Args:
+            index: Pinecone Index to upsert into
+            concurrency: Upsert requests in flight at once
+            max_batch_vectors: Vectors per request (capped at Pinecone's 1,000)
+            max_batch_bytes: Estimated request size per batch (capped at Pinecone's 2 MB)
+            max_attempts: Attempts per batch for retryable errors
+            base_delay: First retry delay in seconds (doubled per attempt, with jitter)
+            max_delay: Longest retry delay in seconds
+            checkpoint: Cache recording upserted vectors per checkpoint key (None disables resume)
+        """
+        self.index = index
+        self.concurrency = max(1, concurrency)
+        self.max_batch_vectors = max(1, min(max_batch_vectors, PINECONE_MAX_VECTORS_PER_REQUEST))
+        self.max_batch_bytes = max(1, min(max_batch_bytes, PINECONE_MAX_REQUEST_BYTES))
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.checkpoint = checkpoint if checkpoint is not None and checkpoint.enabled else None
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'sessions': 0,
+            'upserted': 0,
+            'failed': 0,
+            'skipped': 0,
+            'batches': 0,
+            'retries': 0,
+            'splits': 0
+        }
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.concurrency, thread_name_prefix="pinecone-upsert"
+                    )
+        return self._executor
+
+    def session(self, namespace: str, **kwargs) -> UpsertSession:
+        """Open a streaming upsert (see UpsertSession for the keyword arguments)."""
+        return UpsertSession(self, namespace, **kwargs)
+
+    def upsert(
+        self,
+        vectors: List,
+        namespace: str,
+        checkpoint_key: Optional[str] = None,
+        hashes: Optional[Dict[str, str]] = None,
+        resume: bool = True,
+        progress_callback: Optional[Callable[[int, int, str], None]] = None,
+        max_batch_vectors: Optional[int] = None
+    ) -> Dict:
+        """
+        Upsert a list of vectors (dicts or (id, values, metadata) tuples).
+
+        Args:
+            vectors: Vectors to upsert
+            namespace: Pinecone namespace
+            checkpoint_key: Groups the vectors across runs (e.g. a PDF); with a
+                            checkpoint cache, vectors already upserted under it are skipped
+            hashes: vector_id -> content hash to checkpoint (default: checkpoint_hash)
+            resume: Skip vectors the checkpoint already records (False re-sends all)
+            progress_callback: Called with (done, total, message) as batches finish
+            max_batch_vectors: Vectors per request for this call (default: the engine's)
+
+        Returns:
+            Statistics: upserted, failed, skipped, batches, retries, splits, failed_ids, errors
+        """
+        with self.session(
+            namespace,
+            checkpoint_key=checkpoint_key,
+            hashes=hashes,
+            resume=resume,
+            total=len(vectors),
+            progress_callback=progress_callback,
+            max_batch_vectors=max_batch_vectors
+        ) as session:
+            session.add(vectors)
+        return session.stats
+
+    def _send(self, batch: List[Dict], namespace: str) -> Tuple[List[Dict], List[Tuple[str, str]], Dict]:
+        """
+        Upsert one batch (runs on the pool).
+
+        Returns (upserted vectors, [(failed id, error)], counters).
+        """
+        counters = {'batches': 1, 'retries': 0, 'splits': 0}
+        for attempt in range(self.max_attempts):
+            try:
+                self.index.upsert(vectors=batch, namespace=namespace)
+                logger.debug(f"  ✓ Upserted batch of {len(batch)} vectors")
+                return batch, [], counters
+            except Exception as e:
+                status = _error_status(e)
+                too_large = _is_too_large(e, status)
+                if len(batch) > 1 and (too_large or _names_vector(e, status, batch)):
+                    # Halve oversized batches; bisect rejected ones to isolate bad vectors
+                    logger.warning(f"  Upsert of {len(batch)} vectors rejected ({e}), splitting batch")
+                    return self._split(batch, namespace, counters)
+                if not _is_retryable(status) or too_large or attempt == self.max_attempts - 1:
+                    logger.error(f"  ✗ Upsert of {len(batch)} vectors failed after {attempt + 1} attempts: {e}")
+                    return [], [(vector['id'], str(e)) for vector in batch], counters
+
+                counters['retries'] += 1
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                delay *= random.uniform(0.5, 1.5)
+                logger.warning(f"  Upsert attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        return [], [(vector['id'], "no attempts left") for vector in batch], counters
+
+    def _split(self, batch: List[Dict], namespace: str, counters: Dict):
+        counters['splits'] += 1
+        middle = len(batch) // 2
+        upserted, failed = [], []
+        for half in (batch[:middle], batch[middle:]):
+            half_upserted, half_failed, half_counters = self._send(half, namespace)
+            upserted.extend(half_upserted)
+            failed.extend(half_failed)
+            for key in counters:
+                counters[key] += half_counters[key]
+        return upserted, failed, counters
+
+    def _record(self, session_stats: Dict):
+        with self._stats_lock:
+            self.stats['sessions'] += 1
+            for key in ('upserted', 'failed', 'skipped', 'batches', 'retries', 'splits'):
+                self.stats[key] += session_stats[key]
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                **self.stats,
+                'concurrency': self.concurrency,
+                'max_batch_vectors': self.max_batch_vectors,
+                'max_batch_bytes': self.max_batch_bytes
+            }
+
+
+def create_upsert_engine(index, checkpoint: Optional[IngestionCache] = ingestion_cache) -> PineconeUpsertEngine:
+    """Engine for an index with the PINECONE_UPSERT_* settings."""
+    return PineconeUpsertEngine(
+        index,
+        concurrency=settings.PINECONE_UPSERT_CONCURRENCY,
+        max_batch_vectors=settings.PINECONE_UPSERT_MAX_VECTORS,
+        max_batch_bytes=settings.PINECONE_UPSERT_MAX_BYTES,
+        max_attempts=settings.PINECONE_UPSERT_MAX_ATTEMPTS,
+        checkpoint=checkpoint
+    )
@@ -3,8 +3,8 @@ Web Scraper Service
 Automatically scrapes educational content to enrich student learning.
 """
 
-from sentence_transformers import SentenceTransformer
 from app.db.mongo import pinecone_web_db
+from app.services.embedding_registry import embedding_registry
 import logging
 import re
 import hashlib
@@ -35,8 +35,9 @@ class WebScraperService:
     """
     
     def __init__(self):
-        """Initialize web scraper with embedding model."""
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+        """Initialize web scraper with the web index's registered embedder."""
+        # Must match the model EnhancedRAGService queries the web index with
+        self.embedder = embedding_registry.get_embedder("web")
         self.enabled = SCRAPING_ENABLED
         
         # Trusted educational sources
@@ -341,10 +342,10 @@ class WebScraperService:
         try:
             vectors = []
             
-            for i, chunk in enumerate(chunks):
-                # Generate embedding
-                embedding = self.embedding_model.encode(chunk).tolist()
-                
+            # Generate embeddings for all chunks
+            embeddings = self.embedder.embed_documents(chunks)
+            
+            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
                 # Create unique ID
                 url_hash = hashlib.md5(url.encode()).hexdigest()[:16]
                 vector_id = f"web_{subject.lower()}_{topic.lower()}_{url_hash}_chunk{i}"
@@ -359,7 +360,8 @@ class WebScraperService:
                     "title": title[:200],
                     "scrape_date": datetime.now().isoformat(),
                     "chunk_index": i,
-                    "total_chunks": len(chunks)
+                    "total_chunks": len(chunks),
+                    "embedding_model": self.embedder.spec.name
                 }
                 
                 vectors.append((vector_id, embedding, metadata))
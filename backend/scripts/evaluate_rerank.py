@@ -0,0 +1,158 @@
+"""
+Offline recall@k comparison of the textbook rerank strategies.
+
+Each question is retrieved once (with stored vectors), then every strategy
+reranks the same candidate set, so differences come only from the rerank stage.
+
+Dataset: JSONL, one labelled question per line:
+    {"question": "What is photosynthesis?", "subject": "Science", "class": 7,
+     "chapter": null, "mode": "basic",
+     "relevant_ids": ["..."], "relevant_text": ["plants make their own food"]}
+
+A label is hit when any of the top-k chunks has that vector ID or contains that
+text snippet (case-insensitive). Recall@k = labels hit / labels.
+
+Usage:
+    python scripts/evaluate_rerank.py --dataset eval/rerank_questions.jsonl
+    python scripts/evaluate_rerank.py --dataset eval/q.jsonl --strategies none mmr --k 3 5 8
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.config import settings
+from app.services.enhanced_rag_service import enhanced_rag_service
+from app.services.reranker import RERANK_STRATEGIES, build_reranker
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def load_dataset(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def label_hits(item: dict, chunks: list) -> int:
+    """Number of labels of `item` covered by `chunks`."""
+    ids = {chunk.get('id') for chunk in chunks}
+    texts = [chunk.get('text', '').lower() for chunk in chunks]
+    hits = sum(1 for vector_id in item.get("relevant_ids", []) if vector_id in ids)
+    hits += sum(
+        1 for snippet in item.get("relevant_text", [])
+        if any(snippet.lower() in text for text in texts)
+    )
+    return hits
+
+
+def retrieve_candidates(item: dict, candidates_per_class: int):
+    """Textbook candidates (and their vectors) for one question, before reranking."""
+    rag = enhanced_rag_service
+    mode = item.get("mode", "basic")
+    query_embedding = rag.generate_embedding(item["question"])
+    classes_to_search = rag.get_prerequisite_classes(item["subject"], item["class"], mode)
+    matches_by_class = rag._fetch_class_matches(
+        namespace=rag.get_namespace(item["subject"]),
+        query_embedding=query_embedding,
+        classes_to_search=classes_to_search,
+        subject=item["subject"],
+        chapter=item.get("chapter"),
+        chunks_per_class=candidates_per_class,
+        strategy=settings.RAG_CLASS_QUERY_STRATEGY,
+        include_values=True
+    )
+    chunks, vectors = rag._collect_class_chunks(matches_by_class, classes_to_search, item["subject"], mode)
+    return query_embedding, chunks, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rerank strategies by recall@k")
+    parser.add_argument("--dataset", required=True, help="JSONL file of labelled questions")
+    parser.add_argument("--strategies", nargs="+", choices=RERANK_STRATEGIES, default=list(RERANK_STRATEGIES))
+    parser.add_argument("--k", nargs="+", type=int, default=[3, 5, 8, 10], help="Cut-offs to report")
+    parser.add_argument("--candidates-per-class", type=int, default=8, help="Matches fetched per class level")
+    parser.add_argument("--mmr-lambda", type=float, default=settings.RAG_RERANK_MMR_LAMBDA)
+    parser.add_argument("--cross-encoder", default=settings.RAG_RERANK_CROSS_ENCODER_MODEL)
+    parser.add_argument("--output", help="Also write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.dataset)
+    ks = sorted(set(args.k))
+    rerankers = {
+        strategy: build_reranker(strategy, mmr_lambda=args.mmr_lambda, cross_encoder_model=args.cross_encoder)
+        for strategy in args.strategies
+    }
+
+    logger.info("=" * 70)
+    logger.info(f"🧪 Rerank evaluation: {len(dataset)} questions, strategies {args.strategies}, k={ks}")
+    logger.info("=" * 70)
+
+    total_labels = 0
+    candidate_hits = 0
+    hits = {strategy: {k: 0 for k in ks} for strategy in rerankers}
+    tokens = {strategy: {k: 0 for k in ks} for strategy in rerankers}
+    latency_ms = {strategy: 0.0 for strategy in rerankers}
+    evaluated = 0
+
+    for item in dataset:
+        labels = len(item.get("relevant_ids", [])) + len(item.get("relevant_text", []))
+        if not labels:
+            logger.warning(f"⚠️  Skipping unlabelled question: {item.get('question')}")
+            continue
+
+        query_embedding, chunks, vectors = retrieve_candidates(item, args.candidates_per_class)
+        evaluated += 1
+        total_labels += labels
+        candidate_hits += label_hits(item, chunks)
+
+        for strategy, reranker in rerankers.items():
+            started_at = time.perf_counter()
+            ranked = reranker.rerank(
+                item["question"], query_embedding, [dict(chunk) for chunk in chunks], vectors, max(ks)
+            )
+            latency_ms[strategy] += (time.perf_counter() - started_at) * 1000
+            for k in ks:
+                hits[strategy][k] += label_hits(item, ranked[:k])
+                tokens[strategy][k] += sum(len(chunk.get('text', '')) // 4 for chunk in ranked[:k])
+
+    if not evaluated:
+        logger.error("❌ No labelled questions in the dataset")
+        sys.exit(1)
+
+    summary = {
+        "questions": evaluated,
+        "labels": total_labels,
+        "candidate_recall": round(candidate_hits / total_labels, 3),
+        "strategies": {
+            strategy: {
+                "avg_ms": round(latency_ms[strategy] / evaluated, 2),
+                "recall": {f"@{k}": round(hits[strategy][k] / total_labels, 3) for k in ks},
+                "avg_context_tokens": {f"@{k}": round(tokens[strategy][k] / evaluated) for k in ks}
+            }
+            for strategy in rerankers
+        }
+    }
+
+    logger.info(f"📊 Candidate recall (upper bound): {summary['candidate_recall']}")
+    header = "strategy".ljust(20) + "".join(f"R@{k}".rjust(8) for k in ks) + "avg ms".rjust(10)
+    logger.info(header)
+    for strategy, result in summary["strategies"].items():
+        row = strategy.ljust(20) + "".join(f"{result['recall'][f'@{k}']:.3f}".rjust(8) for k in ks)
+        logger.info(row + f"{result['avg_ms']:.1f}".rjust(10))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"💾 Summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
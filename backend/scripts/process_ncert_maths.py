@@ -225,7 +225,8 @@ class NCERTMathProcessor:
         logger.info("   [5/5] Uploading to Pinecone...")
         upload_result = self.uploader.upload_chunks(
             chunks=valid_chunks,
-            namespace="mathematics"
+            namespace="mathematics",
+            checkpoint_key=f"mathematics/{pdf_path.name}"  # a re-run resumes a crashed upload
         )
         logger.info(f"      [+] Uploaded {upload_result['uploaded']}/{upload_result['total']}")
         
@@ -106,7 +106,8 @@ class PhysicsProcessor:
             logger.info("\n[5/5] Uploading to Pinecone...")
             upload_stats = self.uploader.upload_chunks(
                 chunks_with_embeddings,
-                namespace="physics"
+                namespace="physics",
+                checkpoint_key=f"physics/{pdf_path.name}"  # a re-run resumes a crashed upload
             )
             
             logger.info(f"✅ PDF processing complete!")
@@ -0,0 +1,155 @@
+"""
+Re-embed stored vectors with the embedding model declared in the registry.
+
+Use after changing an index binding (EMBEDDING_MODEL_* in .env) or to migrate
+the existing `llm_*` answer-cache vectors, which were written with
+all-mpnet-base-v2 while queries use Gemini text-embedding-004.
+
+Every vector whose `embedding_model` metadata tag differs from the index's
+registered model is re-embedded from its stored text and upserted with the
+new tag. Already-migrated vectors are skipped, so the script is safe to re-run.
+
+Usage:
+    python scripts/reembed_vectors.py --index llm
+    python scripts/reembed_vectors.py --index web --namespace mathematics --dry-run
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.db.mongo import pinecone_db, pinecone_web_db, pinecone_llm_db
+from app.services.embedding_registry import embedding_registry
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# index key -> (db, vector id prefix, metadata field holding the embedded text)
+INDEXES = {
+    "llm": (pinecone_llm_db, "llm_", "question"),
+    "web": (pinecone_web_db, "web_", "text"),
+    "textbook": (pinecone_db, None, "text")
+}
+
+
+def iter_vector_ids(index, namespace: str, prefix: str, batch_size: int):
+    """Yield batches of vector IDs in a namespace."""
+    if hasattr(index, "list"):
+        kwargs = {"namespace": namespace}
+        if prefix:
+            kwargs["prefix"] = prefix
+        batch = []
+        for page in index.list(**kwargs):
+            for vector_id in page:
+                batch.append(vector_id)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+        return
+
+    raise RuntimeError(
+        "This pinecone-client has no index.list(); upgrade to pinecone-client>=3.1 "
+        "to enumerate vector IDs for migration"
+    )
+
+
+def reembed_namespace(index_key: str, namespace: str, batch_size: int, dry_run: bool) -> dict:
+    """Re-embed all stale vectors in one namespace."""
+    db, prefix, text_field = INDEXES[index_key]
+    spec = embedding_registry.get_model(index_key)
+    embedder = embedding_registry.get_embedder(index_key)
+
+    counts = {"checked": 0, "reembedded": 0, "skipped": 0, "missing_text": 0}
+
+    for ids in iter_vector_ids(db.index, namespace, prefix, batch_size):
+        fetched = db.index.fetch(ids=ids, namespace=namespace).get('vectors', {})
+
+        stale_ids, texts, metadatas = [], [], []
+        for vector_id, vector in fetched.items():
+            counts["checked"] += 1
+            metadata = dict(vector.get('metadata') or {})
+
+            if metadata.get("embedding_model") == spec.name:
+                counts["skipped"] += 1
+                continue
+
+            text = metadata.get(text_field)
+            if not text:
+                counts["missing_text"] += 1
+                continue
+
+            metadata["embedding_model"] = spec.name
+            stale_ids.append(vector_id)
+            texts.append(text)
+            metadatas.append(metadata)
+
+        if not stale_ids:
+            continue
+
+        if dry_run:
+            counts["reembedded"] += len(stale_ids)
+            continue
+
+        # The llm index stores question embeddings, so it uses query embeddings on both sides
+        if index_key == "llm":
+            embeddings = [embedder.embed_query(text) for text in texts]
+        else:
+            embeddings = embedder.embed_documents(texts)
+
+        db.index.upsert(
+            vectors=list(zip(stale_ids, embeddings, metadatas)),
+            namespace=namespace
+        )
+        counts["reembedded"] += len(stale_ids)
+        logger.info(f"   {namespace}: re-embedded {counts['reembedded']} vectors so far")
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed Pinecone vectors with the registered model")
+    parser.add_argument("--index", choices=sorted(INDEXES), default="llm", help="Index to migrate")
+    parser.add_argument("--namespace", help="Only migrate this namespace (default: all)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Vectors per fetch/upsert batch")
+    parser.add_argument("--dry-run", action="store_true", help="Count stale vectors without writing")
+    args = parser.parse_args()
+
+    db, _prefix, _text_field = INDEXES[args.index]
+    db.connect()
+    if not db.index:
+        logger.error(f"❌ '{args.index}' index is not connected - check your .env")
+        sys.exit(1)
+
+    spec = embedding_registry.get_model(args.index)
+    logger.info("=" * 70)
+    logger.info(f"🧬 Re-embedding '{args.index}' index with {spec.name} ({spec.dimension} dim)")
+    logger.info("=" * 70)
+
+    stats = db.index.describe_index_stats()
+    if stats.get('dimension') and stats['dimension'] != spec.dimension:
+        logger.error(f"❌ Index dimension {stats['dimension']} != model dimension {spec.dimension}")
+        sys.exit(1)
+
+    namespaces = [args.namespace] if args.namespace else list((stats.get('namespaces') or {}).keys())
+
+    totals = {}
+    for namespace in namespaces:
+        logger.info(f"📂 Namespace '{namespace}'")
+        counts = reembed_namespace(args.index, namespace, args.batch_size, args.dry_run)
+        logger.info(f"   {counts}")
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+
+    action = "would be re-embedded" if args.dry_run else "re-embedded"
+    logger.info(f"✅ Done: {totals.get('reembedded', 0)} vectors {action} ({totals})")
+
+
+if __name__ == "__main__":
+    main()
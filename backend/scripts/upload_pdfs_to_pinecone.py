@@ -1,8 +1,14 @@
 """
 PDF to Pinecone Upload Script with OCR Support
 Extracts text from PDFs (including text in images) and uploads to Pinecone
+
+Re-runs reuse the ingestion cache (app/services/ingestion_cache.py): pages whose
+content did not change skip OCR, unchanged chunks are neither re-embedded nor
+re-upserted, and vectors of chunks that disappeared are deleted.
+Pass --refresh to redo everything.
 """
 
+import argparse
 import os
 import sys
 import re
@@ -32,14 +38,37 @@ from pinecone import Pinecone
 from dotenv import load_dotenv
 load_dotenv()
 
+from app.services.ingestion_cache import ingestion_cache, page_fingerprint
+
+# Pages rasterized per pdf2image call (peak memory scales with this, not book length)
+PAGE_WINDOW = int(os.getenv('PDF_PAGE_WINDOW', '4'))
+
+# Bump when the OCR step changes, to invalidate cached page OCR
+OCR_EXTRACTOR = "upload-script-ocr-1"
+EMBEDDING_MODEL = "models/text-embedding-004"
+# Registry name tagged on every vector (see app/services/embedding_registry.py)
+EMBEDDING_MODEL_NAME = "gemini-text-embedding-004"
+
+
+def page_windows(page_numbers: List[int], size: int) -> List[List[int]]:
+    """Group ascending page numbers into runs of consecutive pages, at most `size` long."""
+    windows = []
+    for page_num in page_numbers:
+        if windows and page_num == windows[-1][-1] + 1 and len(windows[-1]) < size:
+            windows[-1].append(page_num)
+        else:
+            windows.append([page_num])
+    return windows
+
 
 class PDFProcessor:
     """Process PDFs with OCR support for images"""
     
-    def __init__(self):
+    def __init__(self, refresh: bool = False):
         """Initialize PDF processor"""
         self.chunk_size = 1000  # Characters per chunk
         self.chunk_overlap = 200  # Overlap between chunks
+        self.refresh = refresh  # Ignore cached page OCR
         
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
@@ -54,6 +83,7 @@ class PDFProcessor:
         print(f"\n📄 Processing: {Path(pdf_path).name}")
         
         all_text = []
+        page_keys = []
         
         try:
             # Step 1: Extract regular text using PyPDF2
@@ -70,37 +100,61 @@ class PDFProcessor:
                     if text.strip():
                         all_text.append(f"\n--- Page {page_num + 1} ---\n")
                         all_text.append(text)
+                    
+                    fingerprint = page_fingerprint(page)
+                    page_keys.append(
+                        ingestion_cache.page_key(OCR_EXTRACTOR, {"dpi": 300, "psm": 6}, fingerprint)
+                        if fingerprint else None
+                    )
             
-            # Step 2: Extract text from images using OCR
-            print("  ├─ Converting pages to images for OCR...")
-            images = convert_from_path(
-                pdf_path,
-                dpi=300,  # High quality for better OCR
-                fmt='png'
-            )
+            # Step 2: Extract text from images using OCR (pages OCR'd before are reused)
+            ocr_texts = {}
+            if not self.refresh:
+                for page_num, key in enumerate(page_keys, start=1):
+                    cached = ingestion_cache.get_page(key) if key else None
+                    if cached is not None:
+                        ocr_texts[page_num] = cached["ocr_text"]
+            missing = [page_num for page_num in range(1, num_pages + 1) if page_num not in ocr_texts]
             
-            print(f"  ├─ Running OCR on {len(images)} pages...")
-            for page_num, image in enumerate(images, start=1):
-                # Convert PIL image to numpy array for OpenCV processing
-                img_array = np.array(image)
-                
-                # Preprocess image for better OCR
-                processed_img = self._preprocess_image(img_array)
-                
-                # Extract text using Tesseract OCR
-                ocr_text = pytesseract.image_to_string(
-                    processed_img,
-                    lang='eng',  # English language
-                    config='--psm 6'  # Assume uniform text block
+            # Rasterize a few pages at a time so memory stays flat for long books
+            print(f"  ├─ Running OCR on {len(missing)} pages ({len(ocr_texts)} cached, {PAGE_WINDOW} at a time)...")
+            for window in page_windows(missing, PAGE_WINDOW):
+                images = convert_from_path(
+                    pdf_path,
+                    dpi=300,  # High quality for better OCR
+                    fmt='png',
+                    first_page=window[0],
+                    last_page=window[-1]
                 )
                 
+                for page_num, image in zip(window, images):
+                    # Convert PIL image to numpy array for OpenCV processing
+                    img_array = np.array(image)
+                    
+                    # Preprocess image for better OCR
+                    processed_img = self._preprocess_image(img_array)
+                    
+                    # Extract text using Tesseract OCR
+                    ocr_text = pytesseract.image_to_string(
+                        processed_img,
+                        lang='eng',  # English language
+                        config='--psm 6'  # Assume uniform text block
+                    )
+                    ocr_texts[page_num] = ocr_text
+                    if page_keys[page_num - 1]:
+                        ingestion_cache.put_page(page_keys[page_num - 1], {"ocr_text": ocr_text})
+                    
+                    print(f"    ├─ OCR Page {page_num}/{num_pages} ✓")
+                
+                del images
+            
+            for page_num in range(1, num_pages + 1):
+                ocr_text = ocr_texts.get(page_num, "")
                 if ocr_text.strip():
                     # Only add if not already captured by PyPDF2
                     if not self._is_duplicate_text(ocr_text, ''.join(all_text)):
                         all_text.append(f"\n--- OCR Page {page_num} ---\n")
                         all_text.append(ocr_text)
-                
-                print(f"    ├─ OCR Page {page_num}/{len(images)} ✓")
             
             full_text = ''.join(all_text)
             print(f"  └─ ✓ Extracted {len(full_text)} characters")
@@ -270,49 +324,116 @@ class PineconeUploader:
             print(f"    ✗ Embedding error: {str(e)}")
             raise
     
-    def upload_chunks(self, chunks: List[Dict], batch_size: int = 100):
+    def generate_embeddings(self, texts: List[str]) -> List:
+        """
+        Embed many texts in one request (at most 100 per call)
+        
+        Falls back to one request per text if the batch fails; texts that still
+        fail come back as None.
+        """
+        try:
+            result = genai.embed_content(
+                model="models/text-embedding-004",
+                content=texts,
+                task_type="retrieval_document"
+            )
+            return result['embedding']
+        except Exception as e:
+            print(f"    ✗ Batch embedding error, retrying individually: {str(e)}")
+        
+        embeddings = []
+        for text in texts:
+            try:
+                embeddings.append(self.generate_embedding(text))
+            except Exception:
+                embeddings.append(None)
+        return embeddings
+    
+    def upload_chunks(self, chunks: List[Dict], batch_size: int = 100, refresh: bool = False):
         """
         Upload chunks to Pinecone with embeddings
         
+        Only chunks that changed since the last run of their lesson are embedded
+        and upserted; vectors of a lesson's chunks that no longer exist are deleted.
+        
         Args:
             chunks: List of text chunks with metadata
             batch_size: Number of vectors per batch
+            refresh: Re-embed and re-upsert every chunk
         """
+        # Compare against what was uploaded for each lesson last time
+        hashes = {
+            chunk['id']: ingestion_cache.vector_hash(chunk['text'], chunk['metadata'], EMBEDDING_MODEL)
+            for chunk in chunks
+        }
+        lessons = {chunk['metadata']['lesson_id'] for chunk in chunks}
+        previous = {lesson_id: ingestion_cache.get_vectors("", lesson_id) for lesson_id in lessons}
+        stale = {
+            lesson_id: [vector_id for vector_id in recorded if vector_id not in hashes]
+            for lesson_id, recorded in previous.items()
+        }
+        if not refresh:
+            total = len(chunks)
+            chunks = [
+                chunk for chunk in chunks
+                if previous[chunk['metadata']['lesson_id']].get(chunk['id']) != hashes[chunk['id']]
+            ]
+            print(f"\n♻️  {total - len(chunks)} chunks unchanged since the last upload")
+        
         print(f"\n🚀 Uploading {len(chunks)} chunks to Pinecone...")
         
-        vectors = []
+        def flush(vectors: List[Dict]):
+            self.index.upsert(vectors=vectors)
+            for vector in vectors:
+                ingestion_cache.record_vectors(
+                    "", vector['metadata']['lesson_id'], {vector['id']: hashes[vector['id']]}
+                )
         
-        for i, chunk in enumerate(chunks, start=1):
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
             try:
-                # Generate embedding
-                embedding = self.generate_embedding(chunk['text'])
+                # Embeddings are reused by exact chunk text; the rest go in one request
+                embeddings = [
+                    None if refresh else ingestion_cache.get_embedding(EMBEDDING_MODEL, "retrieval_document", chunk['text'])
+                    for chunk in batch
+                ]
+                missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+                if missing:
+                    texts = [batch[i]['text'] for i in missing]
+                    for i, embedding in zip(missing, self.generate_embeddings(texts)):
+                        embeddings[i] = embedding
+                        if embedding is not None:
+                            ingestion_cache.put_embedding(EMBEDDING_MODEL, "retrieval_document", batch[i]['text'], embedding)
                 
-                # Prepare vector
-                vector = {
-                    'id': chunk['id'],
-                    'values': embedding,
-                    'metadata': {
-                        **chunk['metadata'],
-                        'text': chunk['text'][:1000]  # Store first 1000 chars
+                vectors = [
+                    {
+                        'id': chunk['id'],
+                        'values': embedding,
+                        'metadata': {
+                            **chunk['metadata'],
+                            'text': chunk['text'][:1000],  # Store first 1000 chars
+                            'embedding_model': EMBEDDING_MODEL_NAME
+                        }
                     }
-                }
-                
-                vectors.append(vector)
-                
-                # Upload in batches
-                if len(vectors) >= batch_size:
-                    self.index.upsert(vectors=vectors)
-                    print(f"  ├─ Uploaded batch: {i-batch_size+1}-{i} ✓")
-                    vectors = []
+                    for chunk, embedding in zip(batch, embeddings)
+                    if embedding is not None
+                ]
+                if vectors:
+                    flush(vectors)
+                print(f"  ├─ Uploaded batch: {start + 1}-{start + len(batch)} ({len(vectors)} vectors) ✓")
                 
             except Exception as e:
-                print(f"  ├─ Error on chunk {i}: {str(e)}")
+                print(f"  ├─ Error on batch {start + 1}-{start + len(batch)}: {str(e)}")
                 continue
         
-        # Upload remaining vectors
-        if vectors:
-            self.index.upsert(vectors=vectors)
-            print(f"  └─ Uploaded final batch: {len(vectors)} vectors ✓")
+        # Delete vectors of chunks that disappeared
+        for lesson_id, vector_ids in stale.items():
+            for start in range(0, len(vector_ids), 1000):
+                batch = vector_ids[start:start + 1000]
+                self.index.delete(ids=batch)
+                ingestion_cache.forget_vectors("", lesson_id, batch)
+            if vector_ids:
+                print(f"  🗑️  Deleted {len(vector_ids)} stale vectors of {lesson_id}")
         
         print(f"✓ Upload complete!")
 
@@ -364,7 +485,7 @@ def get_lesson_metadata(filename: str) -> Dict:
     }
 
 
-async def main():
+async def main(refresh: bool = False):
     """Main function to process PDFs and upload to Pinecone"""
     
     print("=" * 70)
@@ -372,7 +493,7 @@ async def main():
     print("=" * 70)
     
     # Initialize processors
-    pdf_processor = PDFProcessor()
+    pdf_processor = PDFProcessor(refresh=refresh)
     uploader = PineconeUploader()
     
     # PDF directory
@@ -415,7 +536,7 @@ async def main():
     
     # Upload all chunks to Pinecone
     if all_chunks:
-        uploader.upload_chunks(all_chunks)
+        uploader.upload_chunks(all_chunks, refresh=refresh)
         
         # Show final stats
         stats = uploader.index.describe_index_stats()
@@ -427,4 +548,7 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Upload NCERT PDFs to Pinecone")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the ingestion cache and redo everything")
+    args = parser.parse_args()
+    asyncio.run(main(refresh=args.refresh))
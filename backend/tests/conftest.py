@@ -0,0 +1,30 @@
+"""
+Shared test setup.
+
+Settings are read from the environment / .env at import time; the unit tests
+never reach MongoDB, Pinecone or Gemini, so placeholder values are enough when
+no .env is present. Caches that default to disk are pointed at nothing.
+"""
+
+import os
+
+_PLACEHOLDER_SETTINGS = [
+    "GEMINI_API_KEY", "PINECONE_API_KEY",
+    "PINECONE_MASTER_INDEX", "PINECONE_MASTER_HOST",
+    "PINECONE_MATH_INDEX", "PINECONE_MATH_HOST",
+    "PINECONE_PHYSICS_INDEX", "PINECONE_PHYSICS_HOST",
+    "PINECONE_CHEMISTRY_INDEX", "PINECONE_CHEMISTRY_HOST",
+    "PINECONE_BIOLOGY_INDEX", "PINECONE_BIOLOGY_HOST",
+    "PINECONE_SOCIAL_INDEX", "PINECONE_SOCIAL_HOST",
+    "PINECONE_ENGLISH_INDEX", "PINECONE_ENGLISH_HOST",
+    "PINECONE_HINDI_INDEX", "PINECONE_HINDI_HOST",
+    "PINECONE_WEB_INDEX", "PINECONE_WEB_HOST",
+    "PINECONE_INDEX", "PINECONE_HOST"
+]
+
+for name in _PLACEHOLDER_SETTINGS:
+    os.environ.setdefault(name, "test")
+# Unreachable, and fails fast, if a service tries to connect at import time
+os.environ.setdefault("MONGO_URI", "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=50")
+os.environ.setdefault("INGESTION_CACHE_PATH", "")
+os.environ.setdefault("EMBEDDING_CACHE_DISK_PATH", "")
@@ -0,0 +1,98 @@
+"""AnswerPreGrader: which answers are scored locally and which go to Gemini."""
+
+import pytest
+
+from app.services.answer_pregrader import AnswerPreGrader
+
+
+EXPECTED = "Photosynthesis converts light energy into chemical energy stored in glucose."
+
+
+@pytest.fixture
+def grader():
+    # No embedding model: only the lexical signals decide
+    return AnswerPreGrader(embedding_model=None)
+
+
+def grade(grader, answer, expected=EXPECTED, keywords=None):
+    return grader.grade_many([{"answer": answer, "expected_answer": expected, "keywords": keywords or []}])[0]
+
+
+def test_verbatim_answer_scores_full_marks(grader):
+    result = grade(grader, "photosynthesis converts light energy into chemical energy stored in glucose")
+    assert result["score"] == 10
+    assert result["is_correct"]
+    assert result["graded_by"] == "pregrader"
+
+
+@pytest.mark.parametrize("answer", ["", "I don't know", "idk", "???", "skip"])
+def test_non_answers_score_zero(grader, answer):
+    result = grade(grader, answer)
+    assert result["score"] == 0
+    assert result["signals"] == {"non_answer": True}
+
+
+def test_short_real_answer_is_not_a_non_answer(grader):
+    assert grade(grader, "No", expected="Yes") is None
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("The speed is 20 m/s", "The speed is 30 m/s"),
+    ("x = 5", "x = -5"),
+    ("a > b", "a < b"),
+    ("The area is 12.5 cm2", "The area is 125 cm2")
+])
+def test_different_numbers_or_operators_go_to_the_llm(grader, answer, expected):
+    assert grade(grader, answer, expected) is None
+    assert grader.get_stats()["symbol_mismatches"] == 1
+
+
+def test_swapped_terms_go_to_the_llm(grader):
+    assert grade(grader, "Oxygen is absorbed and carbon dioxide is released",
+                 "Carbon dioxide is absorbed and oxygen is released") is None
+
+
+def test_hyphenated_words_are_not_minus_signs(grader):
+    expected = "Plants absorb carbon-dioxide through stomata"
+    assert grade(grader, "plants absorb carbon-dioxide through stomata", expected)["score"] == 10
+
+
+def test_hindi_answer_is_tokenized_whole(grader):
+    expected = "प्रकाश संश्लेषण में पौधे सूर्य के प्रकाश से भोजन बनाते हैं"
+    assert grade(grader, expected, expected)["score"] == 10
+    # A different Hindi answer must not look identical once tokenized
+    assert grade(grader, "पौधे रात में सोते हैं", expected) is None
+
+
+def test_high_similarity_needs_keyword_coverage(grader, monkeypatch):
+    monkeypatch.setattr(grader, "_similarities", lambda pairs: [0.95] * len(pairs))
+    answer = "Plants use sunlight to make their own food and keep the energy in sugar."
+
+    result = grade(grader, answer, keywords=["light energy", "glucose"])
+    assert result is None  # similar, but misses the keywords
+
+    result = grade(grader, answer, keywords=["sunlight", "food"])
+    assert result["score"] == 9
+
+
+def test_off_topic_answer_scores_zero(grader, monkeypatch):
+    monkeypatch.setattr(grader, "_similarities", lambda pairs: [0.05] * len(pairs))
+    result = grade(grader, "The French revolution began in 1789.", keywords=["chlorophyll"])
+    assert result["score"] == 0
+    assert not result["is_correct"]
+
+
+def test_stats_count_local_and_llm_decisions(grader):
+    grader.grade_many([
+        {"answer": EXPECTED, "expected_answer": EXPECTED, "keywords": []},
+        {"answer": "", "expected_answer": EXPECTED, "keywords": []},
+        {"answer": "Something partly related to light", "expected_answer": EXPECTED, "keywords": []},
+        {"answer": "An answer", "expected_answer": "", "keywords": []}
+    ])
+    stats = grader.get_stats()
+    assert stats["answers"] == 4
+    assert stats["short_circuited"] == 2
+    assert stats["confident_correct"] == 1
+    assert stats["non_answers"] == 1
+    assert stats["confident_wrong"] == 0
+    assert stats["sent_to_llm"] == 2
@@ -0,0 +1,110 @@
+"""ContextBudgeter: deduplication, overlap trimming and token budgets."""
+
+from app.services.context_budgeter import ContextBudgeter, count_tokens
+
+
+PHOTOSYNTHESIS = (
+    "Photosynthesis is the process by which green plants use sunlight, water and "
+    "carbon dioxide to make glucose and release oxygen into the atmosphere."
+)
+RESPIRATION = (
+    "Respiration releases the energy stored in glucose. In aerobic respiration the "
+    "glucose is broken down with oxygen into carbon dioxide and water."
+)
+OSMOSIS = (
+    "Osmosis is the movement of water molecules through a selectively permeable "
+    "membrane from a region of higher water concentration to lower concentration."
+)
+
+
+def make_budgeter(**kwargs) -> ContextBudgeter:
+    return ContextBudgeter(budgets={"basic": 1000, "deepdive": 4000}, **kwargs)
+
+
+def chunk(text: str, score: float = 0.8, class_level: int = 10) -> dict:
+    return {"text": text, "score": score, "class": class_level}
+
+
+def test_keeps_distinct_chunks_in_original_order():
+    selected, report = make_budgeter().select(
+        [chunk(RESPIRATION, 0.7), chunk(PHOTOSYNTHESIS, 0.9)], [], [], student_class=10
+    )
+    assert [c["text"] for c in selected["textbook"]] == [RESPIRATION, PHOTOSYNTHESIS]
+    assert report["duplicates_dropped"] == 0
+
+
+def test_keeps_short_chunks_that_were_not_trimmed():
+    formula = "v = u + at"
+    selected, report = make_budgeter().select(
+        [chunk(PHOTOSYNTHESIS), chunk(formula)], [], [], student_class=10
+    )
+    assert formula in [c["text"] for c in selected["textbook"]]
+    assert report["duplicates_dropped"] == 0
+
+
+def test_drops_near_duplicates_across_sources():
+    selected, report = make_budgeter().select(
+        [chunk(PHOTOSYNTHESIS)], [], [{"text": PHOTOSYNTHESIS + " ", "score": 0.9}], student_class=10
+    )
+    assert len(selected["textbook"]) == 1
+    assert selected["web"] == []
+    assert report["duplicates_dropped"] == 1
+
+
+def test_trims_text_a_kept_chunk_already_covers():
+    # The next chunk starts with the tail of the previous one (chunker overlap)
+    tail = PHOTOSYNTHESIS[-80:]
+    follow_up = tail + " " + OSMOSIS
+    selected, report = make_budgeter().select(
+        [chunk(PHOTOSYNTHESIS, 0.9), chunk(follow_up, 0.8)], [], [], student_class=10
+    )
+    texts = [c["text"] for c in selected["textbook"]]
+    assert texts == [PHOTOSYNTHESIS, OSMOSIS]
+    assert report["overlap_chars_trimmed"] == len(follow_up) - len(OSMOSIS)
+
+
+def test_drops_chunk_trimmed_down_to_a_scrap():
+    scrap = PHOTOSYNTHESIS[-60:] + " Done."
+    selected, report = make_budgeter(similarity_threshold=1.1).select(
+        [chunk(PHOTOSYNTHESIS, 0.9), chunk(scrap, 0.8)], [], [], student_class=10
+    )
+    assert [c["text"] for c in selected["textbook"]] == [PHOTOSYNTHESIS]
+    assert report["duplicates_dropped"] == 1
+
+
+def test_respects_budget_and_priority():
+    budget = count_tokens(PHOTOSYNTHESIS) + 1
+    selected, report = make_budgeter().select(
+        [chunk(PHOTOSYNTHESIS, 0.9)], [], [{"text": OSMOSIS, "score": 0.99}],
+        student_class=10, budget=budget
+    )
+    # Textbook outranks web whatever the score
+    assert [c["text"] for c in selected["textbook"]] == [PHOTOSYNTHESIS]
+    assert selected["web"] == []
+    assert report["over_budget_dropped"] == 1
+    assert report["tokens_out"] <= budget
+
+
+def test_cuts_the_top_chunk_rather_than_sending_no_context():
+    selected, report = make_budgeter().select([chunk(PHOTOSYNTHESIS)], [], [], student_class=10, budget=5)
+    assert len(selected["textbook"]) == 1
+    assert selected["textbook"][0]["text"] == PHOTOSYNTHESIS[:20]
+
+
+def test_foundational_class_bonus_orders_equal_scores():
+    budget = count_tokens(PHOTOSYNTHESIS) + 1
+    selected, _report = make_budgeter(foundation_bonus=0.05).select(
+        [chunk(RESPIRATION, 0.8, class_level=10), chunk(PHOTOSYNTHESIS, 0.8, class_level=7)],
+        [], [], student_class=10, budget=budget
+    )
+    assert [c["text"] for c in selected["textbook"]] == [PHOTOSYNTHESIS]
+
+
+def test_select_records_stats_but_deduplicate_does_not():
+    budgeter = make_budgeter()
+    budgeter.select([chunk(PHOTOSYNTHESIS)], [], [], student_class=10)
+    assert budgeter.get_stats()["requests"] == 1
+
+    kept = budgeter.deduplicate([chunk(PHOTOSYNTHESIS), chunk(PHOTOSYNTHESIS), chunk(OSMOSIS)])
+    assert [c["text"] for c in kept] == [PHOTOSYNTHESIS, OSMOSIS]
+    assert budgeter.get_stats()["requests"] == 1
@@ -0,0 +1,181 @@
+"""IngestionCache keys / hashes / vector records, and incremental book uploads built on them."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.ingestion_cache import IngestionCache
+from app.services.pdf_processor import PineconeEmbeddingUploader
+from app.services.upsert_engine import PineconeUpsertEngine
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return IngestionCache(str(tmp_path / "ingestion.sqlite3"))
+
+
+# ==================== KEYS AND HASHES ====================
+
+def test_page_key_depends_on_extractor_params_and_fingerprint():
+    key = IngestionCache.page_key("v1", {"dpi": 200, "ocr": True}, "abc")
+    assert key == IngestionCache.page_key("v1", {"ocr": True, "dpi": 200}, "abc")
+    assert key != IngestionCache.page_key("v2", {"dpi": 200, "ocr": True}, "abc")
+    assert key != IngestionCache.page_key("v1", {"dpi": 300, "ocr": True}, "abc")
+    assert key != IngestionCache.page_key("v1", {"dpi": 200, "ocr": True}, "abd")
+
+
+def test_vector_hash_covers_text_metadata_and_model():
+    base = IngestionCache.vector_hash("text", {"page": 1, "book": "b"}, "model-a")
+    assert base == IngestionCache.vector_hash("text", {"book": "b", "page": 1}, "model-a")
+    assert base != IngestionCache.vector_hash("text!", {"page": 1, "book": "b"}, "model-a")
+    assert base != IngestionCache.vector_hash("text", {"page": 2, "book": "b"}, "model-a")
+    assert base != IngestionCache.vector_hash("text", {"page": 1, "book": "b"}, "model-b")
+
+
+# ==================== STORE ====================
+
+def test_disabled_without_a_path():
+    cache = IngestionCache(path="")
+    assert not cache.enabled
+    assert cache.get_page("key") is None
+    assert cache.get_vectors("ns", "book") == {}
+
+
+def test_pages_and_embeddings_round_trip(cache):
+    assert cache.get_page("p1") is None
+    cache.put_page("p1", {"text": "hello", "regions": [1, 2]})
+    assert cache.get_page("p1") == {"text": "hello", "regions": [1, 2]}
+
+    cache.put_embedding("m", "retrieval_document", "chunk", [0.5, 0.25])
+    assert cache.get_embedding("m", "retrieval_document", "chunk") == [0.5, 0.25]
+    assert cache.get_embedding("m", "retrieval_query", "chunk") is None
+    assert cache.stats["page_hits"] == 1 and cache.stats["embedding_misses"] == 1
+
+
+def test_vector_records_per_source(cache):
+    cache.record_vectors("ns", "book1", {"a": "h1", "b": "h2", "c": "h3"})
+    cache.record_vectors("ns", "book2", {"x": "h9"})
+    cache.record_vectors("ns", "book1", {"b": "h2-new"})
+    assert cache.get_vectors("ns", "book1") == {"a": "h1", "b": "h2-new", "c": "h3"}
+
+    cache.forget_vectors("ns", "book1", ["a"])
+    assert set(cache.get_vectors("ns", "book1")) == {"b", "c"}
+
+    cache.forget_vectors("ns", "book1")
+    assert cache.get_vectors("ns", "book1") == {}
+    assert cache.get_vectors("ns", "book2") == {"x": "h9"}
+
+    cache.forget_namespace("ns")
+    assert cache.get_vectors("ns", "book2") == {}
+
+
+# ==================== INCREMENTAL UPLOADS ====================
+
+class FakeIndex:
+    def __init__(self):
+        self.vectors = {}
+        self.deleted_ids = []
+        self.delete_filters = []
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace):
+        with self._lock:
+            for vector in vectors:
+                self.vectors[vector['id']] = vector
+
+    def delete(self, ids=None, filter=None, namespace=None):
+        with self._lock:
+            if filter is not None:
+                self.delete_filters.append(filter)
+                for vector_id in [i for i, v in self.vectors.items() if v['metadata']['book_id'] == filter['book_id']]:
+                    del self.vectors[vector_id]
+            for vector_id in ids or []:
+                self.deleted_ids.append(vector_id)
+                self.vectors.pop(vector_id, None)
+
+
+class FakeEmbedder:
+    spec = SimpleNamespace(name="fake-embedding", model_id="models/fake", document_task_type="retrieval_document")
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def make_uploader(cache, index) -> PineconeEmbeddingUploader:
+    # Everything __init__ sets up, minus the Pinecone / registry connections
+    uploader = PineconeEmbeddingUploader.__new__(PineconeEmbeddingUploader)
+    uploader.cache = cache
+    uploader.embedder = FakeEmbedder()
+    uploader.embedding_model = uploader.embedder.spec.model_id
+    uploader.embedding_task = uploader.embedder.spec.document_task_type
+    uploader.embed_batch_size = 2
+    uploader.embed_workers = 2
+    uploader.index = index
+    uploader.upsert_engine = PineconeUpsertEngine(index, base_delay=0, checkpoint=cache)
+    uploader._stats_lock = threading.Lock()
+    return uploader
+
+
+def chunks(pages):
+    """{page: [texts]} -> chunks with per-page IDs, as create_chunks builds them."""
+    return [
+        {
+            'id': f"book_b1_ch1_p{page}_c{index}",
+            'text': text,
+            'metadata': {'book_id': "b1", 'page_number': page, 'chunk_id': index}
+        }
+        for page, texts in pages.items()
+        for index, text in enumerate(texts, start=1)
+    ]
+
+
+def test_rerun_uploads_only_changed_chunks_and_deletes_stale(cache):
+    index = FakeIndex()
+    first = make_uploader(cache, index).upload_chunks(
+        chunks({1: ["one a", "one b"], 2: ["two a"]}), "ns", source_id="b1"
+    )
+    assert first['successful'] == 3 and first['deleted'] == 0
+
+    uploader = make_uploader(cache, index)
+    second = uploader.upload_chunks(chunks({1: ["one a", "one b edited"]}), "ns", source_id="b1")
+    assert second['unchanged'] == 1
+    assert second['successful'] == 1
+    assert uploader.embedder.texts == ["one b edited"]
+    assert index.deleted_ids == ["book_b1_ch1_p2_c1"]
+    assert set(cache.get_vectors("ns", "b1")) == {"book_b1_ch1_p1_c1", "book_b1_ch1_p1_c2"}
+
+
+def test_incomplete_run_keeps_vectors_of_failed_pages(cache):
+    index = FakeIndex()
+    make_uploader(cache, index).upload_chunks(chunks({1: ["one a"], 2: ["two a"]}), "ns", source_id="b1")
+
+    # Page 2 failed to extract this time, so it produced no chunks
+    stats = make_uploader(cache, index).upload_chunks(
+        chunks({1: ["one a"]}), "ns", source_id="b1", complete=False
+    )
+    assert stats['deleted'] == 0
+    assert "book_b1_ch1_p2_c1" in index.vectors
+    assert "book_b1_ch1_p2_c1" in cache.get_vectors("ns", "b1")
+
+
+def test_first_cached_upload_purges_untracked_vectors(cache):
+    index = FakeIndex()
+    # Uploaded before the cache existed, with the old book-wide chunk numbering
+    index.vectors["book_b1_ch1_chunk_7"] = {'id': "book_b1_ch1_chunk_7", 'metadata': {'book_id': "b1"}}
+    index.vectors["book_b2_ch1_chunk_1"] = {'id': "book_b2_ch1_chunk_1", 'metadata': {'book_id': "b2"}}
+
+    make_uploader(cache, index).upload_chunks(
+        chunks({1: ["one a"]}), "ns", source_id="b1", purge_filter={"book_id": "b1"}
+    )
+    assert set(index.vectors) == {"book_b2_ch1_chunk_1", "book_b1_ch1_p1_c1"}
+
+    # Once the cache knows the book, re-runs no longer purge by filter
+    make_uploader(cache, index).upload_chunks(
+        chunks({1: ["one a"]}), "ns", source_id="b1", purge_filter={"book_id": "b1"}
+    )
+    assert index.delete_filters == [{"book_id": "b1"}]
@@ -0,0 +1,57 @@
+"""AdvancedPDFProcessor._assess_text_layer: when a page's text layer can replace OCR."""
+
+import pytest
+
+from app.services.pdf_processor import AdvancedPDFProcessor
+
+
+CLEAN_PAGE = (
+    "When a force acts on an object, it can change the state of motion of the object. "
+    "The object may start moving, stop, or change its direction. In this chapter we "
+    "will study the laws of motion given by Newton and see how they explain many of "
+    "the everyday things that we observe around us in the world."
+)
+
+
+@pytest.fixture
+def assess():
+    # The assessment only looks at the text; skip the Gemini / cache setup of __init__
+    processor = AdvancedPDFProcessor.__new__(AdvancedPDFProcessor)
+    return processor._assess_text_layer
+
+
+def test_clean_text_layer_is_usable(assess):
+    quality = assess(CLEAN_PAGE)
+    assert quality["usable"]
+    assert quality["garbage_ratio"] == 0
+    assert quality["word_ratio"] >= 0.9
+
+
+def test_scanned_page_with_little_text_is_not_usable(assess):
+    quality = assess("Chapter 9\n\n")
+    assert not quality["usable"]
+    assert quality["char_count"] == len("Chapter 9")
+
+
+def test_cid_escapes_count_as_garbage(assess):
+    quality = assess(CLEAN_PAGE + " " + "(cid:71)(cid:82)(cid:85)" * 5)
+    assert quality["garbage_ratio"] > 0.02
+    assert not quality["usable"]
+
+
+def test_letter_soup_from_a_broken_font_map_is_not_usable(assess):
+    soup = " ".join(["Wkh", "iwrqf", "vwdwh", "pqwlrq", "rewmhfw", "fkdqjh", "gluhfwlrq"] * 12)
+    quality = assess(soup)
+    assert quality["word_ratio"] < 0.75 or quality["common_word_ratio"] < 0.08
+    assert not quality["usable"]
+
+
+def test_empty_text(assess):
+    quality = assess("")
+    assert quality == {
+        "char_count": 0,
+        "garbage_ratio": 0.0,
+        "word_ratio": 0.0,
+        "common_word_ratio": 0.0,
+        "usable": False
+    }
@@ -0,0 +1,151 @@
+"""PineconeUpsertEngine / UpsertSession: batching, retries, splitting, checkpoints."""
+
+import threading
+
+import pytest
+
+from app.services.ingestion_cache import IngestionCache
+from app.services.upsert_engine import PineconeUpsertEngine, checkpoint_hash, estimate_vector_bytes
+
+
+class PineconeError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeIndex:
+    """Records upsert calls; `fail` may raise for a batch."""
+
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.calls = []
+        self.stored = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors, namespace):
+        with self._lock:
+            self.calls.append([vector['id'] for vector in vectors])
+        if self.fail:
+            self.fail(vectors)
+        with self._lock:
+            for vector in vectors:
+                self.stored[vector['id']] = vector
+
+
+def vectors(count: int, text: str = "x"):
+    return [{'id': f"v{i}", 'values': [0.1, 0.2], 'metadata': {'text': text}} for i in range(count)]
+
+
+def make_engine(index, **kwargs) -> PineconeUpsertEngine:
+    kwargs.setdefault("concurrency", 2)
+    kwargs.setdefault("base_delay", 0)
+    return PineconeUpsertEngine(index, **kwargs)
+
+
+def test_batches_by_vector_count():
+    index = FakeIndex()
+    stats = make_engine(index, max_batch_vectors=4).upsert(vectors(10), "ns")
+    assert stats['upserted'] == 10
+    assert stats['batches'] == 3
+    assert sorted(len(call) for call in index.calls) == [2, 4, 4]
+
+
+def test_batches_by_request_size():
+    batch = vectors(6, text="y" * 500)
+    limit = estimate_vector_bytes(batch[0]) * 2
+    index = FakeIndex()
+    stats = make_engine(index, max_batch_vectors=100, max_batch_bytes=limit).upsert(batch, "ns")
+    assert stats['upserted'] == 6
+    assert all(len(call) <= 2 for call in index.calls)
+
+
+def test_accepts_tuples():
+    index = FakeIndex()
+    stats = make_engine(index).upsert([("a", [0.5, 0.5], {"k": 1}), ("b", [0.1, 0.9])], "ns")
+    assert stats['upserted'] == 2
+    assert index.stored["a"]["metadata"] == {"k": 1}
+    assert "metadata" not in index.stored["b"]
+
+
+def test_retries_throttling():
+    attempts = []
+
+    def throttle_once(batch):
+        attempts.append(len(batch))
+        if len(attempts) == 1:
+            raise PineconeError(429, "Too Many Requests")
+
+    stats = make_engine(FakeIndex(fail=throttle_once), concurrency=1).upsert(vectors(3), "ns")
+    assert stats['upserted'] == 3
+    assert stats['retries'] == 1
+
+
+def test_halves_batches_that_are_too_large():
+    def reject_big(batch):
+        if len(batch) > 2:
+            raise PineconeError(413, "Request payload size exceeds the limit")
+
+    index = FakeIndex(fail=reject_big)
+    stats = make_engine(index, max_batch_vectors=8, concurrency=1).upsert(vectors(8), "ns")
+    assert stats['upserted'] == 8
+    assert stats['splits'] == 3
+
+
+def test_bisects_to_the_vector_a_400_names():
+    def reject_v3(batch):
+        if any(vector['id'] == "v3" for vector in batch):
+            raise PineconeError(400, "Metadata size exceeds the limit for vector v3")
+
+    index = FakeIndex(fail=reject_v3)
+    stats = make_engine(index, max_batch_vectors=8, concurrency=1).upsert(vectors(8), "ns")
+    assert stats['upserted'] == 7
+    assert stats['failed_ids'] == ["v3"]
+
+
+@pytest.mark.parametrize("status, message", [
+    (401, "Unauthorized: invalid API key"),
+    (404, "Namespace not found"),
+    (400, "Vector dimension 2 does not match the dimension of the index 768")
+])
+def test_whole_request_errors_fail_fast(status, message):
+    def reject(batch):
+        raise PineconeError(status, message)
+
+    index = FakeIndex(fail=reject)
+    stats = make_engine(index, max_batch_vectors=8, concurrency=1).upsert(vectors(8), "ns")
+    assert len(index.calls) == 1
+    assert stats['failed'] == 8
+    assert stats['splits'] == 0
+
+
+def test_checkpoint_skips_vectors_already_upserted(tmp_path):
+    cache = IngestionCache(str(tmp_path / "ingestion.sqlite3"))
+    first = make_engine(FakeIndex(), checkpoint=cache).upsert(vectors(5), "ns", checkpoint_key="book1")
+    assert first['upserted'] == 5
+
+    changed = vectors(5)
+    changed[2]['metadata'] = {'text': "edited"}
+    index = FakeIndex()
+    second = make_engine(index, checkpoint=cache).upsert(changed, "ns", checkpoint_key="book1")
+    assert second['skipped'] == 4
+    assert [vector_id for call in index.calls for vector_id in call] == ["v2"]
+
+    resent = make_engine(FakeIndex(), checkpoint=cache).upsert(changed, "ns", checkpoint_key="book1", resume=False)
+    assert resent['upserted'] == 5
+
+
+def test_checkpoint_hash_ignores_embedding_values():
+    a = {'id': "v", 'values': [0.1, 0.2], 'metadata': {'text': "t"}}
+    b = {'id': "v", 'values': [0.1000001, 0.2], 'metadata': {'text': "t"}}
+    c = {'id': "v", 'values': [0.1, 0.2], 'metadata': {'text': "u"}}
+    assert checkpoint_hash(a) == checkpoint_hash(b)
+    assert checkpoint_hash(a) != checkpoint_hash(c)
+
+
+def test_progress_callback_reaches_total():
+    progress = []
+    make_engine(FakeIndex(), max_batch_vectors=2).upsert(
+        vectors(5), "ns", progress_callback=lambda done, total, _message: progress.append((done, total))
+    )
+    assert progress[-1] == (5, 5)